@@ -0,0 +1,67 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+
+class AnnotationLog:
+    """
+    append-only log of the evaluation annotations. Each user selection is written as a single json line, so the cost
+    of recording a selection does not depend on the size of the evaluation set. The results csv is materialized from
+    the annotations only on submit or on demand.
+    """
+
+    def __init__(self, path, reset=True):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if reset or not os.path.exists(path):
+            open(path, "w").close()
+
+    def append(self, text_index, dimension, rank, side, prompt_type):
+        event = {"text_index": text_index, "dimension": dimension, "rank": rank, "side": side,
+                 "prompt_type": prompt_type, "timestamp": time.time()}
+        line = json.dumps(event) + "\n"
+        with self.lock:
+            with open(self.path, "a") as f:
+                f.write(line)
+        return event
+
+    def read_events(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "r") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def latest_annotations(self):
+        """
+        replay the log, returning {text_index: {(dimension, rank): (side, prompt_type)}} with the last selection of
+        every annotation
+        """
+        annotations = {}
+        for event in self.read_events():
+            annotations.setdefault(event["text_index"], {})[(event["dimension"], event["rank"])] = \
+                (event["side"], event["prompt_type"])
+        return annotations
+
+    def results_frame(self, generated_data, dimensions, ranks):
+        """
+        the evaluation results: a row per generated text, ordered by text index, with the prompt type and the side
+        of the last selection of every (dimension, rank)
+        """
+        rows = sorted(generated_data, key=lambda x: x["index"])
+        df = pd.DataFrame(rows).drop(["sides", "prompts"], axis=1, errors="ignore")
+        annotations = self.latest_annotations()
+        for dim in dimensions:
+            for rank in ranks:
+                selections = [annotations.get(row["index"], {}).get((dim, rank)) for row in rows]
+                df[f"ranked_prompt_{(dim, rank)}"] = [s[1] if s else None for s in selections]
+                df[f"sides_{(dim, rank)}"] = [s[0] if s else None for s in selections]
+        return df
@@ -0,0 +1,213 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import argparse
+import csv
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from conversational_prompt_engineering.backend.llm_metrics import CallType, get_llm_metrics, observe_batch
+from conversational_prompt_engineering.backend.prompt_building_util import TargetModelHandler
+from conversational_prompt_engineering.backend.text_budget import estimate_num_tokens, fit_text_to_model
+
+BATCH_SIZE = 16
+MAX_WORKERS = 8
+PROGRESS_LOG_INTERVAL_SECONDS = 30
+PROMPT_TYPES = ["zero_shot", "few_shot"]
+
+
+def load_session(session_dir):
+    """
+    the final instruction, the accepted few-shot examples, the target model and the expected test text tokens (with
+    which the few-shot examples of the session prompt were selected) of a finished session
+    """
+    with open(os.path.join(session_dir, "chat_result.json"), "r") as f:
+        chat_result = json.load(f)
+    shots = [{'text': t, 'output': o} for t, o in zip(chat_result["examples"], chat_result["accepted_outputs"])
+             if o is not None]
+    return {"prompt": chat_result["prompts"][-1], "shots": shots, "target_model": chat_result["target_model"],
+            "expected_text_tokens": chat_result.get("expected_text_tokens")}  # missing in older sessions
+
+
+def iter_input_rows(input_path, text_column="text", id_column=None):
+    """
+    yield (row_num, row_id, text) for every row of a CSV or JSONL file, reading one row at a time
+    """
+    if input_path.endswith(".jsonl"):
+        with open(input_path, "r", encoding="utf-8") as f:
+            for row_num, line in enumerate(line for line in f if line.strip()):
+                record = json.loads(line)
+                yield row_num, record.get(id_column) if id_column else None, record[text_column]
+    else:
+        csv.field_size_limit(sys.maxsize)
+        with open(input_path, "r", encoding="utf-8", errors="replace", newline="") as f:
+            for row_num, record in enumerate(csv.DictReader(f)):
+                yield row_num, record.get(id_column) if id_column else None, record[text_column]
+
+
+def read_completed_rows(output_path, retry_errors=True):
+    """
+    the row numbers that are already in the output file. Rows that failed are not completed if retry_errors is set.
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if not (retry_errors and record.get("error")):
+                completed.add(record["row"])
+    return completed
+
+
+def truncate_partial_line(output_path):
+    """
+    drop a last line that was not fully written, so that appended records start on a new line
+    """
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:  # scan backwards for the last newline, without reading the whole file
+            block_start = max(0, position - 64 * 1024)
+            f.seek(block_start)
+            newline = f.read(position - block_start).rfind(b"\n")
+            if newline >= 0:
+                position = block_start + newline + 1
+                break
+            position = block_start
+        if position < end:
+            f.truncate(position)
+
+
+class BatchInferenceRunner:
+
+    def __init__(self, llm_client, template, batch_size=BATCH_SIZE, max_workers=MAX_WORKERS, timeline=None):
+        self.llm_client = llm_client
+        self.template = template
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.timeline = timeline
+
+    def _generate(self, batch):
+        model_params = self.llm_client.parameters
+        prompt_strs = self.template.render_many([fit_text_to_model(text, model_params) for _, _, text in batch])
+        start_time = time.time()
+        try:
+            outputs, error = observe_batch(CallType.TARGET_OUTPUT, self.llm_client, prompt_strs,
+                                           lambda: self.llm_client.send_messages_batch(prompt_strs)[0],
+                                           self.timeline), None
+        except Exception as e:
+            outputs, error = [None] * len(batch), str(e) or type(e).__name__
+        stats = {"latency": time.time() - start_time,
+                 "prompt_tokens": sum(estimate_num_tokens(p, model_params) for p in prompt_strs),
+                 "output_tokens": sum(estimate_num_tokens(o, model_params) for o in outputs if o is not None)}
+        return batch, outputs, error, stats
+
+    def run(self, rows, output_path, retry_errors=True):
+        """
+        generate the outputs of the rows that are not in output_path yet, and append them to it as JSON lines as
+        soon as each batch is done. At most 2 * max_workers batches are read ahead of the model. Rows that are
+        retried after an error are appended again, so the last record of a row is the one that counts.
+        """
+        truncate_partial_line(output_path)
+        completed = read_completed_rows(output_path, retry_errors)
+        pending_rows = (row for row in rows if row[0] not in completed)
+        batches = iter(lambda: list(itertools.islice(pending_rows, self.batch_size)), [])
+        report = {"num_rows": 0, "num_errors": 0, "num_skipped": len(completed), "num_batches": 0,
+                  "prompt_tokens": 0, "output_tokens": 0, "total_latency": 0.0}
+        start_time = last_log_time = time.time()
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        with open(output_path, "a", encoding="utf-8") as out, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            in_flight = set()
+            for batch in batches:
+                in_flight.add(executor.submit(self._generate, batch))
+                if len(in_flight) >= 2 * self.max_workers:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    self._write_done(out, report, done)
+                    if time.time() - last_log_time > PROGRESS_LOG_INTERVAL_SECONDS:
+                        last_log_time = time.time()
+                        logging.info(f"batch inference progress: {self._summarize(report, start_time)}")
+            self._write_done(out, report, wait(in_flight).done)
+        return self._summarize(report, start_time)
+
+    def _write_done(self, out, report, futures):
+        for f in futures:
+            self._write(out, report, *f.result())
+        out.flush()
+
+    def _write(self, out, report, batch, outputs, error, stats):
+        for (row_num, row_id, _), output in zip(batch, outputs):
+            record = {"row": row_num, "output": output}
+            if row_id is not None:
+                record["id"] = row_id
+            if error is not None:
+                record["error"] = error
+            out.write(json.dumps(record) + "\n")
+        report["num_rows"] += len(batch)
+        report["num_batches"] += 1
+        report["num_errors"] += len(batch) if error is not None else 0
+        report["total_latency"] += stats["latency"]
+        report["prompt_tokens"] += stats["prompt_tokens"]
+        report["output_tokens"] += stats["output_tokens"]
+
+    def _summarize(self, report, start_time):
+        elapsed = time.time() - start_time
+        num_batches = report["num_batches"]
+        return {**report,
+                "elapsed_seconds": elapsed,
+                "rows_per_second": report["num_rows"] / elapsed if elapsed > 0 else 0.0,
+                "error_rate": report["num_errors"] / report["num_rows"] if report["num_rows"] else 0.0,
+                "mean_batch_latency": report["total_latency"] / num_batches if num_batches else 0.0}
+
+
+def build_session_template(session, prompt_type, model_params):
+    shots = session["shots"] if prompt_type == "few_shot" else []
+    handler = TargetModelHandler()
+    # the same examples as in the few-shot prompt of the session
+    shots = handler.select_shots(model_params['model_id'], session["prompt"], shots, model_params,
+                                 session["expected_text_tokens"])
+    return handler.build_template(model_params['model_id'], session["prompt"], shots)
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--session_dir', help='output dir of a finished session (contains chat_result.json)')
+parser.add_argument('--input_path', help='CSV or JSONL file with the texts')
+parser.add_argument('--output_path', help='JSONL file for the outputs. Existing outputs are kept, and only the '
+                                          'missing rows are generated')
+parser.add_argument('--prompt_type', default='few_shot', choices=PROMPT_TYPES)
+parser.add_argument('--text_column', default='text')
+parser.add_argument('--id_column', help='column that is copied to the outputs')
+parser.add_argument('--model', help='short name of the model in model_params.json (default: the session target model)')
+parser.add_argument('--llm_client', default='WatsonXClient', help='name of the llm client class')
+parser.add_argument('--batch_size', type=int, default=BATCH_SIZE)
+parser.add_argument('--max_workers', type=int, default=MAX_WORKERS)
+parser.add_argument('--no_retry_errors', action='store_true', help='do not regenerate rows that failed before')
+
+
+if __name__ == "__main__":
+    from conversational_prompt_engineering.backend.chat_manager_util import create_model_client
+    from conversational_prompt_engineering.backend.util.llm_clients.llm_clients_loader import get_client_classes
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    args = parser.parse_args()
+    session = load_session(args.session_dir)
+    model = args.model or TargetModelHandler().data[session["target_model"]]['short_name']
+    client = create_model_client(model, get_client_classes([args.llm_client])[0])
+    runner = BatchInferenceRunner(client, build_session_template(session, args.prompt_type, client.parameters),
+                                  batch_size=args.batch_size, max_workers=args.max_workers)
+    report = runner.run(iter_input_rows(args.input_path, args.text_column, args.id_column), args.output_path,
+                        retry_errors=not args.no_retry_errors)
+    with open(os.path.splitext(args.output_path)[0] + "_report.json", "w") as f:
+        json.dump(report, f)
+    get_llm_metrics().export(os.path.join(os.path.dirname(os.path.abspath(args.output_path)), "metrics.prom"))
+    logging.info(f"batch inference done: {report}")
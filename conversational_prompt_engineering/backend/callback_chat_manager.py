@@ -3,20 +3,42 @@
 # LICENSE: Apache License 2.0 (Apache-2.0)
 # http://www.apache.org/licenses/LICENSE-2.0
 
+import gzip
 import json
 import logging
 import os.path
+import pickle
+import sys
+import threading
 from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-from genai.schema import ChatRole
 
-from conversational_prompt_engineering.backend.chat_manager_util import ChatManagerBase
+from conversational_prompt_engineering.backend.chat_manager_util import ChatManagerBase, create_model_client
+from conversational_prompt_engineering.backend.chat_messages import ChatMessage, json_default
+from conversational_prompt_engineering.backend.conversation_prefix import build_instruction_messages, \
+    get_api_names, get_conversation_prefix
+from conversational_prompt_engineering.backend.llm_metrics import CallType, SessionTimeline
+from conversational_prompt_engineering.backend.profiling import ProfilingMode, SpanCategory
+from conversational_prompt_engineering.backend.util.llm_clients.abst_llm_client import ChatRole
 from conversational_prompt_engineering.backend.prompt_building_util import TargetModelHandler
+from conversational_prompt_engineering.backend.text_budget import estimate_num_tokens, fit_text_to_model
+from conversational_prompt_engineering.data.dataset_access import read_dataset
 from conversational_prompt_engineering.data.main_dataset_name_to_dir import dataset_name_to_dir
 
 
 ITERATIONS_NUM = 3 #max number of iterations of the outputs approval
 NUM_OF_EXAMPLES_TO_DISCUSS = 3 #num of examples from the input file to discuss and approve their outputs
+MAX_EXAMPLES_TO_SELECT_FROM = 20000 #larger input files are sampled before selecting the examples to discuss
+SNAPSHOT_FILE_NAME = "session_snapshot.pkl.gz"
+# the state that an idle manager writes to its snapshot and releases (see offload)
+OFFLOADED_STATE = ("model_chat", "user_chat", "examples", "outputs", "prompts", "baseline_prompts",
+                   "output_discussion_state", "calls_queue", "compression_table", "model_sweep_table")
+OFFLOADED_ATTRIBUTES = OFFLOADED_STATE + ("llm_client", "target_llm_client", "timeline")
+# the state that a session store keeps, so that any worker process can load the manager (see to_state)
+PERSISTED_STATE = OFFLOADED_STATE + ("api_names", "model_chat_length", "example_num", "user_chat_length",
+                                     "dataset_name", "enable_upload_file", "example_indices", "prompt_conv_end",
+                                     "zero_shot_prompt", "few_shot_prompt", "prompt_token_costs",
+                                     "compressed_prompt", "cot_count")
 
 class ModelPrompts:
     def __init__(self) -> None:
@@ -132,15 +154,16 @@ class ModelPrompts:
 
 class CallbackChatManager(ChatManagerBase):
     def __init__(self, model, target_model, llm_client,  output_dir,
-                 config_name) -> None:
+                 config_name, profiling_mode=ProfilingMode.SPANS) -> None:
         super().__init__(model=model, target_model=target_model, llm_client=llm_client,
-                          output_dir=output_dir, config_name=config_name)
+                          output_dir=output_dir, config_name=config_name, profiling_mode=profiling_mode)
         self.model_prompts = ModelPrompts()
         self.model = model
 
         self.api_names = None
 
         self.model_chat = []
+        self.chat_prefix = None
         self.model_chat_length = 0
         self.example_num = None
         self.user_chat = []
@@ -150,17 +173,140 @@ class CallbackChatManager(ChatManagerBase):
         self.enable_upload_file = True
 
         self.examples = None
+        self.example_indices = None
         self.outputs = None
         self.prompts = []
         self.baseline_prompts = {}
         self.prompt_conv_end = False
         self.zero_shot_prompt = None
         self.few_shot_prompt = None
+        self.prompt_token_costs = None
+        self.compressed_prompt = None
+        self.compression_table = None
+        self.model_sweep_table = None
 
         self.output_discussion_state = None
         self.calls_queue = []
         self.cot_count = 1
 
+        self._offload_lock = threading.RLock()
+        self._snapshot_path = None
+        self.store_version = 0  # the version of the session in the session store that this state is based on
+        self._stored_digest = None
+
+    def __getattr__(self, name):
+        # only called for attributes that are not set: the state of an offloaded manager is loaded on first access
+        if name in OFFLOADED_ATTRIBUTES and self.__dict__.get('_snapshot_path') is not None:
+            self.rehydrate()
+            return getattr(self, name)
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def __setattr__(self, name, value):
+        # the state of an offloaded manager is loaded before it is changed, so that the change is not overwritten
+        if name in OFFLOADED_ATTRIBUTES and self.__dict__.get('_snapshot_path') is not None:
+            self.rehydrate()
+        super().__setattr__(name, value)
+
+    @property
+    def is_offloaded(self):
+        return self._snapshot_path is not None
+
+    def _num_shared_messages(self):
+        if self.chat_prefix is None:
+            return 0
+        shared = self.chat_prefix.messages
+        same = len(self.model_chat) >= len(shared) and all(a is b for a, b in zip(self.model_chat, shared))
+        return len(shared) if same else 0
+
+    def estimate_memory_bytes(self):
+        """
+        the approximate memory of the state that offload releases, without the messages shared with other sessions
+        """
+        if self.is_offloaded:
+            return 0
+        messages = self.model_chat[self._num_shared_messages():] + self.user_chat
+        texts = [m['content'] for m in messages] + list(self.examples or []) + [o for o in self.outputs or [] if o]
+        return sum(sys.getsizeof(m) for m in messages) + sum(sys.getsizeof(t) for t in texts)
+
+    def _snapshot(self, names):
+        # the model chat is kept without the messages of the shared prefix, which are rebuilt on restore
+        num_shared = self._num_shared_messages()
+        state = {name: getattr(self, name) for name in names}
+        state["model_chat"] = self.model_chat[num_shared:]
+        state["num_shared_messages"] = num_shared
+        state["timeline_events"] = self.timeline.events
+        state["words_counts"] = [(c.sent_words_count, c.received_words_count)
+                                 for c in [self.llm_client, self.target_llm_client]]
+        return state
+
+    def _restore(self, state):
+        state = dict(state)
+        timeline = SessionTimeline()
+        timeline.events = state.pop("timeline_events")
+        clients = [self.__dict__.get("llm_client") or create_model_client(self.model, self.llm_client_class),
+                   self.__dict__.get("target_llm_client") or create_model_client(self.target_model,
+                                                                                 self.llm_client_class)]
+        for client, (sent, received) in zip(clients, state.pop("words_counts")):
+            client.sent_words_count, client.received_words_count = sent, received
+        num_shared = state.pop("num_shared_messages")
+        if num_shared and self.chat_prefix is None:  # restored in another process
+            self.chat_prefix = get_conversation_prefix(clients[0].parameters, self.model_prompts,
+                                                       state.get("dataset_name", self.dataset_name),
+                                                       state["examples"])
+        shared = list(self.chat_prefix.messages[:num_shared]) if num_shared else []
+        state["model_chat"] = shared + state["model_chat"]
+        # set directly, since setting an offloaded attribute rehydrates (see __setattr__)
+        self.__dict__.update(state, llm_client=clients[0], target_llm_client=clients[1], timeline=timeline)
+
+    def offload(self):
+        """
+        writes the state of the chat to a compact snapshot in the output dir, and releases it and the LLM clients.
+        The next access to the state loads it back (see rehydrate).
+        """
+        with self._offload_lock:
+            if self.is_offloaded:
+                return
+            state = self._snapshot(OFFLOADED_STATE)
+            path = os.path.join(self.out_dir, SNAPSHOT_FILE_NAME)
+            os.makedirs(self.out_dir, exist_ok=True)
+            with gzip.open(path, "wb", compresslevel=1) as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            # set first, so that a thread that reads the state meanwhile waits for the offload and rehydrates
+            self._snapshot_path = path
+            for name in OFFLOADED_ATTRIBUTES:
+                delattr(self, name)
+            logging.info(f"offloaded the idle session to {path}")
+
+    def rehydrate(self):
+        with self._offload_lock:
+            if not self.is_offloaded:
+                return
+            with gzip.open(self._snapshot_path, "rb") as f:
+                state = pickle.load(f)
+            self._restore(state)
+            os.remove(self._snapshot_path)
+            self._snapshot_path = None
+            logging.info("rehydrated the session from its snapshot")
+
+    def to_state(self):
+        """
+        the state of the session, from which from_state creates an equivalent manager in any process
+        """
+        with self._offload_lock:
+            state = self._snapshot(PERSISTED_STATE)
+            state.update(model=self.model, target_model=self.target_model, llm_client_class=self.llm_client_class,
+                         out_dir=self.out_dir, config_name=self.config_name, profiling_mode=self.profiler.mode)
+            return state
+
+    @classmethod
+    def from_state(cls, state):
+        state = dict(state)
+        manager = cls(model=state.pop("model"), target_model=state.pop("target_model"),
+                      llm_client=state.pop("llm_client_class"), output_dir=state.pop("out_dir"),
+                      config_name=state.pop("config_name"), profiling_mode=state.pop("profiling_mode"))
+        manager._restore(state)
+        return manager
+
     @property
     def approved_prompts(self):
         return [{'prompt': p} for p in self.prompts]
@@ -173,6 +319,15 @@ class CallbackChatManager(ChatManagerBase):
     def validated_example_idx(self):
         return len([s for s in self.outputs if s is not None])
 
+    @property
+    def expected_text_tokens(self):
+        """
+        the test texts of the target model are expected to be as long as the longest example that was discussed
+        """
+        params = self.target_llm_client.parameters
+        return max([estimate_num_tokens(fit_text_to_model(ex, params), params) for ex in self.examples or []],
+                   default=0)
+
     @property
     def prompt_iteration(self):
         return len(self.prompts) or None
@@ -197,7 +352,13 @@ class CallbackChatManager(ChatManagerBase):
         return [msg for msg in self.model_chat if _include_msg(msg)]
 
     def _add_msg(self, chat, role, msg, **tag_kwargs):
-        chat.append({'role': role, 'content': msg, **tag_kwargs})
+        chat.append(ChatMessage(role, msg, **tag_kwargs))
+
+    def _format_chat(self, chat):
+        if self.chat_prefix is None:
+            return super()._format_chat(chat)
+        # the chat is either the filtered model chat, or a side chat that begins with the whole model chat
+        return self.chat_prefix.format_chat(chat, example_nums=(self.example_num, None))
 
     def add_system_message(self, msg, **tag_kwargs):
         self._add_msg(self.model_chat, ChatRole.SYSTEM, msg, **tag_kwargs)
@@ -218,6 +379,10 @@ class CallbackChatManager(ChatManagerBase):
                 self._save_chat_state()
 
     def _save_chat_state(self):
+        with self.profiler.span("save_chat_state", SpanCategory.DISK):
+            self._write_chat_state()
+
+    def _write_chat_state(self):
         self.save_config()
 
         self.save_chat_html(self.user_chat, "user_chat.html")
@@ -226,22 +391,29 @@ class CallbackChatManager(ChatManagerBase):
             self.save_chat_html(self._filtered_model_chat, f'model_chat_example_{self.example_num}.html')
         chat_dir = os.path.join(self.out_dir, "chat")
         model_id = self.target_llm_client.parameters['model_id']
-        curr_stats = {x : getattr(self, x) for x in ["example_num", "model_chat_length", "user_chat_length", "cot_count", "baseline_prompts"]}
+        curr_stats = {x : getattr(self, x) for x in ["example_num", "model_chat_length", "user_chat_length", "cot_count", "baseline_prompts", "example_indices"]}
         if self.prompts:
             prompts = [{"prompt": x["prompt"]} for x in self.approved_prompts] #add "prompt" : prompt (the instruction)
             for p in prompts:
                 p['prompt_with_format'] = TargetModelHandler().format_prompt(model=model_id,
                                                                 prompt=p['prompt'], texts_and_outputs=[])
                 p['prompt_with_format_and_few_shots'] = TargetModelHandler().format_prompt(model=model_id, prompt=p['prompt'],
-                                                                texts_and_outputs=self.approved_outputs)
+                                                                texts_and_outputs=self.approved_outputs,
+                                                                model_params=self.target_llm_client.parameters,
+                                                                expected_text_tokens=self.expected_text_tokens)
             curr_stats["prompts"] = prompts
             curr_stats.update({"outputs": self.outputs, "output_discussion_state": self.output_discussion_state})
 
         with open(os.path.join(chat_dir, "chat_state.json"), "w") as f:
-            json.dump(curr_stats, f)
+            json.dump(curr_stats, f, default=json_default)
+        self.save_metrics()
 
 
     def _parse_model_response(self, resp, max_attempts=2):
+        with self.profiler.span("parse_model_response", SpanCategory.CPU):
+            return self._parse_model_response_with_repair(resp, max_attempts)
+
+    def _parse_model_response_with_repair(self, resp, max_attempts):
         err = ''
         for num_attempt in range(max_attempts):
             if resp.startswith('```python\n'):
@@ -273,7 +445,7 @@ class CallbackChatManager(ChatManagerBase):
             tmp_chat = self._filtered_model_chat
             self._add_msg(tmp_chat, ChatRole.ASSISTANT, resp)
             self._add_msg(tmp_chat, ChatRole.SYSTEM, self.model_prompts.api_only_instruction)
-            resp = self._get_assistant_response(tmp_chat)
+            resp = self._get_assistant_response(tmp_chat, call_type=CallType.PARSE_REPAIR)
 
         raise ValueError('Invalid model response' + err)
 
@@ -288,7 +460,7 @@ class CallbackChatManager(ChatManagerBase):
                 tmp_chat = self._filtered_model_chat
                 self._add_msg(tmp_chat, ChatRole.SYSTEM,
                               self.model_prompts.syntax_err_instruction.replace('ERROR', str(e)))
-                resp = self._get_assistant_response(tmp_chat)
+                resp = self._get_assistant_response(tmp_chat, call_type=CallType.SYNTAX_REPAIR)
                 call = self._parse_model_response(resp)[0]
 
         raise ValueError('Invalid call syntax' + err)
@@ -304,6 +476,10 @@ class CallbackChatManager(ChatManagerBase):
         self.user_chat_length = len(self.user_chat)  # user message is rendered by cpe
 
     def generate_agent_messages(self):
+        with self.profiler.turn("generate_agent_messages"):
+            return self._generate_agent_messages()
+
+    def _generate_agent_messages(self):
         self.submit_model_chat_and_process_response()
         agent_messages = []
         if len(self.user_chat) > self.user_chat_length:
@@ -331,7 +507,7 @@ class CallbackChatManager(ChatManagerBase):
             # open side chat with model
             tmp_chat = self.model_chat[:]
             self._add_msg(tmp_chat, ChatRole.SYSTEM, self.model_prompts.generate_baseline_instruction_task)
-            resp = self._get_assistant_response(tmp_chat)
+            resp = self._get_assistant_response(tmp_chat, call_type=CallType.COT_SIDE_CHAT)
             submit_prmpt_call = self._parse_model_response(resp)[0]
             self.baseline_prompts["model_baseline_prompt"] = submit_prmpt_call[:-2].replace("self.submit_prompt(\"", "")
             logging.info(f"baseline prompt is {self.baseline_prompts['model_baseline_prompt']}")
@@ -362,12 +538,12 @@ class CallbackChatManager(ChatManagerBase):
 
         side_model = self.llm_client if 'granite' in self.target_llm_client.parameters['model_id'] \
             else self.target_llm_client
+        prompt_strs = TargetModelHandler().render_many(
+            model=side_model.parameters['model_id'], prompt=prompt, shots=[],
+            texts=[fit_text_to_model(example, side_model.parameters) for example in self.examples])
         futures = {}
         with ThreadPoolExecutor(max_workers=len(self.examples)) as executor:
-            for i, example in enumerate(self.examples):
-                prompt_str = TargetModelHandler().format_prompt(model=side_model.parameters['model_id'],
-                                                                prompt=prompt, texts_and_outputs=[])
-                prompt_str = prompt_str.format(text=example)
+            for i, prompt_str in enumerate(prompt_strs):
                 futures[i] = executor.submit(self._generate_output, prompt_str, side_model)
 
         self.output_discussion_state = {
@@ -392,7 +568,7 @@ class CallbackChatManager(ChatManagerBase):
                 *[m['content'] for m in self.model_chat[-len(self.examples):]],
             ])}]
 
-            response = self._get_assistant_response(tmp_chat)
+            response = self._get_assistant_response(tmp_chat, call_type=CallType.COT_SIDE_CHAT)
             self.save_chat_html(tmp_chat + [{'role': ChatRole.ASSISTANT, 'content': response}],
                                 f'CoT_{self.cot_count}.html')
             self.cot_count += 1
@@ -425,7 +601,7 @@ class CallbackChatManager(ChatManagerBase):
                       self.model_prompts.analyze_discussion_task_begin.replace('PROMPT', self.prompts[-1]))
         temp_chat += self.user_chat[self.output_discussion_state['user_chat_begin']:]
         self._add_msg(temp_chat, ChatRole.SYSTEM, self.model_prompts.analyze_discussion_task_end)
-        recommendations = self._get_assistant_response(temp_chat)
+        recommendations = self._get_assistant_response(temp_chat, call_type=CallType.COT_SIDE_CHAT)
         self._add_msg(temp_chat, ChatRole.SYSTEM, recommendations)
         self.save_chat_html(temp_chat, f'CoT_{self.cot_count}.html')
         self.cot_count += 1
@@ -435,47 +611,85 @@ class CallbackChatManager(ChatManagerBase):
 
     def conversation_end(self):
         self.prompt_conv_end = True
-        self._save_chat_result()
 
         model_id = self.target_llm_client.parameters['model_id']
+        expected_text_tokens = self.expected_text_tokens
         self.few_shot_prompt = TargetModelHandler().format_prompt(model=model_id, prompt=self.prompts[-1],
-                                                                  texts_and_outputs=self.approved_outputs)
+                                                                  texts_and_outputs=self.approved_outputs,
+                                                                  model_params=self.target_llm_client.parameters,
+                                                                  expected_text_tokens=expected_text_tokens)
         self.zero_shot_prompt = TargetModelHandler().format_prompt(model=model_id, prompt=self.prompts[-1],
                                                                   texts_and_outputs=[])
+        self.prompt_token_costs = TargetModelHandler().get_prompt_token_costs(
+            self.target_llm_client.parameters, self.prompts[-1], self.approved_outputs, expected_text_tokens)
+        logging.info(f"per-call prompt tokens: {self.prompt_token_costs}")
+        self._save_chat_result()
 
         end = self.model_prompts.conversation_end_instruction.replace('TARGET_MODEL', model_id)
         self.add_system_message(end)
 
+    def compress_few_shot_prompt(self):
+        """
+        find the cheapest compressed variant of the final few-shot prompt that still reproduces the accepted outputs
+        """
+        from conversational_prompt_engineering.backend.prompt_compression import PromptCompression, \
+            save_compression_results
+
+        table, best = PromptCompression(self.target_llm_client, timeline=self.timeline).compress(
+            self.prompts[-1], self.examples, self.outputs)
+        save_compression_results(table, best, os.path.join(self.out_dir, "compression"))
+        self.save_metrics()
+        self.compression_table = table.drop(columns=["prompt"])
+        self.compressed_prompt = best["prompt"]
+
+    def sweep_target_models(self, eval_texts=()):
+        """
+        compare the final prompt on all the target models, and suggest the cheapest one that agrees with the
+        accepted outputs about as well as the target model of the conversation
+        """
+        from conversational_prompt_engineering.backend.model_sweep import ModelSweep, create_sweep_clients, \
+            save_sweep_results
+
+        model_sweep = ModelSweep(create_sweep_clients(type(self.target_llm_client)),
+                                 self.target_llm_client.parameters['model_id'], timeline=self.timeline)
+        table, best = model_sweep.sweep(self.prompts[-1], self.examples, self.outputs, eval_texts)
+        save_sweep_results(table, best, os.path.join(self.out_dir, "model_sweep"))
+        self.save_metrics()
+        self.model_sweep_table = table
+
     def set_instructions(self, task_instruction, api_instruction, function2description):
-        self.api_names = [key[:key.index('(')] for key in function2description.keys()]
-        self.add_system_message(task_instruction)
-        self.add_system_message(api_instruction)
-        num_examples = str(len(self.examples))
-        for fun_sign, fun_descr in function2description.items():
-            self.add_system_message(f'function {fun_sign}: {fun_descr.replace("task_is_defined", num_examples)}')
+        self.api_names = get_api_names(function2description)
+        self.model_chat += build_instruction_messages(task_instruction, api_instruction, function2description,
+                                                      len(self.examples))
 
     def init_chat(self, examples):
         self.outputs = [None] * len(examples)
         self.examples = examples
 
-        self.set_instructions(self.model_prompts.task_instruction, self.model_prompts.api_instruction,
-                              self.model_prompts.api)
-
-        self.add_system_message(self.model_prompts.examples_intro)
-        for i, ex in enumerate(self.examples):
-            example_num = i + 1
-            self.example_num = example_num
-            self.add_system_message(f'Example {example_num}: {ex}', example_num=example_num)
-        self.example_num = None
-
-        self.add_system_message(self.model_prompts.task_definition_instruction)
+        # the instructions and the examples are shared with the other sessions of the same examples
+        self.chat_prefix = get_conversation_prefix(self.llm_client.parameters, self.model_prompts, self.dataset_name,
+                                                   examples)
+        self.api_names = self.chat_prefix.api_names
+        self.model_chat += self.chat_prefix.messages
+        logging.info(f"shared chat prefix: {len(self.chat_prefix.messages)} messages, "
+                     f"{self.chat_prefix.variant(None)[2]} tokens")
 
         self.submit_model_chat_and_process_response()
 
-    def process_examples(self, df, dataset_name):
+    def process_examples(self, df, dataset_name, example_indices=None):
+        """
+        example_indices are rows of the data file, which is the index of df also when df is a sample of the file
+        """
         self.dataset_name = dataset_name
         self.enable_upload_file = False
-        examples = df['text'].tolist()[:NUM_OF_EXAMPLES_TO_DISCUSS]
+        if example_indices is None:
+            from conversational_prompt_engineering.backend.example_selection import select_diverse_examples
+
+            # discuss a diverse set of examples rather than the first rows, which may be near duplicates
+            positions = select_diverse_examples(df['text'].tolist(), NUM_OF_EXAMPLES_TO_DISCUSS)
+            example_indices = [int(i) for i in df.index[positions]]
+        self.example_indices = example_indices
+        examples = df['text'].loc[example_indices].tolist()
         self.init_chat(examples)
 
     @property
@@ -485,6 +699,7 @@ class CallbackChatManager(ChatManagerBase):
     def _save_chat_result(self):
         data = {
             'examples': self.examples,
+            'example_indices': self.example_indices,
             'accepted_outputs': self.outputs,
             'prompts': self.prompts,
             'baseline_prompts': self.baseline_prompts,
@@ -492,9 +707,11 @@ class CallbackChatManager(ChatManagerBase):
             'dataset_name': self.dataset_name,
             'sent_words_count': self.llm_client.sent_words_count,
             'received_words_count': self.llm_client.received_words_count,
-            'config_name': self.config_name
+            'config_name': self.config_name,
+            'prompt_token_costs': self.prompt_token_costs,
+            'expected_text_tokens': self.expected_text_tokens,
         }
-        with open(self.result_json_file, 'w') as f:
+        with self.profiler.span("save_chat_result", SpanCategory.DISK), open(self.result_json_file, 'w') as f:
             json.dump(data, f)
         if self.prompt_conv_end:
             with open(os.path.join(self.out_dir, "prompt_conv_end.Done"), "w"):
@@ -519,10 +736,15 @@ class CallbackChatManager(ChatManagerBase):
     def load_chat_to_manager(self, path):
         model_chat, user_chat, chat_state, config = self._read_chat_outputs(path)
         dataset_dirs = dataset_name_to_dir[config['dataset']]
-        data_df = pd.read_csv(os.path.join(os.path.dirname(__file__), "..", dataset_dirs["train"]))
-        self.process_examples(data_df, config['dataset'])
-        self.model_chat = model_chat
-        self.user_chat = user_chat
+        data_df = read_dataset(os.path.join(os.path.dirname(__file__), "..", dataset_dirs["train"]), columns=["text"])
+        # chats saved before the diverse selection discussed the first examples of the file
+        example_indices = chat_state.get('example_indices') or list(range(NUM_OF_EXAMPLES_TO_DISCUSS))
+        self.process_examples(data_df, config['dataset'], example_indices=example_indices)
+        self.model_chat = [ChatMessage.from_dict(m) for m in model_chat]
+        prefix_messages = self.chat_prefix.messages
+        if self.model_chat[:len(prefix_messages)] == list(prefix_messages):
+            self.model_chat[:len(prefix_messages)] = prefix_messages  # share the prefix again
+        self.user_chat = [ChatMessage.from_dict(m) for m in user_chat]
         self.enable_upload_file = False
         for key in chat_state:
             setattr(self, key, chat_state[key])
@@ -4,13 +4,16 @@
 # http://www.apache.org/licenses/LICENSE-2.0
 
 import logging
-import time
 import os
 import json
 
 import pandas as pd
-from genai.schema import ChatRole
 
+from conversational_prompt_engineering.backend.util.llm_clients.abst_llm_client import ChatRole
+from conversational_prompt_engineering.backend.chat_messages import ChatMessage
+from conversational_prompt_engineering.backend.llm_metrics import CallType, SessionTimeline, get_llm_metrics, \
+    observe_batch
+from conversational_prompt_engineering.backend.profiling import ProfilingMode, SpanCategory, TurnProfiler
 from conversational_prompt_engineering.backend.prompt_building_util import TargetModelHandler, LLAMA_END_OF_MESSAGE, \
     _get_llama_header, LLAMA_START_OF_INPUT
 
@@ -33,16 +36,40 @@ def create_model_client(model_name, llm_client):
     with open(os.path.join(os.path.dirname(__file__),"model_params.json"), "r") as f:
         params = json.load(f)
     model_params = {x: y for x, y in params['models'][model_name].items()}
-    endpoint = params["endpoints"][llm_client.__name__]
+    endpoint = params["endpoints"].get(llm_client.__name__)  # local clients have no endpoint
     try:
         return llm_client(endpoint, model_params)
     except Exception as e:
         raise ValueError(f'Error generating model client: {e.error_msg}')
 
 
-def format_chat(chat, model_id):
-    if any([name in model_id for name in ['mixtral', 'prometheus']]):
-        bos_token = '<s>'
+def _is_mixtral_format(model_id):
+    return any([name in model_id for name in ['mixtral', 'prometheus']])
+
+
+def _check_model_supported(model_id):
+    if not _is_mixtral_format(model_id) and 'llama' not in model_id:
+        raise ValueError(f"model {model_id} not supported")
+
+
+def format_chat_start(model_id):
+    _check_model_supported(model_id)
+    return '<s>' if _is_mixtral_format(model_id) else LLAMA_START_OF_INPUT
+
+
+def format_chat_end(model_id):
+    _check_model_supported(model_id)
+    return '' if _is_mixtral_format(model_id) else _get_llama_header(ChatRole.ASSISTANT)
+
+
+def format_chat_messages(chat, model_id):
+    """
+    the messages of the chat in the format of the model, without the start of the input and the generation prompt,
+    so that the formats of consecutive parts of a chat can be concatenated (for mixtral, only if the parts do not
+    meet with messages of the same role, which are merged)
+    """
+    _check_model_supported(model_id)
+    if _is_mixtral_format(model_id):
         eos_token = '</s>'
         chat_for_mixtral = []
         prev_role = None
@@ -50,7 +77,7 @@ def format_chat(chat, model_id):
             if m["role"] == prev_role:
                 chat_for_mixtral[-1]["content"] += "\n" + m["content"]
             else:
-                chat_for_mixtral.append(m)
+                chat_for_mixtral.append({"role": m["role"], "content": m["content"]})  # the chat is not modified
             prev_role = m["role"]
 
         for m in chat_for_mixtral:
@@ -60,33 +87,38 @@ def format_chat(chat, model_id):
                 m["role"] = 'user'
                 m["content"] = 'system: ' + m["content"]
 
-        prompt = bos_token
+        prompt = ''
         for m in chat_for_mixtral:
             if m['role'] == 'user':
                 prompt += '[INST] ' + m['content'] + ' [/INST] '
             else:
                 prompt += m['content'] + eos_token + ' '
         return prompt
-    elif 'llama' in model_id:
-        msg_str = LLAMA_START_OF_INPUT
+    else:
+        msg_str = ''
         for m in chat:
             msg_str += _get_llama_header(m['role']) + "\n\n" + m['content'] + LLAMA_END_OF_MESSAGE
-        msg_str += _get_llama_header(ChatRole.ASSISTANT)
         return msg_str
-    else:
-        raise ValueError(f"model {model_id} not supported")
+
+
+def format_chat(chat, model_id):
+    return format_chat_start(model_id) + format_chat_messages(chat, model_id) + format_chat_end(model_id)
 
 
 class ChatManagerBase:
-    def __init__(self, model, target_model, llm_client, output_dir, config_name) -> None:
+    def __init__(self, model, target_model, llm_client, output_dir, config_name,
+                 profiling_mode=ProfilingMode.SPANS) -> None:
         logging.info(f"selected {model}")
         logging.info(f"selected target {target_model}")
 
         self.llm_client = create_model_client(model, llm_client)
         self.target_llm_client = create_model_client(target_model, llm_client)
+        self.target_model = target_model
+        self.llm_client_class = llm_client
         self.dataset_name = None
         self.state = None
-        self.timing_report = []
+        self.timeline = SessionTimeline()
+        self.profiler = TurnProfiler(output_dir, profiling_mode)
         self.out_dir = output_dir
         self.config_name = config_name
         logging.info(f"output is saved to {os.path.abspath(self.out_dir)}")
@@ -113,7 +145,7 @@ class ChatManagerBase:
 
         chat_dir = os.path.join(self.out_dir, "chat")
         os.makedirs(chat_dir, exist_ok=True)
-        df = pd.DataFrame(chat)
+        df = pd.DataFrame([dict(m) for m in chat])
         df.to_csv(os.path.join(chat_dir, f"{file_name.split('.')[0]}.csv"), index=False)
         with open(os.path.join(chat_dir, file_name), "w") as html_out:
             content = "\n".join([_format(x) for x in chat])
@@ -122,38 +154,40 @@ class ChatManagerBase:
             html_out.write(html_template)
 
     def _add_msg(self, chat, role, msg):
-        chat.append({'role': role, 'content': msg})
-
-    def print_timing_report(self):
-        df = pd.DataFrame(self.timing_report)
-        logging.info(df)
-        logging.info(f"Average processing time: {df['total_time'].mean()}")
-        self.timing_report = sorted(self.timing_report, key=lambda row: row['total_time'])
-        logging.info(f"Highest processing time: {self.timing_report[-1]}")
-        logging.info(f"Lowest processing time: {self.timing_report[0]}")
-
-    def _generate_output_and_log_stats(self, conversation, client, max_new_tokens=None):
-        start_time = time
-        generated_texts, stats_dict = client.send_messages(conversation, max_new_tokens)
-        elapsed_time = time.time() - start_time.time()
-        timing_dict = {"total_time": elapsed_time, "start_time": start_time.strftime("%d-%m-%Y %H:%M:%S")}
-        timing_dict.update(stats_dict)
-        logging.info(timing_dict)
-        self.timing_report.append(timing_dict)
-        return generated_texts
-
-    def _generate_output(self, prompt_str, client=None):
+        chat.append(ChatMessage(role, msg))
+
+    def save_metrics(self):
+        """
+        the timeline of the LLM calls of the session, and the metrics of the process in the Prometheus text format
+        """
+        chat_dir = os.path.join(self.out_dir, "chat")
+        os.makedirs(chat_dir, exist_ok=True)
+        self.timeline.save(os.path.join(chat_dir, "timeline.json"))
+        get_llm_metrics().export(os.path.join(os.path.dirname(os.path.normpath(self.out_dir)), "metrics.prom"))
+
+    def _generate_output_and_log_stats(self, conversation, client, max_new_tokens=None,
+                                       call_type=CallType.ASSISTANT_TURN):
+        def send():
+            with self.profiler.span(call_type.value, SpanCategory.LLM):
+                return client.send_messages(conversation, max_new_tokens)[0]
+
+        return observe_batch(call_type, client, [conversation], send, self.timeline)
+
+    def _generate_output(self, prompt_str, client=None, call_type=CallType.TARGET_OUTPUT):
         if client is None:
             client = self.target_llm_client
-        generated_texts = self._generate_output_and_log_stats(prompt_str, client=client)
+        generated_texts = self._generate_output_and_log_stats(prompt_str, client=client, call_type=call_type)
         agent_response = generated_texts[0]
         logging.info(f"got response from model: {agent_response}")
         return agent_response.strip()
 
-    def _get_assistant_response(self, chat, max_new_tokens=None):
-        conversation = format_chat(chat, self.llm_client.parameters['model_id'])
+    def _format_chat(self, chat):
+        return format_chat(chat, self.llm_client.parameters['model_id'])
+
+    def _get_assistant_response(self, chat, max_new_tokens=None, call_type=CallType.ASSISTANT_TURN):
+        conversation = self._format_chat(chat)
         generated_texts = self._generate_output_and_log_stats(conversation, client=self.llm_client,
-                                                              max_new_tokens=max_new_tokens)
+                                                              max_new_tokens=max_new_tokens, call_type=call_type)
         agent_response = ''
         for txt in generated_texts:
             if any([f'<|{r}|>' in txt for r in [ChatRole.SYSTEM, ChatRole.USER]]):
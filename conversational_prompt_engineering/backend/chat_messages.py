@@ -0,0 +1,129 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import sys
+from collections.abc import MutableMapping
+
+from conversational_prompt_engineering.backend.util.llm_clients.abst_llm_client import ChatRole
+
+_interned_tags = {}
+
+
+def _intern_tags(tags):
+    """
+    tag names are interned, and so are the tag tuples with small values (e.g. example_num and prompt_iteration),
+    so that the many messages with the same tags share a single tuple
+    """
+    tags = tuple((sys.intern(name), value) for name, value in tags)
+    if all(value is None or isinstance(value, int) for _, value in tags):
+        return _interned_tags.setdefault(tags, tags)
+    return tags
+
+
+def _intern_role(role):
+    return ChatRole(role) if role in ChatRole._value2member_map_ else role
+
+
+class ChatMessage(MutableMapping):
+    """
+    a chat message that behaves like the dict {'role': ..., 'content': ..., **tags}, but is smaller: the role and
+    tags are shared between messages, and the content may be a tuple of parts, so that a message can refer to a
+    long text of the session (e.g. an example) instead of holding another copy of it. The parts are joined when the
+    content is read.
+    """
+    __slots__ = ("role", "_content", "_tags")
+
+    def __init__(self, role, content, **tags):
+        self.role = _intern_role(role)
+        self._content = content
+        self._tags = _intern_tags(tags.items())
+
+    @classmethod
+    def from_dict(cls, message):
+        message = dict(message)
+        return cls(message.pop('role'), message.pop('content'), **message)
+
+    @property
+    def content(self):
+        content = self._content
+        return content if isinstance(content, str) else "".join(content)
+
+    def __getitem__(self, key):
+        if key == 'role':
+            return self.role
+        if key == 'content':
+            return self.content
+        for name, value in self._tags:
+            if name == key:
+                return value
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        # on the path of the chat filtering, so it does not go through the KeyError of __getitem__
+        if key == 'role':
+            return self.role
+        if key == 'content':
+            return self.content
+        for name, value in self._tags:
+            if name == key:
+                return value
+        return default
+
+    def __setitem__(self, key, value):
+        if key == 'role':
+            self.role = _intern_role(value)
+        elif key == 'content':
+            self._content = value
+        elif any(name == key for name, _ in self._tags):
+            self._tags = _intern_tags((name, value if name == key else v) for name, v in self._tags)
+        else:
+            self._tags = _intern_tags(self._tags + ((key, value),))
+
+    def __delitem__(self, key):
+        if key in ('role', 'content') or not any(name == key for name, _ in self._tags):
+            raise KeyError(key)
+        self._tags = _intern_tags((name, value) for name, value in self._tags if name != key)
+
+    def __iter__(self):
+        yield 'role'
+        yield 'content'
+        for name, _ in self._tags:
+            yield name
+
+    def __len__(self):
+        return 2 + len(self._tags)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def copy(self):
+        message = ChatMessage.__new__(ChatMessage)
+        message.role, message._content, message._tags = self.role, self._content, self._tags
+        return message
+
+    def to_dict(self):
+        return dict(self)
+
+
+class FrozenChatMessage(ChatMessage):
+    """
+    a chat message that is shared by several sessions, and may not be modified
+    """
+    __slots__ = ()
+
+    def __setitem__(self, key, value):
+        raise TypeError("a shared chat message may not be modified")
+
+    def __delitem__(self, key):
+        raise TypeError("a shared chat message may not be modified")
+
+
+def json_default(obj):
+    """
+    the default function for json.dump of structures that contain chat messages
+    """
+    if isinstance(obj, ChatMessage):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
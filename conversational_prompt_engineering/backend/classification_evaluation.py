@@ -0,0 +1,194 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import argparse
+import ast
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from conversational_prompt_engineering.backend.llm_metrics import CallType, get_llm_metrics, observe_batch
+from conversational_prompt_engineering.backend.prompt_building_util import get_prompt_template
+from conversational_prompt_engineering.backend.text_budget import fit_text_to_model
+
+LABEL_COLUMN = "label"
+UNMAPPED_LABEL = "<unmapped>"
+CLASSIFICATION_MAX_NEW_TOKENS = 20
+BATCH_SIZE = 16
+MAX_WORKERS = 8
+
+_non_alnum_pattern = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_label(label):
+    return _non_alnum_pattern.sub(" ", str(label).lower()).strip()
+
+
+def parse_gold_labels(value):
+    """
+    labels are either plain strings or python lists serialized as strings (multi-label rows)
+    """
+    if isinstance(value, str) and value.startswith("["):
+        try:
+            parsed = ast.literal_eval(value)
+            if isinstance(parsed, (list, tuple)):
+                return [str(x) for x in parsed]
+        except (ValueError, SyntaxError):
+            pass
+    return [str(value)]
+
+
+def get_label_set(gold_labels):
+    return sorted({label for labels in gold_labels for label in labels})
+
+
+def map_output_to_label(output, label_set):
+    """
+    map a free text model output to one of the labels: exact match, then the label that is mentioned first in the
+    output (longest label on ties), then the label with the highest word overlap.
+    """
+    normalized_output = normalize_label(output)
+    normalized_labels = {normalize_label(label): label for label in label_set}
+    if normalized_output in normalized_labels:
+        return normalized_labels[normalized_output]
+
+    padded_output = f" {normalized_output} "
+    mentioned = [(padded_output.index(f" {n} "), -len(n), label) for n, label in normalized_labels.items()
+                 if f" {n} " in padded_output]
+    if mentioned:
+        return min(mentioned)[2]
+
+    output_words = set(normalized_output.split())
+    best_label, best_overlap = UNMAPPED_LABEL, 0.0
+    for n, label in normalized_labels.items():
+        label_words = set(n.split())
+        overlap = len(output_words & label_words) / len(label_words | output_words) if label_words else 0.0
+        if overlap > best_overlap:
+            best_label, best_overlap = label, overlap
+    return best_label
+
+
+def compute_classification_metrics(gold_labels, predicted_labels, label_set):
+    """
+    accuracy, macro-F1 and a confusion matrix (gold labels in rows, predicted labels in columns).
+    For multi-label rows, a prediction is correct if it is one of the gold labels.
+    """
+    columns = list(label_set) + [UNMAPPED_LABEL]
+    label_to_idx = {label: i for i, label in enumerate(columns)}
+    gold_idx = np.array([label_to_idx[pred if pred in gold else gold[0]]
+                         for gold, pred in zip(gold_labels, predicted_labels)], dtype=np.int64)
+    pred_idx = np.array([label_to_idx[pred] for pred in predicted_labels], dtype=np.int64)
+    num_labels = len(columns)
+    confusion = np.bincount(gold_idx * num_labels + pred_idx, minlength=num_labels * num_labels) \
+        .reshape(num_labels, num_labels)
+
+    true_positives = np.diag(confusion)[:-1].astype(float)
+    predicted_totals = confusion.sum(axis=0)[:-1]
+    gold_totals = confusion.sum(axis=1)[:-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(predicted_totals > 0, true_positives / np.maximum(predicted_totals, 1), 0.0)
+        recall = np.where(gold_totals > 0, true_positives / np.maximum(gold_totals, 1), 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    present = gold_totals > 0  # macro average over the labels that appear in the data
+    return {
+        "accuracy": float(true_positives.sum() / max(len(gold_idx), 1)),
+        "macro_f1": float(f1[present].mean()) if present.any() else 0.0,
+        "unmapped_rate": float((pred_idx == num_labels - 1).mean()) if len(pred_idx) else 0.0,
+        "num_examples": len(gold_idx),
+        "confusion_matrix": pd.DataFrame(confusion[:-1], index=columns[:-1], columns=columns),
+    }
+
+
+class ClassificationEvaluation:
+
+    def __init__(self, llm_client, max_new_tokens=CLASSIFICATION_MAX_NEW_TOKENS, batch_size=BATCH_SIZE,
+                 max_workers=MAX_WORKERS, timeline=None):
+        self.llm_client = llm_client
+        self.max_new_tokens = max_new_tokens
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.timeline = timeline
+
+    def _generate(self, prompt_strs):
+        return observe_batch(CallType.EVALUATION_CELL, self.llm_client, prompt_strs,
+                             lambda: self.llm_client.send_messages_batch(prompt_strs, self.max_new_tokens)[0],
+                             self.timeline)
+
+    def generate_predictions(self, prompts, prompt_types, texts, gold_labels, label_set):
+        rows = []
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            fitted_texts = [fit_text_to_model(t, self.llm_client.parameters) for t in texts]
+            for prompt, prompt_type in zip(prompts, prompt_types):
+                template = get_prompt_template(prompt)
+                for begin in range(0, len(texts), self.batch_size):
+                    prompt_strs = template.render_many(fitted_texts[begin:begin + self.batch_size])
+                    futures.append((prompt_type, begin, executor.submit(self._generate, prompt_strs)))
+
+            for prompt_type, begin, f in futures:
+                for i, output in enumerate(f.result()):
+                    rows.append({"index": begin + i, "prompt_type": prompt_type, "text": texts[begin + i],
+                                 "gold_labels": gold_labels[begin + i], "output": output,
+                                 "predicted_label": map_output_to_label(output, label_set)})
+        return pd.DataFrame(rows)
+
+    def evaluate(self, prompts, prompt_types, texts, labels):
+        start_time = time.time()
+        gold_labels = [parse_gold_labels(label) for label in labels]
+        label_set = get_label_set(gold_labels)
+        predictions_df = self.generate_predictions(prompts, prompt_types, texts, gold_labels, label_set)
+        results = {}
+        for prompt_type in prompt_types:
+            df = predictions_df[predictions_df["prompt_type"] == prompt_type].sort_values("index")
+            results[prompt_type] = compute_classification_metrics(df["gold_labels"].tolist(),
+                                                                  df["predicted_label"].tolist(), label_set)
+        logging.info(f"classification evaluation of {len(texts)} texts and {len(prompts)} prompts took "
+                     f"{time.time() - start_time:.1f} seconds")
+        return results, predictions_df
+
+
+def save_classification_results(results, predictions_df, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    predictions_df.to_csv(os.path.join(out_dir, "classification_predictions.csv"), index=False)
+    summary = {}
+    for prompt_type, res in results.items():
+        res["confusion_matrix"].to_csv(os.path.join(out_dir, f"confusion_matrix_{prompt_type}.csv"))
+        summary[prompt_type] = {k: v for k, v in res.items() if k != "confusion_matrix"}
+    with open(os.path.join(out_dir, "classification_metrics.json"), "w") as f:
+        json.dump(summary, f)
+    return summary
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--prompts_path', help='path for a json file that maps prompt types to formatted prompts')
+parser.add_argument('--data_path', help='path for labelled test data')
+parser.add_argument('--model', default='llama-3', help='short name of the target model in model_params.json')
+parser.add_argument('--llm_client', default='WatsonXClient', help='name of the llm client class')
+parser.add_argument('--max_new_tokens', type=int, default=CLASSIFICATION_MAX_NEW_TOKENS)
+parser.add_argument('--out_dir', help='path for saving evaluation files')
+
+
+if __name__ == "__main__":
+    from conversational_prompt_engineering.backend.chat_manager_util import create_model_client
+    from conversational_prompt_engineering.backend.util.llm_clients.llm_clients_loader import get_client_classes
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    args = parser.parse_args()
+    with open(args.prompts_path, "r") as f:
+        prompts = json.load(f)
+    test_df = pd.read_csv(args.data_path).dropna(subset=["text", LABEL_COLUMN])
+    client = create_model_client(args.model, get_client_classes([args.llm_client])[0])
+    evaluation = ClassificationEvaluation(client, max_new_tokens=args.max_new_tokens)
+    results, predictions_df = evaluation.evaluate(list(prompts.values()), list(prompts.keys()),
+                                                  test_df["text"].tolist(), test_df[LABEL_COLUMN].tolist())
+    summary = save_classification_results(results, predictions_df, args.out_dir)
+    get_llm_metrics().export(os.path.join(args.out_dir, "metrics.prom"))
+    logging.info(json.dumps(summary, indent=2))
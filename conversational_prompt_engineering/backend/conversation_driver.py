@@ -0,0 +1,229 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from conversational_prompt_engineering.backend.callback_chat_manager import CallbackChatManager
+from conversational_prompt_engineering.backend.chat_manager_util import format_chat
+from conversational_prompt_engineering.backend.profiling import ProfilingMode
+from conversational_prompt_engineering.backend.text_budget import estimate_num_tokens
+from conversational_prompt_engineering.backend.util.llm_clients.abst_llm_client import ChatRole
+
+MAX_TURNS = 30
+MAX_WORKERS = 4
+
+USER_PERSONA_INSTRUCTION = \
+    'You are a user of a system that helps you build a prompt for a task on your texts, via a chat with an ' \
+    'assistant. You have the following requirements for the outputs of the task, and you don\'t reveal them ' \
+    'all at once. Answer the questions of the assistant according to them, and give feedback on the outputs that ' \
+    'it shows you: accept an output only if it meets your requirements, otherwise say what should change.\n' \
+    'Your requirements: TARGET_SPEC\n' \
+    'When the outputs meet your requirements, tell the assistant that you want to end the conversation. ' \
+    'Reply with your next message to the assistant only, in one or two sentences.'
+
+
+class ScriptedUser:
+    """
+    answers the messages of the assistant with the next answer of a script, until the script ends
+    """
+
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.num_answers = 0
+
+    def reply(self, agent_messages):
+        if self.num_answers >= len(self.answers):
+            return None
+        self.num_answers += 1
+        return self.answers[self.num_answers - 1]
+
+
+class LLMPersonaUser:
+    """
+    a user played by an LLM that holds a target specification of the outputs, hidden from the assistant
+    """
+
+    def __init__(self, llm_client, target_spec):
+        self.llm_client = llm_client
+        self.chat = [{'role': ChatRole.SYSTEM, 'content': USER_PERSONA_INSTRUCTION.replace('TARGET_SPEC', target_spec)}]
+        self.num_calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def reply(self, agent_messages):
+        # from the side of the persona, the assistant is the one who asks
+        self.chat += [{'role': ChatRole.USER, 'content': m['content']} for m in agent_messages]
+        conversation = format_chat(self.chat, self.llm_client.parameters['model_id'])
+        texts, _ = self.llm_client.send_messages(conversation)
+        answer = texts[0].strip()
+        self.num_calls += 1
+        self.prompt_tokens += estimate_num_tokens(conversation, self.llm_client.parameters)
+        self.output_tokens += estimate_num_tokens(answer, self.llm_client.parameters)
+        self.chat.append({'role': ChatRole.ASSISTANT, 'content': answer})
+        return answer
+
+
+class ConversationDriver:
+    """
+    runs a CPE conversation without the UI: the examples are selected as in the UI, and the messages of the
+    assistant are answered by a simulated user until the conversation ends, the user has no answer, or max_turns
+    """
+
+    def __init__(self, manager, user, max_turns=MAX_TURNS):
+        self.manager = manager
+        self.user = user
+        self.max_turns = max_turns
+        self.turn_latencies = []
+
+    def _turn(self, user_message=None):
+        start = time.perf_counter()
+        if user_message is not None:
+            self.manager.add_user_message(user_message)
+        agent_messages = self.manager.generate_agent_messages()
+        self.turn_latencies.append(time.perf_counter() - start)
+        return agent_messages
+
+    def run(self, df, dataset_name, example_indices=None):
+        start = time.perf_counter()
+        self.manager.process_examples(df, dataset_name, example_indices)
+        agent_messages = self._turn()
+        while not self.manager.prompt_conv_end and len(self.turn_latencies) < self.max_turns:
+            answer = self.user.reply(agent_messages)
+            if answer is None:
+                break
+            agent_messages = self._turn(answer)
+        return self.summary(time.perf_counter() - start)
+
+    def summary(self, elapsed_seconds):
+        events = list(self.manager.timeline.events)
+        return {
+            "dataset": self.manager.dataset_name,
+            "out_dir": self.manager.out_dir,
+            "completed": self.manager.prompt_conv_end,
+            "num_turns": len(self.turn_latencies),
+            "turn_latencies": self.turn_latencies,
+            "elapsed_seconds": elapsed_seconds,
+            "prompts": list(self.manager.prompts),
+            "zero_shot_prompt": self.manager.zero_shot_prompt,
+            "few_shot_prompt": self.manager.few_shot_prompt,
+            "llm_calls": len(events),
+            "llm_calls_by_type": dict(Counter(e["call_type"] for e in events)),
+            "prompt_tokens": sum(e["prompt_tokens"] for e in events),
+            "output_tokens": sum(e["output_tokens"] for e in events),
+            "user_llm_calls": getattr(self.user, "num_calls", 0),
+            "user_prompt_tokens": getattr(self.user, "prompt_tokens", 0),
+            "user_output_tokens": getattr(self.user, "output_tokens", 0),
+        }
+
+
+def load_catalog_texts(dataset_names):
+    """
+    the train files of the catalog datasets, read the way the UI reads them
+    """
+    from conversational_prompt_engineering.data.main_dataset_name_to_dir import dataset_name_to_dir
+    from conversational_prompt_engineering.util.csv_file_utils import read_user_csv_file
+
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return {name: read_user_csv_file(os.path.join(package_dir, dataset_name_to_dir[name]["train"]))
+            for name in dataset_names}
+
+
+def run_sessions(num_sessions, dataset_names, create_manager, create_user, max_turns=MAX_TURNS,
+                 max_workers=MAX_WORKERS, out_path=None):
+    """
+    runs num_sessions conversations concurrently over the catalog datasets in turn. create_manager and create_user
+    get the index of the session. The summary of every session is appended to out_path as soon as it ends, so a
+    long run can be followed and its finished sessions are kept.
+    """
+    catalog = load_catalog_texts(dataset_names)
+    write_lock = threading.Lock()
+
+    def _run_session(i):
+        dataset_name = dataset_names[i % len(dataset_names)]
+        summary = ConversationDriver(create_manager(i), create_user(i), max_turns).run(catalog[dataset_name],
+                                                                                        dataset_name)
+        summary["session"] = i
+        if out_path is not None:
+            with write_lock, open(out_path, "a") as f:
+                f.write(json.dumps(summary) + "\n")
+        return summary
+
+    summaries = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_run_session, i) for i in range(num_sessions)]
+        for f in as_completed(futures):
+            try:
+                summaries.append(f.result())
+            except Exception:
+                logging.exception("a headless session failed")
+    return sorted(summaries, key=lambda s: s["session"])
+
+
+def _load_list(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--datasets', nargs='+', required=True, help='catalog datasets, assigned to the sessions in turn')
+parser.add_argument('--num_sessions', type=int, default=1)
+parser.add_argument('--answers_path', help='json file with a list of user answers, for a scripted user')
+parser.add_argument('--target_specs_path', help='json file with a list of target specifications, for users played '
+                                                'by an LLM, assigned to the sessions in turn')
+parser.add_argument('--model', default='llama-3', help='short name of the assistant model in model_params.json')
+parser.add_argument('--target_model', default='llama-3', help='short name of the target model in model_params.json')
+parser.add_argument('--user_model', default='llama-3', help='short name of the model that plays the user')
+parser.add_argument('--llm_client', default='WatsonXClient', help='name of the llm client class')
+parser.add_argument('--max_turns', type=int, default=MAX_TURNS)
+parser.add_argument('--max_workers', type=int, default=MAX_WORKERS)
+parser.add_argument('--out_dir', default=os.path.join('_out', 'headless'), help='dir for the outputs of the sessions')
+parser.add_argument('--profiling_mode', default=ProfilingMode.SPANS.value,
+                    choices=[m.value for m in ProfilingMode])
+
+
+if __name__ == "__main__":
+    from conversational_prompt_engineering.backend.chat_manager_util import create_model_client
+    from conversational_prompt_engineering.backend.util.llm_clients.llm_clients_loader import get_client_classes
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    args = parser.parse_args()
+    if (args.answers_path is None) == (args.target_specs_path is None):
+        parser.error("pass either --answers_path or --target_specs_path")
+    llm_client_class = get_client_classes([args.llm_client])[0]
+    run_dir = os.path.join(args.out_dir, time.strftime("%d-%m-%Y_%H-%M-%S"))
+    os.makedirs(run_dir, exist_ok=True)
+
+    def _create_manager(i):
+        return CallbackChatManager(model=args.model, target_model=args.target_model, llm_client=llm_client_class,
+                                   output_dir=os.path.join(run_dir, f"session_{i:04d}"), config_name="headless",
+                                   profiling_mode=args.profiling_mode)
+
+    if args.answers_path is not None:
+        answers = _load_list(args.answers_path)
+
+        def _create_user(i):
+            return ScriptedUser(answers)
+    else:
+        target_specs = _load_list(args.target_specs_path)
+
+        def _create_user(i):
+            return LLMPersonaUser(create_model_client(args.user_model, llm_client_class),
+                                  target_specs[i % len(target_specs)])
+
+    summaries = run_sessions(args.num_sessions, args.datasets, _create_manager, _create_user, args.max_turns,
+                             args.max_workers, out_path=os.path.join(run_dir, "sessions.jsonl"))
+    num_completed = sum(s["completed"] for s in summaries)
+    logging.info(f"{num_completed}/{args.num_sessions} sessions completed")
+    if summaries:
+        for key in ["num_turns", "llm_calls", "prompt_tokens", "output_tokens"]:
+            logging.info(f"mean {key} per session: {sum(s[key] for s in summaries) / len(summaries):.1f}")
+    logging.info(f"session summaries saved to {os.path.join(run_dir, 'sessions.jsonl')}")
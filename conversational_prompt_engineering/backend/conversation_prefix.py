@@ -0,0 +1,108 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import threading
+from collections import OrderedDict
+
+from conversational_prompt_engineering.backend.chat_manager_util import format_chat, format_chat_end, \
+    format_chat_messages, format_chat_start
+from conversational_prompt_engineering.backend.chat_messages import FrozenChatMessage
+from conversational_prompt_engineering.backend.text_budget import estimate_num_tokens, fit_text_to_model
+from conversational_prompt_engineering.backend.util.llm_clients.abst_llm_client import ChatRole
+
+MAX_CACHED_PREFIXES = 32
+
+_prefixes = OrderedDict()
+_prefixes_lock = threading.Lock()
+
+
+def build_instruction_messages(task_instruction, api_instruction, function2description, num_examples):
+    messages = [FrozenChatMessage(ChatRole.SYSTEM, task_instruction),
+                FrozenChatMessage(ChatRole.SYSTEM, api_instruction)]
+    for fun_sign, fun_descr in function2description.items():
+        messages.append(FrozenChatMessage(
+            ChatRole.SYSTEM, f'function {fun_sign}: {fun_descr.replace("task_is_defined", str(num_examples))}'))
+    return messages
+
+
+def get_api_names(function2description):
+    return [key[:key.index('(')] for key in function2description.keys()]
+
+
+class ConversationPrefix:
+    """
+    the static beginning of the model chat of a session: the instructions, the API, the examples and the task
+    definition instruction. It is the same for all the sessions with the same model and examples, so its messages
+    are shared (read-only) by these sessions, and its formats are rendered once, for each example the chat may be
+    filtered to.
+    """
+
+    def __init__(self, model_params, model_prompts, examples):
+        self.model_params = model_params
+        self.model_id = model_params['model_id']
+        self.api_names = get_api_names(model_prompts.api)
+        messages = build_instruction_messages(model_prompts.task_instruction, model_prompts.api_instruction,
+                                              model_prompts.api, len(examples))
+        messages.append(FrozenChatMessage(ChatRole.SYSTEM, model_prompts.examples_intro))
+        for i, ex in enumerate(examples):
+            ex = fit_text_to_model(ex, model_params, num_texts=len(examples))
+            # the message refers to the example text rather than copying it
+            messages.append(FrozenChatMessage(ChatRole.SYSTEM, (f'Example {i + 1}: ', ex), example_num=i + 1))
+        messages.append(FrozenChatMessage(ChatRole.SYSTEM, model_prompts.task_definition_instruction))
+        self.messages = tuple(messages)
+        self._lock = threading.Lock()
+        self._variants = {}
+
+    def variant(self, example_num):
+        """
+        the messages of the prefix that remain when the chat is filtered to example_num (see _filtered_model_chat),
+        their rendered format and its estimated number of tokens
+        """
+        variant = self._variants.get(example_num)
+        if variant is None:
+            messages = tuple(m for m in self.messages
+                             if example_num is None or m.get('example_num') in (None, example_num))
+            rendered = format_chat_start(self.model_id) + format_chat_messages(messages, self.model_id)
+            variant = (messages, rendered, estimate_num_tokens(rendered, self.model_params))
+            with self._lock:
+                variant = self._variants.setdefault(example_num, variant)
+        return variant
+
+    def format_chat(self, chat, example_nums=(None,)):
+        """
+        format_chat(chat), where only the part of the chat after the prefix is rendered, if the chat starts with
+        the messages of the prefix filtered to one of example_nums
+        """
+        for example_num in example_nums:
+            messages, rendered, _ = self.variant(example_num)
+            n = len(messages)
+            if len(chat) >= n and all(a is b for a, b in zip(chat, messages)):
+                tail = chat[n:]
+                if tail and tail[0]['role'] == messages[-1]['role']:
+                    break  # the formats of some models merge the two messages
+                return rendered + format_chat_messages(tail, self.model_id) + format_chat_end(self.model_id)
+        return format_chat(chat, self.model_id)
+
+
+def get_conversation_prefix(model_params, model_prompts, dataset_name, examples):
+    """
+    the prefix shared by the sessions of the same model, dataset and examples (the most recently used prefixes
+    are kept)
+    """
+    key = (tuple(sorted(model_params.items())), dataset_name, tuple(examples), model_prompts.task_instruction,
+           model_prompts.api_instruction, tuple(model_prompts.api.items()), model_prompts.examples_intro,
+           model_prompts.task_definition_instruction)
+    with _prefixes_lock:
+        prefix = _prefixes.get(key)
+        if prefix is not None:
+            _prefixes.move_to_end(key)
+            return prefix
+    prefix = ConversationPrefix(dict(model_params), model_prompts, list(examples))
+    with _prefixes_lock:
+        prefix = _prefixes.setdefault(key, prefix)
+        _prefixes.move_to_end(key)
+        while len(_prefixes) > MAX_CACHED_PREFIXES:
+            _prefixes.popitem(last=False)
+    return prefix
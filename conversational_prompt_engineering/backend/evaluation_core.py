@@ -7,10 +7,14 @@ import json
 import logging
 import os
 import random
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import pandas as pd
 from tqdm import tqdm
+
+from conversational_prompt_engineering.backend.llm_metrics import CallType, get_llm_metrics, observe_batch
+from conversational_prompt_engineering.backend.prompt_building_util import get_prompt_template
+from conversational_prompt_engineering.backend.text_budget import fit_text_to_model
 import argparse
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
@@ -26,8 +30,9 @@ parser.add_argument('--out_dir', help='path for saving evaluation files')
 
 class Evaluation:
 
-    def __init__(self, bam_client):
+    def __init__(self, bam_client, timeline=None):
         self.bam_client = bam_client
+        self.timeline = timeline
 
     def get_prompts_to_evaluate(self, prompts):
         if len(prompts) > 2:
@@ -55,13 +60,16 @@ class Evaluation:
         df = df[[c for c in df.columns if not c.endswith("prompt")]]
         df.to_csv(os.path.join(out_dir, "evaluate_mixed_hidden.csv"), index=False)
 
+        get_llm_metrics().export(os.path.join(out_dir, "metrics.prom"))
         logging.info(f"evaluation files saved to {out_dir}")
 
     def summarize(self, prompts, prompt_types, row_data_for_text):
         prompts_responses = []
         for _, prompt in enumerate(tqdm(prompts)):
-            prompt_str = prompt.format(text=row_data_for_text["text"])
-            resp = self.bam_client.send_messages(prompt_str)[0]
+            prompt_str = get_prompt_template(prompt).render(
+                fit_text_to_model(row_data_for_text["text"], self.bam_client.parameters))
+            resp = observe_batch(CallType.EVALUATION_CELL, self.bam_client, [prompt_str],
+                                 lambda: self.bam_client.send_messages(prompt_str)[0], self.timeline)
             prompts_responses.append(resp[0].replace("\n", " \n"))
         mixed_indices = list(range(len(prompts)))
         random.shuffle(mixed_indices)
@@ -73,17 +81,18 @@ class Evaluation:
         row_data_for_text["mixed_indices_mapping_to_prompt_type"] = mixed_mapping
         return row_data_for_text
 
-    def generate_evaluation_examples(self, prompts, prompt_types, texts):
+    def generate_evaluation_examples(self, prompts, prompt_types, texts, progress_callback=None):
         generated_ordered = []
         futures = {}
         with ThreadPoolExecutor(max_workers=len(texts)) as executor:
             for i, t in enumerate(texts):
                 row_data_ordered = {"text": t, "index": i}
                 generated_ordered.append(row_data_ordered)
-                futures[i] = executor.submit(self.summarize, prompts, prompt_types, generated_ordered[i])
+                futures[executor.submit(self.summarize, prompts, prompt_types, generated_ordered[i])] = i
 
-        for i, f in futures.items():
-            output = f.result()
-            generated_ordered[i] = output
+            for num_done, f in enumerate(as_completed(futures), start=1):
+                generated_ordered[futures[f]] = f.result()
+                if progress_callback is not None:
+                    progress_callback(num_done, len(texts))
         random.shuffle((generated_ordered))
         return generated_ordered
\ No newline at end of file
@@ -0,0 +1,160 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+
+MAX_WORKERS = 4
+
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    INTERRUPTED = "interrupted"  # the process that ran the job is gone
+
+
+ACTIVE_STATUSES = [JobStatus.QUEUED.value, JobStatus.RUNNING.value]
+_job_id_pattern = re.compile(r"[0-9a-f]{32}")  # uuid4().hex, as submit creates them
+# tells the jobs of this process from the jobs of an earlier process with the same pid (e.g. a restarted container)
+_boot_id = uuid.uuid4().hex
+
+
+def _to_generated_data(rows):
+    # json turns the int keys of the side -> prompt type mapping into strings
+    for row in rows:
+        mapping = row.get("mixed_indices_mapping_to_prompt_type")
+        if mapping is not None:
+            row["mixed_indices_mapping_to_prompt_type"] = {int(k): v for k, v in mapping.items()}
+    return rows
+
+
+def is_valid_job_id(job_id):
+    return isinstance(job_id, str) and _job_id_pattern.fullmatch(job_id) is not None
+
+
+def _is_process_alive(pid):
+    # the workers of a deployment share the host, so a job of another worker is followed through its json file
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # the process exists, but belongs to another user
+        pass
+    return True
+
+
+class EvaluationJobRunner:
+    """
+    runs evaluation generation in a per-process worker pool, outside the streamlit script run. Every job is recorded
+    in a json file in jobs_dir, so a rerun (or a reconnected session) can attach to a running job by its id and
+    collect its result once it is done.
+    """
+
+    def __init__(self, jobs_dir, max_workers=MAX_WORKERS):
+        self.jobs_dir = jobs_dir
+        os.makedirs(jobs_dir, exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cpe-eval-job")
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def _job_file(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _result_file(self, job_id):
+        if not is_valid_job_id(job_id):
+            raise ValueError(f"invalid job id {job_id!r}")
+        return os.path.join(self.jobs_dir, f"{job_id}_result.json")
+
+    def _write_json(self, path, data):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _update(self, job_id, **fields):
+        with self.lock:
+            job = self.jobs[job_id]
+            job.update(fields, updated_at=time.time())
+            self._write_json(self._job_file(job_id), job)
+
+    def submit(self, evaluation, prompts, prompt_types, texts, owner=None):
+        job_id = uuid.uuid4().hex
+        job = {"job_id": job_id, "owner": owner, "status": JobStatus.QUEUED.value, "pid": os.getpid(),
+               "boot_id": _boot_id, "num_done": 0, "num_total": len(texts), "error": None,
+               "created_at": time.time(), "updated_at": time.time()}
+        with self.lock:
+            self.jobs[job_id] = job
+            self._write_json(self._job_file(job_id), job)
+        self.executor.submit(self._run, job_id, evaluation, prompts, prompt_types, texts)
+        logging.info(f"submitted evaluation job {job_id} with {len(texts)} texts")
+        return job_id
+
+    def _run(self, job_id, evaluation, prompts, prompt_types, texts):
+        self._update(job_id, status=JobStatus.RUNNING.value)
+        try:
+            generated_data = evaluation.generate_evaluation_examples(
+                prompts, prompt_types, texts,
+                progress_callback=lambda num_done, num_total: self._update(job_id, num_done=num_done))
+            self._write_json(self._result_file(job_id), generated_data)
+            self._update(job_id, status=JobStatus.DONE.value, num_done=len(texts))
+            logging.info(f"evaluation job {job_id} is done")
+        except Exception as e:
+            logging.exception(f"evaluation job {job_id} failed")
+            self._update(job_id, status=JobStatus.FAILED.value, error=str(e))
+
+    def get_job(self, job_id, owner):
+        """
+        the job, or None if there is no such job or it belongs to another owner. The job id may come from the url,
+        so only the ids that submit creates are looked up.
+        """
+        if not is_valid_job_id(job_id):
+            return None
+        with self.lock:
+            job = dict(self.jobs[job_id]) if job_id in self.jobs else None
+        if job is None:
+            job_file = self._job_file(job_id)
+            if not os.path.exists(job_file):
+                return None
+            with open(job_file, "r") as f:
+                job = json.load(f)
+            if job["status"] in ACTIVE_STATUSES and not self._is_running_elsewhere(job):
+                job["status"] = JobStatus.INTERRUPTED.value
+        return job if job["owner"] == owner else None
+
+    @staticmethod
+    def _is_running_elsewhere(job):
+        # an active job that this runner does not know is run by another runner of this process, or by another live
+        # worker. A job of an earlier process is interrupted, even if this process got its pid
+        if job.get("boot_id") == _boot_id:
+            return True
+        return job["pid"] != os.getpid() and _is_process_alive(job["pid"])
+
+    def get_result(self, job_id):
+        with open(self._result_file(job_id), "r") as f:
+            return _to_generated_data(json.load(f))
+
+
+_runners = {}
+_runners_lock = threading.Lock()
+
+
+def get_job_runner(jobs_dir):
+    """
+    one runner (and worker pool) per jobs dir per process, shared by all the sessions
+    """
+    jobs_dir = os.path.abspath(jobs_dir)
+    with _runners_lock:
+        if jobs_dir not in _runners:
+            _runners[jobs_dir] = EvaluationJobRunner(jobs_dir)
+        return _runners[jobs_dir]
@@ -0,0 +1,79 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import numpy as np
+from scipy import sparse
+
+NUM_HASH_FEATURES = 2 ** 18
+CHAR_NGRAM = 4
+MAX_CHARS_PER_TEXT = 500  # texts are represented by their prefix
+MAX_CANDIDATES = 5000  # larger inputs are subsampled before the selection
+
+
+def hashed_tfidf_vectors(texts, num_features=NUM_HASH_FEATURES):
+    """
+    l2 normalized TF-IDF vectors of character n-grams, hashed into a fixed number of features. The n-grams of all the
+    texts are hashed at once over a single byte buffer.
+    """
+    encoded = [t.lower().encode("utf-8", "ignore")[:MAX_CHARS_PER_TEXT] if isinstance(t, str) else b""
+               for t in texts]
+    lengths = np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded))
+    buffer = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+    num_ngrams = np.maximum(lengths - CHAR_NGRAM + 1, 0)
+    total = int(num_ngrams.sum())
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+    rows = np.repeat(np.arange(len(texts)), num_ngrams)
+    positions = np.repeat(starts, num_ngrams) + np.arange(total) - np.repeat(np.cumsum(num_ngrams) - num_ngrams,
+                                                                             num_ngrams)
+    codes = np.zeros(total, dtype=np.uint64)
+    for k in range(CHAR_NGRAM):
+        codes = codes * np.uint64(257) + buffer[positions + k]
+    cols = ((codes * np.uint64(2654435761)) >> np.uint64(7)) % np.uint64(num_features)
+
+    tf = sparse.csr_matrix((np.ones(total, dtype=np.float32), (rows, cols.astype(np.int64))),
+                           shape=(len(texts), num_features))
+    tf.sum_duplicates()
+    tf.data = 1 + np.log(tf.data)  # sublinear tf
+    df = np.bincount(tf.indices, minlength=num_features)
+    idf = (np.log((1 + len(texts)) / (1 + df)) + 1).astype(np.float32)
+    tf.data *= idf[tf.indices]
+    squared_norms = np.zeros(len(texts), dtype=np.float32)
+    non_empty_rows = np.diff(tf.indptr) > 0
+    squared_norms[non_empty_rows] = np.add.reduceat(tf.data ** 2, tf.indptr[:-1][non_empty_rows])
+    norms = np.sqrt(squared_norms)
+    norms[norms == 0] = 1
+    tf.data /= np.repeat(norms, np.diff(tf.indptr))
+    return tf
+
+
+def select_diverse_examples(texts, k, random_state=0):
+    """
+    pick k texts that are diverse and representative: the first is the text closest to the centroid of all texts
+    (the medoid proxy), and the following are chosen by greedy k-center, i.e. each time the text that is the least
+    similar to the texts already selected. Returns the indices of the selected texts.
+    """
+    num_texts = len(texts)
+    if num_texts <= k:
+        return list(range(num_texts))
+
+    candidates = np.arange(num_texts)
+    if num_texts > MAX_CANDIDATES:
+        candidates = np.sort(np.random.default_rng(random_state).choice(num_texts, MAX_CANDIDATES, replace=False))
+    vectors = hashed_tfidf_vectors([texts[i] for i in candidates])
+
+    centroid = np.asarray(vectors.mean(axis=0)).ravel()
+    # empty texts are poor examples to discuss, so they are picked only when nothing else is left
+    non_empty = vectors.getnnz(axis=1) > 0
+    centrality = np.where(non_empty, vectors @ centroid, -np.inf)
+    selected = [int(np.argmax(centrality))]
+    # cosine distance of every candidate to its nearest selected text
+    min_distance = 1 - vectors @ vectors[selected[0]].toarray().ravel()
+    min_distance[~non_empty] = -1
+    while len(selected) < k:
+        min_distance[selected] = -np.inf
+        nxt = int(np.argmax(min_distance))
+        selected.append(nxt)
+        min_distance = np.minimum(min_distance, 1 - vectors @ vectors[nxt].toarray().ravel())
+    return [int(candidates[i]) for i in selected]
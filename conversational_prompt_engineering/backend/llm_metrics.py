@@ -0,0 +1,179 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from enum import Enum
+
+from conversational_prompt_engineering.backend.text_budget import estimate_num_tokens
+
+LATENCY_BUCKETS = [0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128]
+TOKEN_BUCKETS = [64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768]
+METRIC_PREFIX = "cpe_llm_call"
+
+
+class CallType(Enum):
+    ASSISTANT_TURN = "assistant_turn"
+    PARSE_REPAIR = "parse_repair"
+    SYNTAX_REPAIR = "syntax_repair"
+    TARGET_OUTPUT = "target_output"
+    COT_SIDE_CHAT = "cot_side_chat"
+    EVALUATION_CELL = "evaluation_cell"
+
+
+class StreamingHistogram:
+    """
+    cumulative bucket counts, sum and count of the observed values, in the memory of the fixed buckets
+    """
+
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        the upper bound of the bucket that holds the q quantile
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+    def prometheus_lines(self, name, labels):
+        label_str = ",".join(f'{k}="{v}"' for k, v in labels.items())
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ["+Inf"], self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{label_str},le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{label_str}}} {self.sum}")
+        lines.append(f"{name}_count{{{label_str}}} {self.count}")
+        return lines
+
+
+class LLMMetrics:
+    """
+    latency and token histograms, and error counts, of the LLM calls of the process per call type and model
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}  # (metric, call_type, model) -> StreamingHistogram
+        self.errors = {}  # (call_type, model) -> count
+
+    def _histogram(self, metric, call_type, model, buckets):
+        key = (metric, call_type, model)
+        if key not in self.histograms:
+            self.histograms[key] = StreamingHistogram(buckets)
+        return self.histograms[key]
+
+    def observe_call(self, call_type, model, latency, prompt_tokens, output_tokens, error=False):
+        call_type = CallType(call_type).value
+        with self._lock:
+            self._histogram("latency_seconds", call_type, model, LATENCY_BUCKETS).observe(latency)
+            self._histogram("prompt_tokens", call_type, model, TOKEN_BUCKETS).observe(prompt_tokens)
+            self._histogram("output_tokens", call_type, model, TOKEN_BUCKETS).observe(output_tokens)
+            if error:
+                self.errors[(call_type, model)] = self.errors.get((call_type, model), 0) + 1
+
+    def to_prometheus_text(self):
+        with self._lock:
+            lines = []
+            for metric in ["latency_seconds", "prompt_tokens", "output_tokens"]:
+                name = f"{METRIC_PREFIX}_{metric}"
+                lines.append(f"# TYPE {name} histogram")
+                for (m, call_type, model), histogram in sorted(self.histograms.items()):
+                    if m == metric:
+                        lines += histogram.prometheus_lines(name, {"call_type": call_type, "model": model})
+            lines.append(f"# TYPE {METRIC_PREFIX}_errors_total counter")
+            for (call_type, model), count in sorted(self.errors.items()):
+                lines.append(f'{METRIC_PREFIX}_errors_total{{call_type="{call_type}",model="{model}"}} {count}')
+            return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        """
+        write the metrics in the Prometheus text format (e.g. for the node exporter textfile collector)
+        """
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.to_prometheus_text())
+        os.replace(tmp_path, path)
+
+
+_llm_metrics = LLMMetrics()
+
+
+def get_llm_metrics():
+    return _llm_metrics
+
+
+class SessionTimeline:
+    """
+    the LLM calls of a single session, in the order they started
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.events = []
+
+    def add_call(self, call_type, model, start_time, latency, prompt_tokens, output_tokens, error=None):
+        event = {"call_type": CallType(call_type).value, "model": model,
+                 "start_time": time.strftime("%d-%m-%Y %H:%M:%S", time.localtime(start_time)),
+                 "start_timestamp": start_time, "latency": latency, "prompt_tokens": prompt_tokens,
+                 "output_tokens": output_tokens}
+        if error is not None:
+            event["error"] = error
+        with self._lock:
+            self.events.append(event)
+
+    def save(self, path):
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w") as f:
+            json.dump(events, f)
+
+
+def observe_batch(call_type, client, prompts, fn, timeline=None):
+    """
+    run fn, the call of the model of client with prompts that returns the generated texts, and record it in the
+    metrics of the process, and in the timeline of the session if one is given, also when it fails. A batch of prompts
+    is recorded as a single call.
+    """
+    call_type = CallType(call_type)
+    model = client.parameters['model_id']
+    start_time = time.time()
+    generated_texts, error = [], None
+    try:
+        generated_texts = fn()
+        return generated_texts
+    except Exception as e:
+        error = str(e) or type(e).__name__
+        raise
+    finally:
+        elapsed_time = time.time() - start_time
+        prompt_tokens = sum(estimate_num_tokens(p, client.parameters) for p in prompts)
+        output_tokens = sum(estimate_num_tokens(t, client.parameters) for t in generated_texts if t is not None)
+        get_llm_metrics().observe_call(call_type, model, elapsed_time, prompt_tokens, output_tokens,
+                                       error=error is not None)
+        if timeline is not None:
+            timeline.add_call(call_type, model, start_time, elapsed_time, prompt_tokens, output_tokens, error)
+        logging.info(f"{call_type.value} call to {model} with {len(prompts)} prompts took {elapsed_time:.2f} seconds "
+                     f"({prompt_tokens} prompt tokens, {output_tokens} output tokens)")
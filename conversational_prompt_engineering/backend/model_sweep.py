@@ -0,0 +1,155 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from conversational_prompt_engineering.backend.llm_metrics import CallType, get_llm_metrics, observe_batch
+from conversational_prompt_engineering.backend.prompt_building_util import TargetModelHandler
+from conversational_prompt_engineering.backend.reference_scoring import score_pairs
+from conversational_prompt_engineering.backend.text_budget import estimate_num_tokens, fit_text_to_model
+
+AGREEMENT_METRIC = "rougeL_f1"
+AGREEMENT_TOLERANCE = 0.05  # a model passes if its agreement is at most this much below the agreement of the target
+BATCH_SIZE = 8
+NUM_EVAL_TEXTS = 20
+
+
+def create_sweep_clients(llm_client_class):
+    """
+    a client for every model that has a prompt format. Models that cannot be created (e.g. not available for the
+    credentials) are skipped.
+    """
+    from conversational_prompt_engineering.backend.chat_manager_util import create_model_client
+
+    clients = {}
+    for model in TargetModelHandler().get_models():
+        try:
+            clients[model["full_name"]] = create_model_client(model["short_name"], llm_client_class)
+        except Exception as e:
+            logging.warning(f"model {model['full_name']} is skipped in the sweep: {e}")
+    return clients
+
+
+class ModelSweep:
+
+    def __init__(self, clients, target_model_id, batch_size=BATCH_SIZE, tolerance=AGREEMENT_TOLERANCE, timeline=None):
+        self.clients = clients
+        self.target_model_id = target_model_id
+        self.batch_size = batch_size
+        self.tolerance = tolerance
+        self.timeline = timeline
+
+    def _generate_all(self, model_id, prompt, texts):
+        """
+        the outputs of a model for all the texts, and the per-call latency and estimated tokens
+        """
+        client = self.clients[model_id]
+        model_params = client.parameters
+        template = TargetModelHandler().build_template(model_id, prompt, [])
+        prompt_strs = template.render_many([fit_text_to_model(t, model_params) for t in texts])
+        outputs = []
+        start_time = time.time()
+        for begin in range(0, len(prompt_strs), self.batch_size):
+            batch = prompt_strs[begin:begin + self.batch_size]
+            outputs += observe_batch(CallType.TARGET_OUTPUT, client, batch,
+                                     lambda: client.send_messages_batch(batch)[0], self.timeline)
+        return outputs, {
+            "latency_per_call": (time.time() - start_time) / max(len(texts), 1),
+            "prompt_tokens_per_call": float(np.mean([estimate_num_tokens(p, model_params) for p in prompt_strs])),
+            "output_tokens_per_call": float(np.mean([estimate_num_tokens(o, model_params) for o in outputs]))
+            if outputs else 0.0,
+            # models without a price in model_params.json are compared by their number of tokens
+            "cost_per_1k_tokens": model_params.get("cost_per_1k_tokens", 1.0),
+        }
+
+    def sweep(self, prompt, examples, accepted_outputs, eval_texts=()):
+        """
+        run the zero-shot prompt with every model, concurrently, over the discussed examples and the eval texts.
+        Agreement is measured against the accepted outputs, and, on the eval texts, against the outputs of the
+        target model of the conversation. Returns the table of models and the cheapest model that passes.
+        """
+        start_time = time.time()
+        discussed = [(t, o) for t, o in zip(examples, accepted_outputs) if o is not None]
+        texts = [t for t, _ in discussed] + list(eval_texts)
+        with ThreadPoolExecutor(max_workers=max(len(self.clients), 1)) as executor:
+            futures = {model_id: executor.submit(self._generate_all, model_id, prompt, texts)
+                       for model_id in self.clients}
+        results = {}
+        for model_id, f in futures.items():
+            try:
+                results[model_id] = f.result()
+            except Exception as e:
+                logging.warning(f"model {model_id} failed in the sweep: {e}")
+                results[model_id] = (None, {"error": str(e)})
+
+        target_outputs = results.get(self.target_model_id, (None,))[0]
+        rows = []
+        for model_id, (outputs, stats) in results.items():
+            row = {"model": model_id, "accepted_agreement": np.nan, "cost_per_call": np.nan, **stats}
+            if outputs is not None:
+                row["accepted_agreement"] = self._agreement(outputs[:len(discussed)], [o for _, o in discussed])
+                if eval_texts and target_outputs is not None:
+                    row["eval_agreement"] = self._agreement(outputs[len(discussed):], target_outputs[len(discussed):])
+                row["tokens_per_call"] = stats["prompt_tokens_per_call"] + stats["output_tokens_per_call"]
+                row["cost_per_call"] = row["tokens_per_call"] / 1000 * stats["cost_per_1k_tokens"]
+            rows.append(row)
+        table = pd.DataFrame(rows).sort_values("cost_per_call", kind="stable", na_position="last") \
+            .reset_index(drop=True)
+        bar = table.loc[table["model"] == self.target_model_id, "accepted_agreement"]
+        bar = (bar.iloc[0] if len(bar) and pd.notna(bar.iloc[0]) else table["accepted_agreement"].max()) \
+            - self.tolerance
+        table["passed"] = table["accepted_agreement"].fillna(-1) >= bar
+        best = table[table["passed"]].iloc[0].to_dict() if table["passed"].any() else None
+        logging.info(f"model sweep of {len(self.clients)} models over {len(texts)} texts took "
+                     f"{time.time() - start_time:.1f} seconds, cheapest passing model: {best and best['model']}")
+        return table, best
+
+    @staticmethod
+    def _agreement(outputs, references):
+        if not references:
+            return np.nan
+        return float(score_pairs(outputs, references)[AGREEMENT_METRIC].mean())
+
+
+def save_sweep_results(table, best, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    table.to_csv(os.path.join(out_dir, "model_sweep.csv"), index=False)
+    with open(os.path.join(out_dir, "model_sweep.json"), "w") as f:
+        json.dump({"best_model": best and best["model"],
+                   "models": json.loads(table.to_json(orient="records"))}, f)
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--chat_dir', help='output dir of a finished chat (contains chat_result.json)')
+parser.add_argument('--eval_path', help='path for a csv file with more texts to compare the models on')
+parser.add_argument('--num_eval_texts', type=int, default=NUM_EVAL_TEXTS)
+parser.add_argument('--llm_client', default='WatsonXClient', help='name of the llm client class')
+parser.add_argument('--tolerance', type=float, default=AGREEMENT_TOLERANCE)
+
+
+if __name__ == "__main__":
+    from conversational_prompt_engineering.backend.util.llm_clients.llm_clients_loader import get_client_classes
+    from conversational_prompt_engineering.data.dataset_access import read_texts
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    args = parser.parse_args()
+    with open(os.path.join(args.chat_dir, "chat_result.json"), "r") as f:
+        chat_result = json.load(f)
+    eval_texts = read_texts(args.eval_path, nrows=args.num_eval_texts) if args.eval_path else []
+    model_sweep = ModelSweep(create_sweep_clients(get_client_classes([args.llm_client])[0]),
+                             chat_result["target_model"], tolerance=args.tolerance)
+    table, best = model_sweep.sweep(chat_result["prompts"][-1], chat_result["examples"],
+                                    chat_result["accepted_outputs"], eval_texts)
+    save_sweep_results(table, best, os.path.join(args.chat_dir, "model_sweep"))
+    get_llm_metrics().export(os.path.join(args.chat_dir, "model_sweep", "metrics.prom"))
+    logging.info(table.to_string())
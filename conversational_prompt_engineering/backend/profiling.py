@@ -0,0 +1,136 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from enum import Enum
+
+NUM_PROFILE_LINES = 40
+
+
+class ProfilingMode(Enum):
+    OFF = "off"
+    SPANS = "spans"  # span timings only, cheap enough to be always on
+    CPROFILE = "cprofile"  # span timings and a cProfile of every turn
+
+
+class SpanCategory(Enum):
+    LLM = "llm"
+    DISK = "disk"
+    CPU = "cpu"
+
+
+def _union_length(intervals):
+    total, current_start, current_end = 0.0, None, None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+class Turn:
+
+    def __init__(self, name):
+        self.name = name
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+        self.spans = []  # (name, category, start, end), appended from any thread
+
+    def add_span(self, name, category, start, end):
+        self.spans.append((name, category, start, end))
+
+    def breakdown(self):
+        """
+        the wall-clock time of the turn split into waiting for the LLM, disk and the rest (local CPU). Spans that
+        overlap (e.g. concurrent LLM calls) are counted once, and disk time that overlaps LLM time is counted as LLM.
+        """
+        wall = self.end - self.start
+        llm_intervals = [(s, e) for _, c, s, e in self.spans if c == SpanCategory.LLM]
+        disk_intervals = [(s, e) for _, c, s, e in self.spans if c == SpanCategory.DISK]
+        llm = _union_length(llm_intervals)
+        disk = _union_length(llm_intervals + disk_intervals) - llm
+        span_totals = {}
+        for name, _, s, e in self.spans:
+            count, total = span_totals.get(name, (0, 0.0))
+            span_totals[name] = (count + 1, total + e - s)
+        return {"name": self.name, "start_time": self.start_time, "wall": wall, "llm": llm, "disk": disk,
+                "cpu": max(wall - llm - disk, 0.0),
+                "spans": {name: {"count": c, "total": t} for name, (c, t) in span_totals.items()}}
+
+
+class TurnProfiler:
+    """
+    records the spans of each turn of a session, and writes a wall-clock breakdown per turn to
+    profiling/turns.jsonl in the output dir. In cprofile mode, the turn is also profiled, and the profile is saved
+    next to it. A turn that starts inside another turn is recorded as a span of the outer turn.
+    """
+
+    def __init__(self, out_dir, mode=ProfilingMode.SPANS):
+        self.out_dir = os.path.join(out_dir, "profiling")
+        self.mode = ProfilingMode(mode)
+        self._lock = threading.Lock()
+        self._turn = None
+        self.num_turns = 0
+
+    @contextmanager
+    def turn(self, name):
+        with self._lock:
+            is_outer = self.mode != ProfilingMode.OFF and self._turn is None
+            if is_outer:
+                self._turn = Turn(name)
+        if not is_outer:
+            with self.span(name):
+                yield
+            return
+
+        profile = cProfile.Profile() if self.mode == ProfilingMode.CPROFILE else None
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            turn, self._turn = self._turn, None
+            turn.end = time.perf_counter()
+            self._save(turn, profile)
+
+    @contextmanager
+    def span(self, name, category=None):
+        turn = self._turn
+        if turn is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            turn.add_span(name, category, start, time.perf_counter())
+
+    def _save(self, turn, profile):
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.num_turns += 1
+        file_prefix = os.path.join(self.out_dir, f"turn_{self.num_turns:04d}_{turn.name}")
+        with open(os.path.join(self.out_dir, "turns.jsonl"), "a") as f:
+            f.write(json.dumps({"turn": self.num_turns, **turn.breakdown()}) + "\n")
+        if profile is not None:
+            profile.dump_stats(f"{file_prefix}.prof")
+            stream = io.StringIO()
+            pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(NUM_PROFILE_LINES)
+            with open(f"{file_prefix}.txt", "w") as f:
+                f.write(stream.getvalue())
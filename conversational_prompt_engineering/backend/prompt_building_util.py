@@ -5,6 +5,12 @@
 
 import json
 import os.path
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+from conversational_prompt_engineering.backend.text_budget import estimate_num_tokens, get_text_token_budget
 
 LLAMA_END_OF_MESSAGE = "<|eot_id|>"
 
@@ -14,14 +20,83 @@ LLAMA_START_OF_INPUT = '<|begin_of_text|>'
 def _get_llama_header(role):
     return "<|start_header_id|>" + role + "<|end_header_id|>"
 
+TEXT_SLOT = "{text}"
+
+PROMPT_FORMAT_KEYS = ['start_of_input', 'system_message', 'prompt_prefix', 'prompt_suffix', 'few_shot_examples_prefix',
+                      'test_example_prefix', 'test_example_placeholder', 'end_of_message', 'input_prefix',
+                      'output_prefix', 'end_of_input']
+
+SINGLE_SHOT_INTRO = "Here is an example of a typical text and its desired output."
+MULTIPLE_SHOTS_INTRO = "Here are some typical text examples and their corresponding desired outputs."
+
+
+class PromptTemplate:
+    """
+    a formatted prompt split around the slot of the test text. The prefix (instruction and few-shot examples) is
+    built once, and rendering a text is a concatenation, so braces in the prompt or the texts are kept as is.
+    """
+    __slots__ = ("prefix", "suffix")
+
+    def __init__(self, prefix, suffix):
+        self.prefix = prefix
+        self.suffix = suffix
+
+    @classmethod
+    def from_format_string(cls, prompt_str):
+        """
+        split a prompt that was formatted by format_prompt at its test text slot
+        """
+        prefix, _, suffix = prompt_str.rpartition(TEXT_SLOT)
+        if not _:
+            raise ValueError("prompt does not contain a {text} slot")
+        return cls(prefix, suffix)
+
+    def render(self, text):
+        return self.prefix + text + self.suffix
+
+    def render_many(self, texts):
+        prefix, suffix = self.prefix, self.suffix
+        return [prefix + text + suffix for text in texts]
+
+    def __str__(self):
+        return self.prefix + TEXT_SLOT + self.suffix
+
+
+class CompiledPromptFormat:
+    """
+    the prompt_formats of a model, with the fixed parts of the instruction, the few-shot examples and the test
+    example concatenated once
+    """
+
+    def __init__(self, model_vars):
+        v = {key: model_vars.get(key, '') for key in PROMPT_FORMAT_KEYS}
+        placeholder_begin, _, placeholder_end = v['test_example_placeholder'].partition(TEXT_SLOT)
+        self.instruction_begin = v['start_of_input'] + v['system_message'] + v['prompt_prefix']
+        self.instruction_end = v['prompt_suffix'] + "\n\n"
+        self.few_shot_examples_prefix = v['few_shot_examples_prefix']
+        self.test_example_prefix = v['test_example_prefix']
+        self.shot_text_begin = "\n\n" + v['input_prefix'] + placeholder_begin
+        self.shot_text_end = placeholder_end + v['end_of_message'] + v['output_prefix']
+        self.shot_output_end = v['end_of_message']
+        self.test_text_begin = v['input_prefix'] + placeholder_begin
+        self.test_text_end = placeholder_end + v['end_of_message'] + v['output_prefix'] + v['end_of_input']
+
+
 class TargetModelHandler:
     _instance = None
+    _instance_lock = threading.Lock()
 
     def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            with open(os.path.join(os.path.dirname(__file__), "prompt_formats.json"), 'r') as f:
-                cls._instance.data = json.load(f)
+        # sessions run in concurrent threads, so the instance is published only once it is fully initialized
+        with cls._instance_lock:
+            if cls._instance is None:
+                instance = super().__new__(cls)
+                with open(os.path.join(os.path.dirname(__file__), "prompt_formats.json"), 'r') as f:
+                    instance.data = json.load(f)
+                instance.compiled_formats = {model: CompiledPromptFormat(model_data['prompt_formats'])
+                                             for model, model_data in instance.data.items()
+                                             if 'prompt_formats' in model_data}
+                cls._instance = instance
         return cls._instance
 
     def get_models(self):
@@ -30,38 +105,121 @@ class TargetModelHandler:
                                             model_names]
         return model_short_names_and_full_names
 
-    def format_prompt(self, model, prompt, texts_and_outputs):
-        if 'prompt_formats' not in self.data[model]:
+    def format_prompt(self, model, prompt, texts_and_outputs, model_params=None, expected_text_tokens=None):
+        """
+        with model_params, only the few-shot examples that fit the context of the model are included
+        (see select_shots)
+        """
+        if model_params is not None:
+            texts_and_outputs = self.select_shots(model, prompt, texts_and_outputs, model_params, expected_text_tokens)
+        return str(self.build_template(model, prompt, texts_and_outputs))
+
+    def get_prompt_budget(self, model_params, expected_text_tokens=None):
+        """
+        the number of tokens the prompt may take without the test text, so that the prompt, a test text of
+        expected_text_tokens and the output fit max_total_tokens. By default, the test text is expected to take its
+        whole budget (see text_budget).
+        """
+        if expected_text_tokens is None:
+            expected_text_tokens = get_text_token_budget(model_params)
+        return model_params['max_total_tokens'] - model_params['max_new_tokens'] - expected_text_tokens
+
+    def select_shots(self, model, prompt, texts_and_outputs, model_params, expected_text_tokens=None):
+        """
+        choose the few-shot examples to include within the prompt budget. If all of them fit, they are all kept.
+        Otherwise they are picked greedily by diversity per token: the first is the most central example that fits, and each
+        following one is the example that adds the most distance from the examples already picked per token of its
+        cost, among the ones that still fit. The picked examples keep their original order.
+        """
+        shots = list(texts_and_outputs)
+        budget = self.get_prompt_budget(model_params, expected_text_tokens)
+        if not shots or self.estimate_prompt_tokens(model, prompt, shots, model_params) <= budget:
+            return shots
+
+        from conversational_prompt_engineering.backend.example_selection import hashed_tfidf_vectors
+
+        compiled = self.compiled_formats[model]
+        fixed_cost = self.estimate_prompt_tokens(model, prompt, [], model_params) + estimate_num_tokens(
+            MULTIPLE_SHOTS_INTRO + compiled.test_example_prefix, model_params)
+        costs = np.array([estimate_num_tokens(compiled.few_shot_examples_prefix + compiled.shot_text_begin +
+                                              shot['text'] + compiled.shot_text_end + shot['output'] +
+                                              compiled.shot_output_end, model_params) for shot in shots], dtype=float)
+        vectors = hashed_tfidf_vectors([shot['text'] + "\n" + shot['output'] for shot in shots])
+        similarities = (vectors @ vectors.T).toarray()
+        gain = similarities.mean(axis=1)  # centrality, for the first example
+        selected = []
+        remaining = budget - fixed_cost
+        available = np.ones(len(shots), dtype=bool)
+        while True:
+            available &= costs <= remaining
+            if not available.any():
+                break
+            # the first example is picked by centrality alone, the following ones by gain per token
+            value = gain if not selected else (gain + 1e-6) / np.maximum(costs, 1)
+            scores = np.where(available, value, -np.inf)
+            nxt = int(np.argmax(scores))
+            selected.append(nxt)
+            available[nxt] = False
+            remaining -= costs[nxt]
+            distance = 1 - similarities[nxt]
+            gain = distance if len(selected) == 1 else np.minimum(gain, distance)
+        return [shots[i] for i in sorted(selected)]
+
+    def estimate_prompt_tokens(self, model, prompt, texts_and_outputs, model_params):
+        """
+        the estimated number of tokens of the formatted prompt, without the test text
+        """
+        template = self.build_template(model, prompt, texts_and_outputs)
+        return estimate_num_tokens(template.prefix + template.suffix, model_params)
+
+    def get_prompt_token_costs(self, model_params, prompt, texts_and_outputs, expected_text_tokens=None):
+        """
+        the per-call prompt tokens of the zero-shot and the budgeted few-shot prompts, with a test text of
+        expected_text_tokens
+        """
+        model = model_params['model_id']
+        if expected_text_tokens is None:
+            expected_text_tokens = get_text_token_budget(model_params)
+        shots = self.select_shots(model, prompt, texts_and_outputs, model_params, expected_text_tokens)
+        return {
+            "expected_text_tokens": expected_text_tokens,
+            "prompt_budget": self.get_prompt_budget(model_params, expected_text_tokens),
+            "zero_shot": self.estimate_prompt_tokens(model, prompt, [], model_params) + expected_text_tokens,
+            "few_shot": self.estimate_prompt_tokens(model, prompt, shots, model_params) + expected_text_tokens,
+            "num_shots": len(shots),
+            "num_shots_available": len(texts_and_outputs),
+        }
+
+    def build_template(self, model, prompt, texts_and_outputs):
+        shots = tuple((item['text'], item['output']) for item in texts_and_outputs)
+        return self._build_template(model, prompt, shots)
+
+    @lru_cache(maxsize=256)
+    def _build_template(self, model, prompt, shots):
+        if model not in self.compiled_formats:
             raise Exception(f"prompt format is not defined for model {model}")
-        model_vars = self.data[model]['prompt_formats']
-        prompt = self.build_instruction(model_vars, prompt)
-        if len(texts_and_outputs) > 0:
-            if len(texts_and_outputs) > 1:  # we already have at least two approved summary examples
-                prompt += "Here are some typical text examples and their corresponding desired outputs."
-            else:
-                prompt += "Here is an example of a typical text and its desired output."
-            for i, item in enumerate(texts_and_outputs):
+        compiled = self.compiled_formats[model]
+        parts = [compiled.instruction_begin, prompt, compiled.instruction_end]
+        if len(shots) > 0:
+            parts.append(MULTIPLE_SHOTS_INTRO if len(shots) > 1 else SINGLE_SHOT_INTRO)
+            for i, (text, output) in enumerate(shots):
                 if i > 0:
-                    prompt += model_vars.get('few_shot_examples_prefix', '')
-                text = item['text']
-                output = item['output']
-                prompt += self.build_icl_example(model_vars, output, text)
-            prompt += model_vars.get('test_example_prefix', '')
-        prompt += self.build_test_example(model_vars)
-        return prompt
-
-    def build_test_example(self, model_vars):
-        return f"{model_vars.get('input_prefix', '')}" + model_vars.get('test_example_placeholder',
-                                                                        '') + f"{model_vars.get('end_of_message', '')}" \
-               + f"{model_vars.get('output_prefix', '')}{model_vars.get('end_of_input', '')}"
-
-    def build_icl_example(self, model_vars, output, text):
-        return f"\n\n{model_vars.get('input_prefix', '')}{model_vars.get('test_example_placeholder', '').format(text=text)}{model_vars.get('end_of_message', '')}" \
-               f"{model_vars.get('output_prefix', '')}{output}{model_vars.get('end_of_message', '')}"
-
-    def build_instruction(self, model_vars, prompt):
-        return ''.join([model_vars.get('start_of_input', ''), model_vars.get('system_message', ''),
-                        model_vars.get('prompt_prefix', ''), prompt, model_vars.get('prompt_suffix', '') + "\n\n"])
+                    parts.append(compiled.few_shot_examples_prefix)
+                parts += [compiled.shot_text_begin, text, compiled.shot_text_end, output, compiled.shot_output_end]
+            parts.append(compiled.test_example_prefix)
+        parts.append(compiled.test_text_begin)
+        return PromptTemplate(''.join(parts), compiled.test_text_end)
+
+    def render_many(self, model, prompt, shots, texts):
+        """
+        format the prompt with the few-shot examples in shots (a list of {'text', 'output'} dicts) for each of texts
+        """
+        return self.build_template(model, prompt, shots).render_many(texts)
+
+
+@lru_cache(maxsize=256)
+def get_prompt_template(prompt_str):
+    return PromptTemplate.from_format_string(prompt_str)
 
 
 def remove_tags_from_zero_shot_prompt(prompt, model_type):
@@ -0,0 +1,167 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import argparse
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from conversational_prompt_engineering.backend.example_selection import select_diverse_examples
+from conversational_prompt_engineering.backend.llm_metrics import CallType, get_llm_metrics, observe_batch
+from conversational_prompt_engineering.backend.prompt_building_util import TargetModelHandler
+from conversational_prompt_engineering.backend.reference_scoring import score_pairs
+from conversational_prompt_engineering.backend.text_budget import DEFAULT_CHARS_PER_TOKEN, estimate_num_tokens, \
+    fit_text_to_model, truncate_text
+
+SHORTENED_TEXT_RATIOS = [0.5, 0.25]
+FIDELITY_METRIC = "rougeL_f1"
+FIDELITY_TOLERANCE = 0.05  # a variant passes if its fidelity is at most this much below the fidelity of the full prompt
+MAX_WORKERS = 8
+
+_sentence_end_pattern = re.compile(r"((?<=[.!?])\s+|\n+)")
+_non_alnum_pattern = re.compile(r"[^a-z0-9]+")
+
+
+def deduplicate_instruction(instruction):
+    """
+    remove the sentences of the instruction that are equal (after normalization) to a sentence that appeared before
+    them, keeping the line breaks and paragraphs of the instruction
+    """
+    parts = _sentence_end_pattern.split(instruction)  # sentence, separator, sentence, ...
+    seen = set()
+    kept = []
+    separator = ""
+    for i in range(0, len(parts), 2):
+        sentence = parts[i]
+        normalized = _non_alnum_pattern.sub(" ", sentence.lower()).strip()
+        if not normalized or normalized in seen:
+            # the separator of a removed sentence is merged with the next one, keeping the stronger break
+            if i + 1 < len(parts):
+                separator = max(separator, parts[i + 1], key=lambda sep: sep.count("\n"))
+            continue
+        seen.add(normalized)
+        kept.append((separator if kept else "") + sentence)
+        separator = parts[i + 1] if i + 1 < len(parts) else ""
+    return "".join(kept)
+
+
+def shorten_shots(shots, ratio, model_params):
+    chars_per_token = model_params.get('chars_per_token', DEFAULT_CHARS_PER_TOKEN)
+    return [{'text': truncate_text(shot['text'], max(1, int(estimate_num_tokens(shot['text'], model_params) * ratio)),
+                                   chars_per_token),
+             'output': shot['output']} for shot in shots]
+
+
+def build_variants(instruction, shots, model_params):
+    """
+    compressed variants of the few-shot prompt, as (name, instruction, shots) tuples. The first one is the full
+    prompt. Variants that are identical to a variant before them are skipped.
+    """
+    dedup = deduplicate_instruction(instruction)
+    variants = [("few_shot", instruction, shots), ("dedup_instruction", dedup, shots)]
+    for ratio in SHORTENED_TEXT_RATIOS:
+        variants.append((f"shortened_texts_{int(ratio * 100)}", dedup, shorten_shots(shots, ratio, model_params)))
+    for k in range(len(shots) - 1, 0, -1):
+        selected = sorted(select_diverse_examples([shot['text'] for shot in shots], k))
+        trimmed = [shots[i] for i in selected]
+        variants.append((f"trimmed_shots_{k}", dedup, trimmed))
+        variants.append((f"trimmed_shots_{k}_shortened_texts_{int(SHORTENED_TEXT_RATIOS[0] * 100)}", dedup,
+                         shorten_shots(trimmed, SHORTENED_TEXT_RATIOS[0], model_params)))
+    variants.append(("zero_shot", dedup, []))
+
+    unique = []
+    for name, variant_instruction, variant_shots in variants:
+        if all(variant_instruction != i or variant_shots != s for _, i, s in unique):
+            unique.append((name, variant_instruction, variant_shots))
+    return unique
+
+
+class PromptCompression:
+
+    def __init__(self, llm_client, tolerance=FIDELITY_TOLERANCE, max_workers=MAX_WORKERS, timeline=None):
+        self.llm_client = llm_client
+        self.tolerance = tolerance
+        self.max_workers = max_workers
+        self.timeline = timeline
+
+    def _generate(self, prompt_strs):
+        return observe_batch(CallType.TARGET_OUTPUT, self.llm_client, prompt_strs,
+                             lambda: self.llm_client.send_messages_batch(prompt_strs)[0], self.timeline)
+
+    def compress(self, instruction, examples, accepted_outputs):
+        """
+        regenerate the outputs of the discussed examples with every variant and compare them with the accepted
+        outputs. Returns the token count vs. fidelity table (sorted by tokens) and the cheapest variant that passes.
+        """
+        start_time = time.time()
+        model_params = self.llm_client.parameters
+        model = model_params['model_id']
+        shots = [{'text': t, 'output': o} for t, o in zip(examples, accepted_outputs) if o is not None]
+        validation_texts = [t for t, o in zip(examples, accepted_outputs) if o is not None]
+        references = [o for o in accepted_outputs if o is not None]
+        fitted_texts = [fit_text_to_model(t, model_params) for t in validation_texts]
+        variants = build_variants(instruction, shots, model_params)
+
+        handler = TargetModelHandler()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._generate, handler.render_many(model, i, s, fitted_texts))
+                       for _, i, s in variants]
+            outputs = [f.result() for f in futures]
+
+        rows = []
+        for (name, variant_instruction, variant_shots), variant_outputs in zip(variants, outputs):
+            scores = score_pairs(variant_outputs, references)
+            rows.append({"variant": name, "num_shots": len(variant_shots),
+                         "prompt_tokens": handler.estimate_prompt_tokens(model, variant_instruction, variant_shots,
+                                                                         model_params),
+                         "fidelity": float(scores[FIDELITY_METRIC].mean()) if len(scores) else 0.0,
+                         "prompt": handler.format_prompt(model, variant_instruction, variant_shots)})
+        table = pd.DataFrame(rows)
+        table["token_saving"] = 1 - table["prompt_tokens"] / table["prompt_tokens"].iloc[0]
+        table["passed"] = table["fidelity"] >= table["fidelity"].iloc[0] - self.tolerance
+        table = table.sort_values("prompt_tokens", kind="stable").reset_index(drop=True)
+        best = table[table["passed"]].iloc[0].to_dict()
+        logging.info(f"prompt compression of {len(variants)} variants took {time.time() - start_time:.1f} seconds, "
+                     f"cheapest passing variant: {best['variant']} ({best['prompt_tokens']} tokens)")
+        return table, best
+
+
+def save_compression_results(table, best, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    table.to_csv(os.path.join(out_dir, "prompt_compression.csv"), index=False)
+    with open(os.path.join(out_dir, "compressed_prompt.txt"), "w") as f:
+        f.write(best["prompt"])
+    summary = table.drop(columns=["prompt"]).to_dict("records")
+    with open(os.path.join(out_dir, "prompt_compression.json"), "w") as f:
+        json.dump({"best_variant": best["variant"], "variants": summary}, f)
+    return summary
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--chat_dir', help='output dir of a finished chat (contains chat_result.json)')
+parser.add_argument('--model', default='llama-3', help='short name of the target model in model_params.json')
+parser.add_argument('--llm_client', default='WatsonXClient', help='name of the llm client class')
+parser.add_argument('--tolerance', type=float, default=FIDELITY_TOLERANCE)
+
+
+if __name__ == "__main__":
+    from conversational_prompt_engineering.backend.chat_manager_util import create_model_client
+    from conversational_prompt_engineering.backend.util.llm_clients.llm_clients_loader import get_client_classes
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    args = parser.parse_args()
+    with open(os.path.join(args.chat_dir, "chat_result.json"), "r") as f:
+        chat_result = json.load(f)
+    client = create_model_client(args.model, get_client_classes([args.llm_client])[0])
+    table, best = PromptCompression(client, tolerance=args.tolerance).compress(
+        chat_result["prompts"][-1], chat_result["examples"], chat_result["accepted_outputs"])
+    save_compression_results(table, best, os.path.join(args.chat_dir, "compression"))
+    get_llm_metrics().export(os.path.join(args.chat_dir, "compression", "metrics.prom"))
+    logging.info(table.drop(columns=["prompt"]).to_string())
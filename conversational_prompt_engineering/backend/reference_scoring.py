@@ -0,0 +1,239 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import argparse
+import json
+import logging
+import os
+import re
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from conversational_prompt_engineering.data.dataset_access import read_dataset
+
+REFERENCE_COLUMNS = ["summary", "reference", "gold"]
+NUM_BOOTSTRAP_SAMPLES = 1000
+LCS_BATCH_SIZE = 256
+
+_token_pattern = re.compile(r"\w+")
+
+
+def tokenize(text):
+    if not isinstance(text, str):
+        return []
+    return _token_pattern.findall(text.lower())
+
+
+def find_reference_column(columns):
+    for c in REFERENCE_COLUMNS:
+        if c in columns:
+            return c
+    return None
+
+
+def _encode(token_lists):
+    """
+    map every token to an integer id shared by all texts, and return a flat id array with the per-text offsets
+    """
+    lengths = np.fromiter((len(t) for t in token_lists), dtype=np.int64, count=len(token_lists))
+    flat = [tok for tokens in token_lists for tok in tokens]
+    if len(flat) == 0:
+        return np.zeros(0, dtype=np.int64), lengths
+    _, ids = np.unique(np.array(flat), return_inverse=True)
+    return ids.astype(np.int64), lengths
+
+
+def _ngram_count_matrix(ids, lengths, n, vocab_size):
+    """
+    sparse (num_texts x num_ngrams) count matrix. N-grams are encoded as base-vocab_size integers, so counting is a
+    single sparse matrix construction for the whole run.
+    """
+    num_texts = len(lengths)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]) if num_texts else np.zeros(0, dtype=np.int64)
+    num_ngrams = np.maximum(lengths - n + 1, 0)
+    total = int(num_ngrams.sum())
+    if total == 0:
+        return sparse.csr_matrix((num_texts, 1), dtype=np.int64), num_ngrams
+    rows = np.repeat(np.arange(num_texts), num_ngrams)
+    # position of each n-gram start inside the flat id array
+    offsets = np.arange(total) - np.repeat(np.cumsum(num_ngrams) - num_ngrams, num_ngrams)
+    positions = np.repeat(starts, num_ngrams) + offsets
+    codes = np.zeros(total, dtype=np.int64)
+    for k in range(n):
+        codes = codes * vocab_size + ids[positions + k]
+    uniq_codes, cols = np.unique(codes, return_inverse=True)
+    counts = sparse.csr_matrix((np.ones(total, dtype=np.int64), (rows, cols)),
+                               shape=(num_texts, len(uniq_codes)))
+    counts.sum_duplicates()
+    return counts, num_ngrams
+
+
+def _prf(overlap, num_pred, num_ref):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(num_pred > 0, overlap / np.maximum(num_pred, 1), 0.0)
+        recall = np.where(num_ref > 0, overlap / np.maximum(num_ref, 1), 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    return precision, recall, f1
+
+
+def _padded(ids, lengths, pad_value):
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+    width = int(lengths.max()) if len(lengths) else 0
+    out = np.full((len(lengths), max(width, 1)), pad_value, dtype=np.int64)
+    mask = np.arange(out.shape[1])[None, :] < lengths[:, None]
+    gather = (starts[:, None] + np.arange(out.shape[1])[None, :])[mask]
+    out[mask] = ids[gather]
+    return out
+
+
+def _lcs_lengths(pred_ids, pred_lengths, ref_ids, ref_lengths):
+    """
+    longest common subsequence for all pairs. The DP runs one prediction position at a time for a whole batch of
+    pairs: L[i, j] = cummax_j(max(L[i-1, j], L[i-1, j-1] + match[i, j])).
+    """
+    num_pairs = len(pred_lengths)
+    result = np.zeros(num_pairs, dtype=np.int64)
+    if num_pairs == 0:
+        return result
+    pred = _padded(pred_ids, pred_lengths, -1)
+    ref = _padded(ref_ids, ref_lengths, -2)
+    # batching pairs of similar length keeps the padded DP tables small
+    order = np.argsort(pred_lengths * (ref_lengths.max() + 1) + ref_lengths, kind='stable')
+    for b in range(0, num_pairs, LCS_BATCH_SIZE):
+        batch = order[b:b + LCS_BATCH_SIZE]
+        max_pred = int(pred_lengths[batch].max())
+        max_ref = int(ref_lengths[batch].max())
+        if max_pred == 0 or max_ref == 0:
+            continue
+        p = pred[batch, :max_pred]
+        r = ref[batch, :max_ref]
+        prev = np.zeros((len(batch), max_ref + 1), dtype=np.int64)
+        for i in range(max_pred):
+            match = (r == p[:, i:i + 1])
+            cur = np.maximum(prev[:, 1:], prev[:, :-1] + match)
+            prev = np.concatenate([np.zeros((len(batch), 1), dtype=np.int64),
+                                   np.maximum.accumulate(cur, axis=1)], axis=1)
+        result[batch] = prev[np.arange(len(batch)), ref_lengths[batch]]
+    return result
+
+
+def score_pairs(predictions, references):
+    """
+    compute ROUGE-1/2/L (precision, recall and f1) and length statistics for aligned lists of generated outputs and
+    reference outputs. Returns a DataFrame with one row per pair.
+    """
+    assert len(predictions) == len(references), "predictions and references should have the same length"
+    num_pairs = len(predictions)
+    tokens = [tokenize(t) for t in predictions] + [tokenize(t) for t in references]
+    ids, lengths = _encode(tokens)
+    vocab_size = int(ids.max()) + 1 if len(ids) else 1
+    pred_lengths, ref_lengths = lengths[:num_pairs], lengths[num_pairs:]
+
+    scores = {}
+    for n in [1, 2]:
+        counts, num_ngrams = _ngram_count_matrix(ids, lengths, n, vocab_size)
+        overlap = np.asarray(counts[:num_pairs].minimum(counts[num_pairs:]).sum(axis=1)).ravel()
+        p, r, f = _prf(overlap, num_ngrams[:num_pairs], num_ngrams[num_pairs:])
+        scores.update({f"rouge{n}_precision": p, f"rouge{n}_recall": r, f"rouge{n}_f1": f})
+
+    split = int(pred_lengths.sum())
+    lcs = _lcs_lengths(ids[:split], pred_lengths, ids[split:], ref_lengths)
+    p, r, f = _prf(lcs, pred_lengths, ref_lengths)
+    scores.update({"rougeL_precision": p, "rougeL_recall": r, "rougeL_f1": f})
+
+    scores["pred_length"] = pred_lengths
+    scores["ref_length"] = ref_lengths
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores["length_ratio"] = np.where(ref_lengths > 0, pred_lengths / np.maximum(ref_lengths, 1), np.nan)
+    return pd.DataFrame(scores)
+
+
+def score_generated_data(generated_data, references, prompt_types):
+    """
+    score a whole evaluation run at once. generated_data is the list of rows produced by
+    Evaluation.generate_evaluation_examples, references maps the row text to its gold output.
+    """
+    rows = [row for row in generated_data if row["text"] in references]
+    predictions, golds, meta = [], [], []
+    for row in rows:
+        for prompt_type in prompt_types:
+            predictions.append(row.get(f"{prompt_type}_output", ""))
+            golds.append(references[row["text"]])
+            meta.append({"index": row["index"], "prompt_type": prompt_type})
+    scores = score_pairs(predictions, golds)
+    return pd.concat([pd.DataFrame(meta), scores], axis=1)
+
+
+def aggregate_with_bootstrap(scores_df, prompt_types=None, metrics=None, num_samples=NUM_BOOTSTRAP_SAMPLES,
+                             confidence=0.95, seed=0):
+    """
+    per prompt type means with bootstrap confidence intervals. Since all prompt types are evaluated over the same
+    texts, the same resampled texts are used for all of them, and all prompt types and metrics are resampled
+    together in a single vectorized pass.
+    """
+    if prompt_types is None:
+        prompt_types = list(dict.fromkeys(scores_df["prompt_type"]))
+    if metrics is None:
+        metrics = [c for c in scores_df.columns if c not in ("index", "prompt_type")]
+    table = scores_df.pivot_table(index="index", columns="prompt_type", values=metrics, aggfunc="mean")
+    texts_index = table.index
+    values = np.stack([np.stack([table[(m, pt)].to_numpy(dtype=float) if (m, pt) in table.columns
+                                 else np.full(len(texts_index), np.nan) for m in metrics], axis=1)
+                       for pt in prompt_types], axis=1)  # texts x prompt types x metrics
+
+    rng = np.random.default_rng(seed)
+    num_texts = values.shape[0]
+    sample_idx = rng.integers(0, num_texts, size=(num_samples, num_texts))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        sampled_means = np.nanmean(values[sample_idx], axis=1)  # samples x prompt types x metrics
+        means = np.nanmean(values, axis=0)
+        alpha = (1 - confidence) / 2
+        low, high = np.nanquantile(sampled_means, [alpha, 1 - alpha], axis=0)
+
+    records = []
+    for t, prompt_type in enumerate(prompt_types):
+        for m, metric in enumerate(metrics):
+            records.append({"prompt_type": prompt_type, "metric": metric, "mean": means[t, m],
+                            "ci_low": low[t, m], "ci_high": high[t, m], "num_texts": num_texts})
+    return pd.DataFrame(records)
+
+
+def load_references(data_path, reference_column=None):
+    reference_column = reference_column or find_reference_column(read_dataset(data_path, nrows=1).columns)
+    if reference_column is None:
+        return None
+    df = read_dataset(data_path, columns=["text", reference_column]).dropna(subset=["text", reference_column])
+    return dict(zip(df["text"], df[reference_column]))
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--eval_results', help='path for an eval_results csv file created by the evaluation page')
+parser.add_argument('--data_path', help='path for the data file that contains the reference outputs')
+parser.add_argument('--reference_column', default=None, help='name of the reference column')
+parser.add_argument('--prompt_types', default=None, help='comma separated list of prompt types to score')
+parser.add_argument('--out_dir', help='path for saving the scores')
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    args = parser.parse_args()
+    references = load_references(args.data_path, args.reference_column)
+    if references is None:
+        raise ValueError(f"No reference column found in {args.data_path}")
+    eval_df = pd.read_csv(args.eval_results)
+    if args.prompt_types:
+        prompt_types = args.prompt_types.split(",")
+    else:
+        prompt_types = [c[:-len("_output")] for c in eval_df.columns if c.endswith("_output")]
+    scores_df = score_generated_data(eval_df.to_dict("records"), references, prompt_types)
+    aggregated_df = aggregate_with_bootstrap(scores_df, prompt_types)
+    os.makedirs(args.out_dir, exist_ok=True)
+    scores_df.to_csv(os.path.join(args.out_dir, "reference_scores.csv"), index=False)
+    aggregated_df.to_csv(os.path.join(args.out_dir, "reference_scores_aggregated.csv"), index=False)
+    logging.info(json.dumps(aggregated_df[aggregated_df.metric.str.endswith("f1")].to_dict("records"), indent=2))
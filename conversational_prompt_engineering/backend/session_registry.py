@@ -0,0 +1,140 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import logging
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+DEFAULT_IDLE_MINUTES = 30
+DEFAULT_MAX_MEMORY_MB = 1024
+SWEEP_INTERVAL_SECONDS = 60
+
+
+class _Entry:
+    def __init__(self, manager):
+        self.manager = weakref.ref(manager)  # sessions that Streamlit dropped are not kept alive
+        self.lock = threading.Lock()
+        self.last_activity = time.time()
+        self.num_active = 0
+        self.memory_bytes = 0
+
+
+class SessionRegistry:
+    """
+    tracks the chat managers of the sessions of the process: the time of their last activity and an estimate of
+    their memory. A sweep offloads the managers that were idle for more than idle_seconds, and then, while the
+    loaded managers take more than max_memory_mb, the least recently active ones. An offloaded manager is
+    rehydrated on the next access to its state.
+    """
+
+    def __init__(self, idle_seconds=DEFAULT_IDLE_MINUTES * 60, max_memory_mb=DEFAULT_MAX_MEMORY_MB,
+                 sweep_interval=SWEEP_INTERVAL_SECONDS):
+        self.idle_seconds = idle_seconds
+        self.max_memory_bytes = max_memory_mb * 2 ** 20
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._sweeper = None
+
+    def _get_entry(self, manager):
+        with self._lock:
+            entry = self._entries.get(id(manager))
+            if entry is None or entry.manager() is not manager:
+                entry = self._entries[id(manager)] = _Entry(manager)
+            return entry
+
+    def register(self, manager):
+        self._get_entry(manager)
+
+    def touch(self, manager):
+        self._get_entry(manager).last_activity = time.time()
+
+    @contextmanager
+    def activity(self, manager):
+        """
+        marks the manager as active for the duration of a script run, so that it is not offloaded meanwhile
+        """
+        entry = self._get_entry(manager)
+        with entry.lock:
+            entry.num_active += 1
+            entry.last_activity = time.time()
+        try:
+            manager.rehydrate()
+            yield manager
+        finally:
+            with entry.lock:
+                entry.num_active -= 1
+                entry.last_activity = time.time()
+                entry.memory_bytes = manager.estimate_memory_bytes()
+
+    def _offload_if_inactive(self, entry, manager):
+        with entry.lock:
+            if entry.num_active > 0 or manager.is_offloaded:
+                return False
+            manager.offload()
+            return True
+
+    def sweep(self, now=None):
+        """
+        offloads the idle managers, and the least recently active ones while over the memory limit. Returns the
+        number of managers that were offloaded.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e.manager() is None]:
+                del self._entries[key]
+            entries = [(e, e.manager()) for e in self._entries.values()]
+        loaded = sorted([(e, m) for e, m in entries if m is not None and not m.is_offloaded],
+                        key=lambda em: em[0].last_activity)
+        memory_bytes = sum(e.memory_bytes for e, _ in loaded)
+
+        num_offloaded = 0
+        for entry, manager in loaded:
+            is_idle = now - entry.last_activity > self.idle_seconds
+            if not is_idle and memory_bytes <= self.max_memory_bytes:
+                continue
+            try:
+                if self._offload_if_inactive(entry, manager):
+                    num_offloaded += 1
+                    memory_bytes -= entry.memory_bytes
+            except Exception:
+                logging.exception(f"failed to offload the session of {manager.out_dir}")
+        if num_offloaded:
+            logging.info(f"offloaded {num_offloaded} sessions, {len(loaded) - num_offloaded} sessions are loaded "
+                         f"(about {memory_bytes / 2 ** 20:.1f} MB)")
+        return num_offloaded
+
+    def start_sweeper(self):
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._sweeper = threading.Thread(target=self._sweep_periodically, daemon=True, name="session-sweeper")
+        self._sweeper.start()
+
+    def _sweep_periodically(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception:
+                logging.exception("session sweep failed")
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_session_registry(idle_minutes=DEFAULT_IDLE_MINUTES, max_memory_mb=DEFAULT_MAX_MEMORY_MB):
+    """
+    the registry of the process, created (and its sweeper started) with the limits of the first call
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = SessionRegistry(idle_seconds=idle_minutes * 60, max_memory_mb=max_memory_mb)
+            _registry.start_sweeper()
+        return _registry
@@ -0,0 +1,158 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import abc
+import gzip
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from conversational_prompt_engineering.backend.callback_chat_manager import CallbackChatManager
+
+
+class SessionConflictError(Exception):
+    """
+    the session was saved by another worker since the version that the caller is based on
+    """
+
+
+class SessionStore(abc.ABC):
+    """
+    keeps the state of the sessions outside the process that serves them, so that any worker process can load a
+    session, advance it and save it back. Saving is optimistic: it succeeds only if the stored version is still the
+    one that the state was loaded from, and a new session is saved with version 0.
+    """
+
+    @abc.abstractmethod
+    def load(self, session_id):
+        """
+        the (data, version) of the session, or None if it is not stored
+        """
+        raise NotImplementedError('Must be implemented by subclass')
+
+    @abc.abstractmethod
+    def get_version(self, session_id):
+        """
+        the stored version of the session, 0 if it is not stored
+        """
+        raise NotImplementedError('Must be implemented by subclass')
+
+    @abc.abstractmethod
+    def save(self, session_id, data, version):
+        """
+        stores data as the next version of the session and returns it, or raises SessionConflictError if the stored
+        version is not version
+        """
+        raise NotImplementedError('Must be implemented by subclass')
+
+    @abc.abstractmethod
+    def delete(self, session_id):
+        raise NotImplementedError('Must be implemented by subclass')
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    a session store in a local SQLite file, for the worker processes of a single host. Each process opens the file
+    itself: SQLite connections may not be carried over a fork.
+    """
+
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, version INTEGER NOT NULL, "
+                         "updated_at REAL NOT NULL, data BLOB NOT NULL)")
+
+    def _connection(self):
+        # a connection per thread
+        if getattr(self._local, "conn", None) is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute("PRAGMA journal_mode=WAL")  # readers do not wait for a writer
+            self._local.conn = conn
+        return self._local.conn
+
+    def load(self, session_id):
+        row = self._connection().execute("SELECT data, version FROM sessions WHERE session_id = ?",
+                                         (session_id,)).fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def get_version(self, session_id):
+        row = self._connection().execute("SELECT version FROM sessions WHERE session_id = ?",
+                                         (session_id,)).fetchone()
+        return 0 if row is None else row[0]
+
+    def save(self, session_id, data, version):
+        with self._connection() as conn:
+            if version == 0:
+                cursor = conn.execute("INSERT OR IGNORE INTO sessions VALUES (?, 1, ?, ?)",
+                                      (session_id, time.time(), data))
+            else:
+                cursor = conn.execute("UPDATE sessions SET version = version + 1, updated_at = ?, data = ? "
+                                      "WHERE session_id = ? AND version = ?", (time.time(), data, session_id, version))
+        if cursor.rowcount == 0:
+            raise SessionConflictError(f"session {session_id} was saved by another worker since version {version}")
+        return version + 1
+
+    def delete(self, session_id):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+
+SESSION_STORES = {"sqlite": SQLiteSessionStore}
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_session_store(kind, path):
+    """
+    one store per kind and path per process, shared by all the sessions
+    """
+    key = (kind, os.path.abspath(path))
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = SESSION_STORES[kind](path)
+        return _stores[key]
+
+
+def _serialize(manager, ui_state):
+    return pickle.dumps({"manager": manager.to_state(), "ui_state": ui_state}, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def save_session(store, session_id, manager, ui_state=None):
+    """
+    saves the manager and the state of the UI that goes with it (e.g. the evaluation), unless they did not change
+    since they were saved or loaded. Raises SessionConflictError if another worker saved the session meanwhile.
+    """
+    payload = _serialize(manager, ui_state or {})
+    digest = hashlib.sha1(payload).digest()
+    if digest == manager._stored_digest:
+        return manager.store_version
+    manager.store_version = store.save(session_id, gzip.compress(payload, compresslevel=1), manager.store_version)
+    manager._stored_digest = digest
+    return manager.store_version
+
+
+def load_session(store, session_id):
+    """
+    the (manager, ui_state) of the stored session, or None if it is not stored
+    """
+    stored = store.load(session_id)
+    if stored is None:
+        return None
+    data, version = stored
+    state = pickle.loads(gzip.decompress(data))
+    manager = CallbackChatManager.from_state(state["manager"])
+    manager.store_version = version
+    # the digest of the loaded state as it is serialized again, so that saving it unchanged is skipped
+    manager._stored_digest = hashlib.sha1(_serialize(manager, state["ui_state"])).digest()
+    logging.info(f"loaded version {version} of session {session_id}")
+    return manager, state["ui_state"]
@@ -0,0 +1,46 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import math
+from functools import lru_cache
+
+DEFAULT_CHARS_PER_TOKEN = 4
+TEXTS_BUDGET_FRACTION = 0.5  # the rest of the context is left for the instructions, conversation and output
+MIN_TEXT_TOKENS = 256
+TRUNCATION_MARKER = "\n[... TEXT TRUNCATED: {num_omitted} of {num_total} characters omitted ...]"
+
+
+def estimate_num_tokens(text, model_params):
+    return math.ceil(len(text) / model_params.get('chars_per_token', DEFAULT_CHARS_PER_TOKEN))
+
+
+def get_text_token_budget(model_params, num_texts=1):
+    """
+    the number of tokens each of num_texts input texts may take in a single call to the model
+    """
+    available = model_params['max_total_tokens'] - model_params['max_new_tokens']
+    return max(MIN_TEXT_TOKENS, int(available * TEXTS_BUDGET_FRACTION / num_texts))
+
+
+@lru_cache(maxsize=4096)
+def truncate_text(text, max_tokens, chars_per_token=DEFAULT_CHARS_PER_TOKEN):
+    """
+    cut the text at a whitespace boundary so that it fits max_tokens (estimated), and append a marker telling the
+    model that the text was truncated. Results are cached, so the budget of a text is computed once.
+    """
+    max_chars = int(max_tokens * chars_per_token)
+    if len(text) <= max_chars:
+        return text
+    keep = max_chars - len(TRUNCATION_MARKER.format(num_omitted=len(text), num_total=len(text)))
+    cut = text.rfind(" ", 0, keep) if keep > 0 else -1
+    cut = cut if cut > keep // 2 else max(keep, 0)
+    return text[:cut].rstrip() + TRUNCATION_MARKER.format(num_omitted=len(text) - cut, num_total=len(text))
+
+
+def fit_text_to_model(text, model_params, num_texts=1):
+    if not isinstance(text, str):
+        return text
+    return truncate_text(text, get_text_token_budget(model_params, num_texts),
+                         model_params.get('chars_per_token', DEFAULT_CHARS_PER_TOKEN))
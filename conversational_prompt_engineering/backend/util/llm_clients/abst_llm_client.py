@@ -13,6 +13,15 @@ class HumanRole(Enum):
     Admin = "admin"
 
 
+class ChatRole(str, Enum):
+    """
+    same values as genai.schema.ChatRole, without importing the genai sdk
+    """
+    USER = "user"
+    SYSTEM = "system"
+    ASSISTANT = "assistant"
+
+
 
 class AbstLLMClient:
     __metaclass__ = abc.ABCMeta
@@ -34,6 +43,12 @@ class AbstLLMClient:
         """
         raise NotImplementedError()
 
+    def prompt_llm_batch(self, conversations, max_new_tokens=None):
+        """
+        return one reply per conversation. Clients that support batch generation should override this method.
+        """
+        return [self.prompt_llm(conversation, max_new_tokens)[0] for conversation in conversations]
+
     def do_send_message(self, conversation, max_new_tokens):
         sys.tracebacklimit = 1000
         for i in [0,1]:
@@ -64,5 +79,26 @@ class AbstLLMClient:
         stats_dict = {"sent words": sent_words, "received words": received_words}
         return res, stats_dict
 
+    def send_messages_batch(self, conversations, max_new_tokens=None):
+        sys.tracebacklimit = 1000
+        for i in [0, 1]:
+            try:
+                res = [x.strip() for x in self.prompt_llm_batch(conversations, max_new_tokens)]
+                break
+            except Exception as e:
+                if i == 0:
+                    logging.debug("ERROR Got API response exception", e)
+                else:
+                    logging.error("ERROR Got API response exception", e)
+        else:
+            sys.tracebacklimit = 0
+            raise Exception("There is an error connecting to the LLM service. Either check your API key or try again in a few minutes.")
+        sent_words = sum(len(c.split()) for c in conversations)
+        received_words = sum(len(r.split()) for r in res)
+        self.sent_words_count += sent_words
+        self.received_words_count += received_words
+        stats_dict = {"sent words": sent_words, "received words": received_words, "batch size": len(conversations)}
+        return res, stats_dict
+
 
 
@@ -5,12 +5,6 @@ import sys
 # from dotenv import load_dotenv
 
 
-from genai.client import Client
-from genai.credentials import Credentials
-from genai.schema import (
-    DecodingMethod,
-    TextGenerationParameters, )
-
 from conversational_prompt_engineering.backend.util.llm_clients.abst_llm_client import AbstLLMClient, HumanRole
 
 
@@ -19,6 +13,9 @@ from conversational_prompt_engineering.backend.util.llm_clients.abst_llm_client
 
 class BamClient(AbstLLMClient):
     def __init__(self, api_endpoint, model_params):
+        from genai.client import Client
+        from genai.credentials import Credentials
+
         super(BamClient, self).__init__()
         self.client = Client(credentials=Credentials(api_key=self._get_env_var('BAM_APIKEY'), api_endpoint=api_endpoint))
         self.parameters = model_params
@@ -31,17 +28,24 @@ class BamClient(AbstLLMClient):
     def credentials_params(cls):
         return {"BAM_APIKEY": "BAM API key"}
 
-    def prompt_llm(self, conversation, max_new_tokens=None):
-        parameters = TextGenerationParameters(
+    def _get_parameters(self, max_new_tokens=None):
+        from genai.schema import DecodingMethod, TextGenerationParameters
+
+        return TextGenerationParameters(
             decoding_method=DecodingMethod.GREEDY,
             max_new_tokens=max_new_tokens if max_new_tokens else self.parameters['max_new_tokens'],
             min_new_tokens=1,
             repetition_penalty=self.parameters['repetition_penalty'] if 'repetition_penalty' in self.parameters else 1
             )
+
+    def prompt_llm(self, conversation, max_new_tokens=None):
+        return self.prompt_llm_batch([conversation], max_new_tokens)
+
+    def prompt_llm_batch(self, conversations, max_new_tokens=None):
         response = self.client.text.generation.create(
             model_id=self.parameters['model_id'],
-            inputs=[conversation],
-            parameters=parameters,
+            inputs=conversations,
+            parameters=self._get_parameters(max_new_tokens),
         )
         texts = [res.generated_text.strip() for resp in response for res in resp.results]
         return texts
@@ -0,0 +1,80 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from conversational_prompt_engineering.backend.util.llm_clients.abst_llm_client import AbstLLMClient
+
+RECORDINGS_PATH_ENV_VAR = "CPE_RECORDINGS_PATH"
+RECORDED_CLIENT_ENV_VAR = "CPE_RECORDED_CLIENT"
+DEFAULT_RECORDINGS_PATH = os.path.join("_out", "llm_recordings.jsonl")
+DEFAULT_RECORDED_CLIENT = "WatsonXClient"
+
+_file_locks = {}
+_file_locks_lock = threading.Lock()
+
+
+def get_recordings_path(recordings_path=None):
+    return recordings_path or os.environ.get(RECORDINGS_PATH_ENV_VAR, DEFAULT_RECORDINGS_PATH)
+
+
+def conversation_hash(conversation, model_id, max_new_tokens=None):
+    key = json.dumps({"conversation": conversation, "model_id": model_id, "max_new_tokens": max_new_tokens})
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _get_file_lock(path):
+    with _file_locks_lock:
+        return _file_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+class RecordingLLMClient(AbstLLMClient):
+    """
+    sends the conversations to another client (WatsonXClient by default, or the client named in the
+    CPE_RECORDED_CLIENT environment variable), and appends every response and its latency to a JSON lines file,
+    keyed by the hash of the conversation, for ReplayLLMClient.
+    """
+
+    @classmethod
+    def credentials_params(cls):
+        return cls._get_recorded_client_class().credentials_params()
+
+    @classmethod
+    def display_name(self):
+        return f"{self._get_recorded_client_class().display_name()} (recording)"
+
+    @classmethod
+    def _get_recorded_client_class(cls):
+        from conversational_prompt_engineering.backend.util.llm_clients.llm_clients_loader import get_client_classes
+
+        return get_client_classes([os.environ.get(RECORDED_CLIENT_ENV_VAR, DEFAULT_RECORDED_CLIENT)])[0]
+
+    def __init__(self, api_endpoint, model_params, recorded_client=None, recordings_path=None):
+        super(RecordingLLMClient, self).__init__()
+        self.parameters = model_params
+        self.recorded_client = recorded_client or self._get_recorded_client_class()(api_endpoint, model_params)
+        self.recordings_path = get_recordings_path(recordings_path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.recordings_path)), exist_ok=True)
+
+    def _record(self, conversations, responses, latency, max_new_tokens):
+        model_id = self.parameters['model_id']
+        lines = [json.dumps({"hash": conversation_hash(c, model_id, max_new_tokens), "model_id": model_id,
+                             "max_new_tokens": max_new_tokens, "response": r, "latency": latency})
+                 for c, r in zip(conversations, responses)]
+        with _get_file_lock(self.recordings_path), open(self.recordings_path, "a", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+
+    def prompt_llm(self, conversation, max_new_tokens=None):
+        start_time = time.time()
+        texts = self.recorded_client.prompt_llm(conversation, max_new_tokens)
+        self._record([conversation], [texts], time.time() - start_time, max_new_tokens)
+        return texts
+
+    def prompt_llm_batch(self, conversations, max_new_tokens=None):
+        start_time = time.time()
+        texts = self.recorded_client.prompt_llm_batch(conversations, max_new_tokens)
+        # a batch is replayed one conversation at a time, so each one is recorded with its share of the latency
+        latency = (time.time() - start_time) / max(len(conversations), 1)
+        self._record(conversations, [[t] for t in texts], latency, max_new_tokens)
+        return texts
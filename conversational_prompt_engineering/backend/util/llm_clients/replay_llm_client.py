@@ -0,0 +1,92 @@
+import json
+import math
+import os
+import random
+import threading
+import time
+
+from conversational_prompt_engineering.backend.util.llm_clients.abst_llm_client import AbstLLMClient
+from conversational_prompt_engineering.backend.util.llm_clients.recording_llm_client import conversation_hash, \
+    get_recordings_path
+
+REPLAY_LATENCY_ENV_VAR = "CPE_REPLAY_LATENCY"
+DEFAULT_REPLAY_LATENCY = "recorded"
+
+_recordings = {}
+_recordings_lock = threading.Lock()
+
+
+def load_recordings(recordings_path):
+    """
+    hash -> list of recorded calls, in the order they were recorded. Loaded once per process and path.
+    """
+    key = os.path.abspath(recordings_path)
+    with _recordings_lock:
+        if key not in _recordings:
+            recordings = {}
+            with open(recordings_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        recordings.setdefault(record["hash"], []).append(record)
+            _recordings[key] = recordings
+        return _recordings[key]
+
+
+def parse_latency(latency):
+    """
+    returns a function from the recorded latency of a call to the latency to replay it with. The options are
+    "recorded", "none", a fixed number of seconds, "scale:FACTOR" (the recorded latency times FACTOR) and
+    "lognormal:MEDIAN:SIGMA" (random latencies in seconds).
+    """
+    latency = str(latency)
+    if latency == "recorded":
+        return lambda recorded: recorded
+    if latency == "none":
+        return lambda recorded: 0.0
+    if latency.startswith("scale:"):
+        factor = float(latency.split(":")[1])
+        return lambda recorded: recorded * factor
+    if latency.startswith("lognormal:"):
+        _, median, sigma = latency.split(":")
+        rng = random.Random(0)
+        return lambda recorded: rng.lognormvariate(math.log(float(median)), float(sigma))
+    seconds = float(latency)
+    return lambda recorded: seconds
+
+
+class ReplayLLMClient(AbstLLMClient):
+    """
+    serves the responses that RecordingLLMClient recorded, without access to any LLM service. A conversation that
+    was recorded several times is answered with its recorded responses in turn.
+    """
+
+    @classmethod
+    def credentials_params(cls):
+        return {}
+
+    @classmethod
+    def display_name(self):
+        return "Replay"
+
+    def __init__(self, api_endpoint, model_params, recordings_path=None, latency=None):
+        super(ReplayLLMClient, self).__init__()
+        self.parameters = model_params
+        self.recordings = load_recordings(get_recordings_path(recordings_path))
+        self.get_latency = parse_latency(latency or os.environ.get(REPLAY_LATENCY_ENV_VAR, DEFAULT_REPLAY_LATENCY))
+        self._lock = threading.Lock()
+        self._num_served = {}
+
+    def prompt_llm(self, conversation, max_new_tokens=None):
+        h = conversation_hash(conversation, self.parameters['model_id'], max_new_tokens)
+        records = self.recordings.get(h)
+        if not records:
+            raise KeyError(f"no recorded response for the conversation (hash {h})")
+        with self._lock:
+            num_served = self._num_served.get(h, 0)
+            self._num_served[h] = num_served + 1
+        record = records[num_served % len(records)]
+        latency = self.get_latency(record["latency"])
+        if latency > 0:
+            time.sleep(latency)
+        return list(record["response"])
@@ -1,7 +1,3 @@
-from ibm_watsonx_ai import APIClient
-from ibm_watsonx_ai.metanames import GenTextParamsMetaNames as GenParams
-from ibm_watsonx_ai.foundation_models import ModelInference
-
 from conversational_prompt_engineering.backend.util.llm_clients.abst_llm_client import AbstLLMClient
 
 
@@ -18,6 +14,10 @@ class WatsonXClient(AbstLLMClient):
         return "WatsonX"
 
     def __init__(self, api_endpoint, model_params):
+        # the sdk takes about a second to import, so it is loaded when the first client is created
+        from ibm_watsonx_ai import APIClient
+        from ibm_watsonx_ai.metanames import GenTextParamsMetaNames as GenParams
+
         super(WatsonXClient, self).__init__()
         self.parameters = model_params
         self.api_endpoint = api_endpoint
@@ -41,12 +41,15 @@ class WatsonXClient(AbstLLMClient):
         self.model_id =  self.parameters['model_id']
 
     def _get_model(self, max_new_tokens=None):
+        from ibm_watsonx_ai.foundation_models import ModelInference
+        from ibm_watsonx_ai.metanames import GenTextParamsMetaNames as GenParams
+
         params = {x: y for x, y in self.generate_params.items()}
         if max_new_tokens:
             params[GenParams.MAX_NEW_TOKENS] = max_new_tokens
         return ModelInference(
                     model_id=self.model_id,
-                    params=self.generate_params,
+                    params=params,
                     api_client=self.client
             )
 
@@ -56,3 +59,8 @@ class WatsonXClient(AbstLLMClient):
         texts = [x.strip() for x in res]
         return texts
 
+    def prompt_llm_batch(self, conversations, max_new_tokens=None):
+        model = self._get_model(max_new_tokens)
+        res = model.generate_text(prompt=conversations)
+        return [x.strip() for x in res]
+
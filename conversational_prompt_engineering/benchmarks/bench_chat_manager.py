@@ -0,0 +1,104 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+# run with: python -m pytest conversational_prompt_engineering/benchmarks/bench_chat_manager.py
+# and CPE_BENCHMARK_SAVE_BASELINE=1 to update benchmark_baseline.json
+
+import pytest
+
+from conversational_prompt_engineering.backend.callback_chat_manager import CallbackChatManager
+from conversational_prompt_engineering.backend.chat_manager_util import format_chat
+from conversational_prompt_engineering.backend.prompt_building_util import TargetModelHandler
+from conversational_prompt_engineering.backend.util.llm_clients.abst_llm_client import ChatRole
+from conversational_prompt_engineering.benchmarks.fake_llm_client import FakeLLMClient
+
+LLAMA = "meta-llama/llama-3-70b-instruct"
+MIXTRAL = "mistralai/mixtral-8x7b-instruct-v01"
+NUM_EXAMPLES = 3
+NUM_TURNS = 100
+EXAMPLE_TEXT = "The quick brown fox jumps over the lazy dog near the river bank. " * 40
+
+
+def create_manager(out_dir):
+    return CallbackChatManager(model="llama-3", target_model="llama-3", llm_client=FakeLLMClient,
+                               output_dir=str(out_dir), config_name="benchmark")
+
+
+def fill_long_conversation(manager, num_turns=NUM_TURNS):
+    """
+    a conversation of num_turns user and assistant messages, tagged with examples and prompt iterations
+    """
+    manager.outputs = [None] * NUM_EXAMPLES
+    manager.prompts = ["Summarize the text in one sentence."]
+    for i in range(num_turns):
+        tags = {"example_num": i % NUM_EXAMPLES + 1, "prompt_iteration": 1}
+        manager._add_msg(manager.model_chat, ChatRole.USER, f"user message {i} " + "some feedback " * 20, **tags)
+        manager._add_msg(manager.model_chat, ChatRole.ASSISTANT,
+                         f'self.submit_message_to_user("assistant message {i} {"details " * 30}")', **tags)
+        manager._add_msg(manager.user_chat, ChatRole.USER, f"user message {i} " + "some feedback " * 20)
+        manager._add_msg(manager.user_chat, ChatRole.ASSISTANT, f"assistant message {i} {'details ' * 30}")
+    manager.model_chat_length = len(manager.model_chat)
+    manager.user_chat_length = len(manager.user_chat)
+
+
+@pytest.fixture
+def long_session(tmp_path):
+    manager = create_manager(tmp_path)
+    manager.examples = [f"{i} {EXAMPLE_TEXT}" for i in range(NUM_EXAMPLES)]
+    manager.set_instructions(manager.model_prompts.task_instruction, manager.model_prompts.api_instruction,
+                             manager.model_prompts.api)
+    fill_long_conversation(manager)
+    return manager
+
+
+def test_parse_model_response(benchmark, long_session):
+    response = "\n".join(f'self.submit_message_to_user("message {i} with a long text {"word " * 200}")'
+                         for i in range(5)) + '\nself.switch_to_example(2)'
+    calls = benchmark(long_session._parse_model_response, response)
+    assert len(calls) == 6
+
+
+def test_filtered_model_chat(benchmark, long_session):
+    long_session.example_num = 2
+    filtered = benchmark(lambda: long_session._filtered_model_chat)
+    assert 0 < len(filtered) < len(long_session.model_chat)
+
+
+@pytest.mark.parametrize("model_id", [LLAMA, MIXTRAL])
+def test_format_chat(benchmark, long_session, model_id):
+    conversation = benchmark(format_chat, long_session.model_chat, model_id)
+    assert len(conversation) > 0
+
+
+def test_format_prompt(benchmark):
+    shots = [{"text": f"{i} {EXAMPLE_TEXT}", "output": f"summary {i}"} for i in range(NUM_EXAMPLES)]
+    prompt = benchmark(TargetModelHandler().format_prompt, LLAMA, "Summarize the text.", shots)
+    assert "{text}" in prompt
+
+
+def test_build_prompt_template_uncached(benchmark):
+    shots = tuple((f"{i} {EXAMPLE_TEXT}", f"summary {i}") for i in range(NUM_EXAMPLES))
+    handler = TargetModelHandler()
+    template = benchmark(TargetModelHandler._build_template.__wrapped__, handler, LLAMA, "Summarize.", shots)
+    assert template.prefix
+
+
+def test_save_chat_state(benchmark, long_session):
+    benchmark(long_session._save_chat_state)
+
+
+def run_scripted_session(out_dir):
+    manager = create_manager(out_dir)
+    manager.init_chat([f"{i} {EXAMPLE_TEXT}" for i in range(NUM_EXAMPLES)])
+    manager.submit_prompt("Summarize the text in one sentence.")
+    for i in range(NUM_EXAMPLES):
+        manager.output_accepted(i + 1, f"summary {i}")
+    manager.conversation_end()
+    return manager
+
+
+def test_scripted_session(benchmark, tmp_path):
+    manager = benchmark(run_scripted_session, tmp_path)
+    assert manager.few_shot_prompt is not None and manager.prompt_conv_end
@@ -0,0 +1,100 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import json
+import math
+import os
+import statistics
+import time
+
+import pytest
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+# a benchmark fails if its fastest round, relative to the calibration loop, is more than (1 + threshold) times the
+# baseline. The fastest round is the one least disturbed by the machine, and the calibration loop of the same session
+# takes out the speed of the machine, so that the baseline can be compared on other machines
+THRESHOLD = float(os.environ.get("CPE_BENCHMARK_THRESHOLD", "1.0"))
+SAVE_BASELINE = os.environ.get("CPE_BENCHMARK_SAVE_BASELINE", "") == "1"
+MIN_ROUNDS = 5
+MAX_ROUNDS = 1000
+MAX_SECONDS_PER_BENCHMARK = 1.0
+MIN_SECONDS_PER_ROUND = 0.005  # fast functions are called several times in a round, above the timer noise
+CALIBRATION_ROUNDS = 20
+
+_results = {}
+_calibration = []
+
+
+def _calibration_loop():
+    # string formatting, dict and list work, like the chat formatting that is benchmarked
+    parts = {}
+    for i in range(2000):
+        parts.setdefault(i % 7, []).append(f"message {i} " + str(i * 31))
+    return sum(len("".join(v)) for v in parts.values())
+
+
+def get_calibration_seconds():
+    """
+    the fastest time of the calibration loop on this machine, measured once per session
+    """
+    if not _calibration:
+        _calibration_loop()
+        _calibration.append(min(_time_round(_calibration_loop, [()], {}) for _ in range(CALIBRATION_ROUNDS)))
+    return _calibration[0]
+
+
+def _time_round(func, args_per_loop, kwargs):
+    start = time.perf_counter()
+    for args in args_per_loop:
+        result = func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def _load_baseline():
+    if not os.path.exists(BASELINE_FILE):
+        return {}
+    with open(BASELINE_FILE, "r") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def benchmark(request):
+    """
+    benchmark(func, *args, **kwargs) calls func in rounds (at least MIN_ROUNDS, and until MAX_SECONDS_PER_BENCHMARK),
+    each of enough calls to take MIN_SECONDS_PER_ROUND, records the per-call timing statistics and fails on a
+    regression against the baseline.
+    setup, if given, is called before every call, outside of the timing, and its result is passed as the only
+    positional argument to func.
+    """
+    def run(func, *args, setup=None, **kwargs):
+        calibration = get_calibration_seconds()
+        start = time.perf_counter()
+        result = func(*(args if setup is None else (setup(),)), **kwargs)  # warmup
+        loops = max(1, math.ceil(MIN_SECONDS_PER_ROUND / max(time.perf_counter() - start, 1e-9)))
+        timings = []
+        deadline = time.perf_counter() + MAX_SECONDS_PER_BENCHMARK
+        while len(timings) < MIN_ROUNDS or (len(timings) < MAX_ROUNDS and time.perf_counter() < deadline):
+            args_per_loop = [args if setup is None else (setup(),) for _ in range(loops)]
+            timings.append(_time_round(func, args_per_loop, kwargs) / loops)
+        stats = {"min": min(timings), "median": statistics.median(timings), "max": max(timings),
+                 "rounds": len(timings), "loops": loops, "relative_min": min(timings) / calibration}
+        _results[request.node.name] = stats
+
+        baseline = _load_baseline().get(request.node.name)
+        if not SAVE_BASELINE and baseline is not None and \
+                stats["relative_min"] > baseline["relative_min"] * (1 + THRESHOLD):
+            pytest.fail(f"{request.node.name} regressed: {stats['relative_min']:.3f} calibration loops "
+                        f"({stats['min'] * 1000:.3f} ms), baseline {baseline['relative_min']:.3f} "
+                        f"(threshold {THRESHOLD:.0%})")
+        return result
+    return run
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if SAVE_BASELINE and _results:
+        baseline = _load_baseline()
+        baseline.update(_results)
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(dict(sorted(baseline.items())), f, indent=1)
@@ -0,0 +1,127 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import re
+import time
+
+from conversational_prompt_engineering.backend.callback_chat_manager import ModelPrompts
+from conversational_prompt_engineering.backend.util.llm_clients.abst_llm_client import AbstLLMClient, ChatRole
+from conversational_prompt_engineering.backend.util.llm_clients.replay_llm_client import parse_latency
+
+ASSISTANT_RESPONSE = 'self.submit_message_to_user("Here is my suggestion.")'
+TARGET_OUTPUT = "A short summary of the text."
+
+
+class FakeLLMClient(AbstLLMClient):
+    """
+    answers without an LLM service: chat conversations (they describe the API) get a call to
+    submit_message_to_user, and formatted prompts get a fixed output. latency (seconds) is slept on every call.
+    """
+    latency = 0.0
+
+    @classmethod
+    def credentials_params(cls):
+        return {}
+
+    @classmethod
+    def display_name(self):
+        return "Fake"
+
+    def __init__(self, api_endpoint, model_params):
+        super(FakeLLMClient, self).__init__()
+        self.parameters = model_params
+        self.num_calls = 0
+
+    def prompt_llm(self, conversation, max_new_tokens=None):
+        self.num_calls += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+        return [ASSISTANT_RESPONSE if "self.submit_message_to_user" in conversation else TARGET_OUTPUT]
+
+
+LLAMA_MESSAGE_REGEX = re.compile(r"<\|start_header_id\|>(\w+)<\|end_header_id\|>\n\n(.*?)<\|eot_id\|>", re.DOTALL)
+SUGGESTED_PROMPT = "Summarize the text in one sentence, focusing on its main point."
+ACCEPTED_OUTPUT = "The text describes a single main point in a short sentence."
+
+
+def parse_llama_chat(conversation):
+    """
+    the (role, content) messages of a conversation formatted by format_chat for llama
+    """
+    return LLAMA_MESSAGE_REGEX.findall(conversation)
+
+
+class ScriptedAssistantLLMClient(FakeLLMClient):
+    """
+    plays the assistant of a CPE conversation without an LLM service, for llama formatted chats: it answers the last
+    system instruction, or the last user message, with the API call that moves the conversation to its next stage,
+    so a simulated user that accepts everything reaches the end of the conversation. Formatted prompts of the target
+    model get a fixed output. latency is a specification for parse_latency, sampled on every call.
+    """
+    latency = "none"
+    _latency_sampler = None
+
+    @classmethod
+    def display_name(self):
+        return "Scripted assistant"
+
+    @classmethod
+    def set_latency(cls, latency):
+        cls.latency = latency
+        cls._latency_sampler = None
+
+    @classmethod
+    def _sample_latency(cls):
+        if cls._latency_sampler is None:
+            cls._latency_sampler = parse_latency(cls.latency)
+        return cls._latency_sampler(0.0)
+
+    def prompt_llm(self, conversation, max_new_tokens=None):
+        self.num_calls += 1
+        latency = self._sample_latency()
+        if latency > 0:
+            time.sleep(latency)
+        return [self._respond(parse_llama_chat(conversation))]
+
+    def _respond(self, messages):
+        prompts = ModelPrompts()
+        role, content = messages[-1]
+        if role == ChatRole.SYSTEM:
+            if content.startswith(prompts.task_definition_instruction):
+                return 'self.submit_message_to_user("Do you already have a prompt to begin from?")'
+            if content.startswith(prompts.generate_baseline_instruction_task):
+                return 'self.submit_prompt("Summarize this text.")'
+            if content.startswith(prompts.analyze_examples):
+                return f'self.submit_message_to_user("I suggest the prompt: {SUGGESTED_PROMPT} Shall I use it?")'
+            if content.startswith(prompts.analyze_result_instruction.split("NUM_EXAMPLES")[0]):
+                return 'self.switch_to_example(1)'
+            if content.startswith(prompts.discuss_example_num.split("EXAMPLE_NUM")[0]):
+                example_num = int(re.search(r"\d+", content).group())
+                return f'self.submit_message_to_user("Example {example_num}: {ACCEPTED_OUTPUT} Do you accept it?")'
+            if content.startswith(prompts.analyze_discussion_task_end):
+                return "No modifications were made, the prompt should be accepted."
+            if content.startswith(prompts.analyze_new_prompt_task):
+                return "The prompt produces the outputs expected by the user."
+            if content.endswith(prompts.analyze_discussion_continue):
+                return 'self.submit_message_to_user("The prompt produces the accepted outputs. Shall we finish?")'
+            if content.startswith(prompts.conversation_end_instruction.split("TARGET_MODEL")[0]):
+                return 'self.submit_message_to_user("Goodbye, the final prompts can be downloaded below.")'
+            return 'self.submit_message_to_user("Let us continue.")'
+
+        if not any("self.submit_message_to_user" in c for _, c in messages):
+            return TARGET_OUTPUT  # a formatted prompt of the target model
+
+        # a user message: the answer depends on the question the assistant asked last
+        question = next((c for r, c in reversed(messages) if r == ChatRole.ASSISTANT), "")
+        if "a prompt to begin from" in question:
+            return 'self.task_is_defined("")'
+        if "Shall I use it" in question:
+            return f'self.submit_prompt("{SUGGESTED_PROMPT}")'
+        if "Do you accept it" in question:
+            example_num = int(re.search(r"Example (\d+)", question).group(1))
+            return f'self.output_accepted({example_num}, "{ACCEPTED_OUTPUT}")'
+        if "Shall we finish" in question:
+            return 'self.conversation_end()'
+        return 'self.submit_message_to_user("Noted.")'
@@ -0,0 +1,180 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import argparse
+import json
+import logging
+import os
+import resource
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from conversational_prompt_engineering.backend.callback_chat_manager import CallbackChatManager
+from conversational_prompt_engineering.backend.conversation_driver import ConversationDriver, ScriptedUser, \
+    load_catalog_texts
+from conversational_prompt_engineering.backend.profiling import ProfilingMode
+from conversational_prompt_engineering.benchmarks.fake_llm_client import ScriptedAssistantLLMClient
+from conversational_prompt_engineering.data.main_dataset_name_to_dir import dataset_name_to_dir
+
+# the answers of a user that accepts the suggestions of the assistant, see ScriptedAssistantLLMClient
+DEFAULT_ANSWERS = [
+    "I don't have a prompt. I would like to summarize the texts in one sentence.",
+    "Yes, use this prompt.",
+    "Yes, I accept this output.",
+    "Yes, I accept this output.",
+    "Yes, I accept this output.",
+    "Yes, let's finish.",
+]
+MAX_TURNS = 20
+MONITOR_INTERVAL_SECONDS = 0.1
+
+
+def _current_rss_mb():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):  # not linux: the peak RSS of the process
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+class ResourceMonitor:
+    """
+    samples the number of threads and the RSS of the process in a background thread
+    """
+
+    def __init__(self, interval=MONITOR_INTERVAL_SECONDS):
+        self.interval = interval
+        self.start_rss_mb = _current_rss_mb()
+        self.peak_rss_mb = self.start_rss_mb
+        self.peak_threads = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss_mb = max(self.peak_rss_mb, _current_rss_mb())
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_session(user_id, dataset_name, df, out_dir, answers=DEFAULT_ANSWERS, max_turns=MAX_TURNS,
+                profiling_mode=ProfilingMode.SPANS):
+    """
+    one simulated user: selects a catalog dataset and answers the assistant with the script, until the script ends
+    or the conversation ends. Returns the summary of the session, with the latency of every turn.
+    """
+    manager = CallbackChatManager(model="llama-3", target_model="llama-3", llm_client=ScriptedAssistantLLMClient,
+                                  output_dir=os.path.join(out_dir, f"user_{user_id:04d}"), config_name="load_test",
+                                  profiling_mode=profiling_mode)
+    summary = ConversationDriver(manager, ScriptedUser(answers), max_turns).run(df, dataset_name)
+    return {"user_id": user_id, **summary}
+
+
+def run_load_test(num_users, dataset_names, out_dir, answers=DEFAULT_ANSWERS, latency="none", ramp_up_seconds=0.0,
+                  max_turns=MAX_TURNS, profiling_mode=ProfilingMode.SPANS):
+    """
+    runs num_users simulated users concurrently, each in its own thread like the sessions of the Streamlit server,
+    over the catalog datasets in turn, and reports the turn latency percentiles, the throughput and the resources
+    of the process
+    """
+    ScriptedAssistantLLMClient.set_latency(latency)
+    catalog = load_catalog_texts(dataset_names)
+    os.makedirs(out_dir, exist_ok=True)
+    disk_bytes_before = _dir_size(out_dir)
+
+    def _run_user(user_id):
+        time.sleep(ramp_up_seconds * user_id / max(num_users, 1))
+        dataset_name = dataset_names[user_id % len(dataset_names)]
+        return run_session(user_id, dataset_name, catalog[dataset_name], out_dir, answers, max_turns, profiling_mode)
+
+    sessions, errors = [], []
+    start = time.perf_counter()
+    with ResourceMonitor() as monitor, ThreadPoolExecutor(max_workers=num_users) as executor:
+        futures = [executor.submit(_run_user, user_id) for user_id in range(num_users)]
+        for f in futures:
+            try:
+                sessions.append(f.result())
+            except Exception as e:
+                logging.exception("a simulated user failed")
+                errors.append(str(e))
+    wall_seconds = time.perf_counter() - start
+
+    latencies = [t for s in sessions for t in s["turn_latencies"]]
+    percentiles = np.percentile(latencies, [50, 95, 99]) if latencies else [None] * 3
+    disk_bytes = _dir_size(out_dir) - disk_bytes_before
+    return {
+        "num_users": num_users,
+        "latency": latency,
+        "completed_sessions": sum(s["completed"] for s in sessions),
+        "failed_sessions": len(errors),
+        "num_turns": len(latencies),
+        "turn_latency_p50": percentiles[0],
+        "turn_latency_p95": percentiles[1],
+        "turn_latency_p99": percentiles[2],
+        "turn_latency_max": max(latencies, default=None),
+        "turns_per_second": len(latencies) / wall_seconds,
+        "llm_calls": sum(s["llm_calls"] for s in sessions),
+        "wall_seconds": wall_seconds,
+        "peak_threads": monitor.peak_threads,
+        "start_rss_mb": monitor.start_rss_mb,
+        "peak_rss_mb": monitor.peak_rss_mb,
+        "disk_bytes_written": disk_bytes,
+        "disk_bytes_per_session": disk_bytes / num_users,
+        "errors": errors,
+    }
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--num_users', type=int, nargs='+', default=[1, 4, 16],
+                    help='the numbers of concurrent users to run the load test with, one run each')
+parser.add_argument('--datasets', nargs='+', default=list(dataset_name_to_dir.keys()),
+                    help='catalog datasets, assigned to the users in turn')
+parser.add_argument('--latency', default='lognormal:1.0:0.5',
+                    help='latency of the stub LLM client per call: none, seconds, or lognormal:MEDIAN:SIGMA')
+parser.add_argument('--ramp_up_seconds', type=float, default=0.0, help='the users start evenly over this time')
+parser.add_argument('--answers_path', help='path for a json file with a list of user answers')
+parser.add_argument('--max_turns', type=int, default=MAX_TURNS)
+parser.add_argument('--profiling_mode', default=ProfilingMode.SPANS.value,
+                    choices=[m.value for m in ProfilingMode])
+parser.add_argument('--out_dir', help='dir for the outputs of the sessions, a temporary dir by default')
+parser.add_argument('--out_path', help='path for saving the reports')
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s %(message)s')
+    args = parser.parse_args()
+    answers = DEFAULT_ANSWERS
+    if args.answers_path:
+        with open(args.answers_path, "r") as f:
+            answers = json.load(f)
+    reports = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for num_users in args.num_users:
+            out_dir = os.path.join(args.out_dir or tmp_dir, f"load_test_{num_users}_users")
+            report = run_load_test(num_users, args.datasets, out_dir, answers, args.latency, args.ramp_up_seconds,
+                                   args.max_turns, ProfilingMode(args.profiling_mode))
+            reports.append(report)
+            print(f"{num_users} users: p50 {report['turn_latency_p50']:.2f}s, p95 {report['turn_latency_p95']:.2f}s, "
+                  f"p99 {report['turn_latency_p99']:.2f}s, {report['turns_per_second']:.2f} turns/s, "
+                  f"{report['completed_sessions']}/{num_users} completed, {report['peak_threads']} threads, "
+                  f"{report['peak_rss_mb']:.0f} MB RSS, {report['disk_bytes_per_session'] / 1024:.0f} KB per session")
+    if args.out_path:
+        with open(args.out_path, "w") as f:
+            json.dump(reports, f, indent=1)
@@ -0,0 +1,100 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from conversational_prompt_engineering.backend.callback_chat_manager import CallbackChatManager
+from conversational_prompt_engineering.backend.conversation_driver import ConversationDriver, ScriptedUser, \
+    load_catalog_texts
+from conversational_prompt_engineering.benchmarks.fake_llm_client import ScriptedAssistantLLMClient
+from conversational_prompt_engineering.benchmarks.load_test import DEFAULT_ANSWERS
+
+NUM_SESSIONS = 20
+
+
+def deep_size(obj, seen=None):
+    """
+    the size in bytes of an object and everything it references, counting shared objects once
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(x, seen) for x in obj)
+    elif not isinstance(obj, (str, bytes, int, float, bool, type(None))):
+        if hasattr(obj, "__dict__"):
+            size += deep_size(vars(obj), seen)
+        for cls in type(obj).__mro__:
+            for slot in cls.__dict__.get("__slots__", ()):
+                if hasattr(obj, slot):
+                    size += deep_size(getattr(obj, slot), seen)
+    return size
+
+
+def chat_size(manager):
+    """
+    the bytes held by the chats and the examples of a session
+    """
+    return deep_size([manager.model_chat, manager.user_chat, manager.examples])
+
+
+def run_session(df, dataset_name, out_dir):
+    manager = CallbackChatManager(model="llama-3", target_model="llama-3", llm_client=ScriptedAssistantLLMClient,
+                                  output_dir=out_dir, config_name="session_memory")
+    ConversationDriver(manager, ScriptedUser(DEFAULT_ANSWERS)).run(df, dataset_name)
+    return manager
+
+
+def measure_session_memory(dataset_name, out_dir, num_sessions=NUM_SESSIONS):
+    """
+    the memory retained per finished session, and the part of it held by the chats and the examples
+    """
+    ScriptedAssistantLLMClient.set_latency("none")
+    df = load_catalog_texts([dataset_name])[dataset_name]
+    run_session(df, dataset_name, os.path.join(out_dir, "warmup"))  # caches of the process are not counted
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    managers = [run_session(df, dataset_name, os.path.join(out_dir, f"session_{i:04d}")) for i in range(num_sessions)]
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return {"dataset": dataset_name,
+            "num_sessions": num_sessions,
+            "retained_bytes_per_session": retained / num_sessions,
+            "chat_bytes_per_session": sum(chat_size(m) for m in managers) / num_sessions,
+            "messages_per_session": sum(len(m.model_chat) + len(m.user_chat) for m in managers) / num_sessions}
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--datasets', nargs='+', default=["Wikipedia Movie pages", "Space Newsgroup"])
+parser.add_argument('--num_sessions', type=int, default=NUM_SESSIONS)
+parser.add_argument('--out_path', help='path for saving the measurements')
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for dataset_name in args.datasets:
+            result = measure_session_memory(dataset_name, os.path.join(tmp_dir, dataset_name), args.num_sessions)
+            results.append(result)
+            print(f"{dataset_name}: {result['retained_bytes_per_session'] / 1024:.1f} KB retained per session, "
+                  f"{result['chat_bytes_per_session'] / 1024:.1f} KB in chats and examples, "
+                  f"{result['messages_per_session']:.0f} messages")
+    if args.out_path:
+        with open(args.out_path, "w") as f:
+            json.dump(results, f, indent=1)
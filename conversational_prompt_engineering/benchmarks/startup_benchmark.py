@@ -0,0 +1,103 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import argparse
+import ast
+import json
+import logging
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGETS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_budgets.json")
+ENTRY_POINTS = ["cpe_ui.py", "pages_/evaluation.py", "pages_/faq.py", "pages_/survey.py"]
+NUM_RUNS = 3
+TOLERANCE = 0.2  # a measurement is a regression if it exceeds its budget by more than this fraction
+
+# runs in a fresh interpreter: executes the module level imports of an entry point and reports the time and memory
+_MEASURE_SCRIPT = """
+import json, resource, sys, time
+sys.path.append({package_dir!r})
+code = compile({imports!r}, {entry_point!r}, "exec")
+start = time.perf_counter()
+exec(code, {{"__name__": "__startup_benchmark__"}})
+elapsed = time.perf_counter() - start
+print(json.dumps({{"import_seconds": elapsed, "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "num_modules": len(sys.modules)}}))
+"""
+
+
+def get_module_imports(path):
+    """
+    the source of the import statements at the module level of a file (imports inside functions are lazy)
+    """
+    with open(path, "r") as f:
+        source = f.read()
+    tree = ast.parse(source)
+    nodes = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return "\n".join(ast.get_source_segment(source, node) for node in nodes)
+
+
+def measure_entry_point(entry_point, num_runs=NUM_RUNS):
+    """
+    the median import time and peak RSS of the module level imports of an entry point, each run in a new process
+    (the way the app imports them: from the package dir, with the repository root in the path)
+    """
+    script = _MEASURE_SCRIPT.format(package_dir=os.path.dirname(PACKAGE_DIR), entry_point=entry_point,
+                                    imports=get_module_imports(os.path.join(PACKAGE_DIR, entry_point)))
+    runs = []
+    for _ in range(num_runs):
+        out = subprocess.run([sys.executable, "-c", script], cwd=PACKAGE_DIR, capture_output=True, text=True)
+        if out.returncode != 0:
+            raise RuntimeError(f"importing the modules of {entry_point} failed:\n{out.stderr}")
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {key: float(np.median([r[key] for r in runs])) for key in runs[0]}
+
+
+def run_benchmark(entry_points=ENTRY_POINTS, num_runs=NUM_RUNS):
+    return {entry_point: measure_entry_point(entry_point, num_runs) for entry_point in entry_points}
+
+
+def check_budgets(results, budgets, tolerance=TOLERANCE):
+    """
+    returns a list of the measurements that exceed their budget by more than tolerance
+    """
+    regressions = []
+    for entry_point, measurements in results.items():
+        for key, budget in budgets.get(entry_point, {}).items():
+            if measurements[key] > budget * (1 + tolerance):
+                regressions.append(f"{entry_point}: {key} is {measurements[key]:.2f}, budget is {budget}")
+    return regressions
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--budgets_path', default=BUDGETS_FILE, help='path for a json file with the budget per entry point')
+parser.add_argument('--entry_points', nargs='+', default=ENTRY_POINTS, help='paths relative to the package dir')
+parser.add_argument('--num_runs', type=int, default=NUM_RUNS)
+parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+parser.add_argument('--out_path', help='path for saving the measurements')
+parser.add_argument('--check', action='store_true', help='exit with an error if a budget is exceeded')
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    args = parser.parse_args()
+    results = run_benchmark(args.entry_points, args.num_runs)
+    for entry_point, measurements in results.items():
+        logging.info(f"{entry_point}: {measurements['import_seconds']:.2f} seconds, {measurements['rss_mb']:.0f} MB, "
+                     f"{measurements['num_modules']:.0f} modules")
+    if args.out_path:
+        with open(args.out_path, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.check:
+        with open(args.budgets_path, "r") as f:
+            budgets = json.load(f)
+        regressions = check_budgets(results, budgets, args.tolerance)
+        for regression in regressions:
+            logging.error(f"startup regression: {regression}")
+        sys.exit(1 if regressions else 0)
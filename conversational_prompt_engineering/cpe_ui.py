@@ -8,22 +8,26 @@ import hashlib
 import logging
 import os
 import sys
+import uuid
 import dotenv
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 
 import streamlit as st
-from genai.schema import ChatRole
 from st_pages import Page, show_pages
 from streamlit_js_eval import streamlit_js_eval
 
 from configs.config_utils import load_config
-from conversational_prompt_engineering.backend.callback_chat_manager import CallbackChatManager
+from conversational_prompt_engineering.backend.callback_chat_manager import CallbackChatManager, \
+    MAX_EXAMPLES_TO_SELECT_FROM
 from conversational_prompt_engineering.backend.prompt_building_util import TargetModelHandler
+from conversational_prompt_engineering.backend.util.llm_clients.abst_llm_client import ChatRole
 from conversational_prompt_engineering.backend.util.llm_clients.llm_clients_loader import get_client_classes
+from conversational_prompt_engineering.data.dataset_access import read_texts
 from conversational_prompt_engineering.data.dataset_utils import load_dataset_mapping
 
-from conversational_prompt_engineering.util.csv_file_utils import read_user_csv_file
+from conversational_prompt_engineering.util.csv_file_utils import read_user_csv_file, submit_read_user_csv_file
+from conversational_prompt_engineering.util.stored_session import get_registry, stored_session
 from conversational_prompt_engineering.util.upload_csv_or_choose_dataset_component import \
     create_choose_dataset_component_train,  StartType
 
@@ -32,11 +36,13 @@ version = "callback manager v1.0.7"
 st.set_page_config(layout="wide", menu_items={"About": f"CPE version: {version}"})
 
 MUST_HAVE_UPLOADED_DATA_TO_START = True
+NUM_SWEEP_EVAL_TEXTS = 20
 
 dotenv.load_dotenv()
 
 def reset_chat():
-    streamlit_js_eval(js_expressions="parent.window.location.reload()")
+    # reloads without the query params, which would load the stored session again
+    streamlit_js_eval(js_expressions="parent.window.location.replace(parent.window.location.pathname)")
 
 
 def set_output_dir():
@@ -49,9 +55,49 @@ def set_output_dir():
     return out_folder
 
 
-def callback_cycle():
-    # create the manager if necessary
+@st.fragment(run_every=1)
+def wait_for_uploaded_file():
+    if st.session_state.ingestion_future.done():
+        st.rerun(scope="app")
+    st.info("Reading your file...")
+
+
+def get_uploaded_examples():
+    uploaded_file = st.session_state["csv_file_train"]
+    if isinstance(uploaded_file, str):  # catalog files are read through the cache
+        return read_user_csv_file(uploaded_file)
+    # large uploads are read in a worker thread, and the script run ends until the examples are ready
+    file_key = getattr(uploaded_file, "file_id", id(uploaded_file))
+    if st.session_state.get("ingestion_file_key") != file_key:
+        st.session_state.ingestion_file_key = file_key
+        st.session_state.ingestion_future = submit_read_user_csv_file(uploaded_file,
+                                                                      max_rows=MAX_EXAMPLES_TO_SELECT_FROM,
+                                                                      sample=True, columns=["text"])
+    if not st.session_state.ingestion_future.done():
+        wait_for_uploaded_file()
+        return None
+    return st.session_state.ingestion_future.result()
+
+
+def create_manager():
+    output_dir = set_output_dir()
+    file_handler = logging.FileHandler(os.path.join(output_dir, "out.log"))
+    logger = logging.getLogger()
+    logger.addHandler(file_handler)
+
+    st.session_state.manager = CallbackChatManager(model=st.session_state.model,
+                                                   target_model=st.session_state.target_model,
+                                                   llm_client=st.session_state.llm_client_class,
+                                                   output_dir=output_dir,
+                                                   config_name=st.session_state["config_name"],
+                                                   profiling_mode=st.session_state["config"].get(
+                                                       "General", "profiling_mode", fallback="spans"))
+    get_registry().register(st.session_state.manager)
+    st.session_state.session_id = uuid.uuid4().hex
+    st.query_params["session"] = st.session_state.session_id
+
 
+def callback_cycle():
     if 'existing_chat_loaded' not in st.session_state:
         st.session_state['existing_chat_loaded'] = False
 
@@ -62,23 +108,11 @@ def callback_cycle():
     # else:
     #     existing_chat_path = ""
 
-    if "manager" not in st.session_state:
-        output_dir = set_output_dir()
-        file_handler = logging.FileHandler(os.path.join(output_dir, "out.log"))
-        logger = logging.getLogger()
-        logger.addHandler(file_handler)
-
-        st.session_state.manager = CallbackChatManager(model=st.session_state.model,
-                                                       target_model=st.session_state.target_model,
-                                                       llm_client=st.session_state.llm_client_class,
-                                                       output_dir=output_dir,
-                                                       config_name=st.session_state["config_name"])
-
     manager = st.session_state.manager
 
     # layout reset and upload buttons in 3 columns
     if st.button("Reset chat"):
-        streamlit_js_eval(js_expressions="parent.window.location.reload()")
+        reset_chat()
 
     static_welcome_msg = \
         "Hello! I'm an IBM prompt building assistant. In the following session we will work together through a natural conversation, to build an effective instruction – a.k.a. prompt – personalized for your task and data. Note that the prompt will be created to operate on each example individually. Therefore, if your task involves multiple texts, such as multi-document summarization, a single input example should include multiple texts."
@@ -89,8 +123,11 @@ def callback_cycle():
     if not "csv_file_train" in st.session_state:
         st.session_state[f"csv_file_train"] = None
     start_type = create_choose_dataset_component_train(st=st, manager=manager)
+    examples_df = None
     if start_type == StartType.Uploaded:
-        manager.add_user_message_only_to_user_chat("Selected data")
+        examples_df = get_uploaded_examples()
+        if examples_df is not None:
+            manager.add_user_message_only_to_user_chat("Selected data")
 
     static_upload_data_msg = "To begin, please select a dataset from our datasets catalog above."
     with st.chat_message(ChatRole.ASSISTANT):
@@ -115,8 +152,8 @@ def callback_cycle():
 
         # generate and render the agent response
     with st.spinner("Thinking..."):
-        if start_type == StartType.Uploaded:
-            manager.process_examples(read_user_csv_file(st.session_state["csv_file_train"]), st.session_state[
+        if examples_df is not None:
+            manager.process_examples(examples_df, st.session_state[
                 "selected_dataset"] if "selected_dataset" in st.session_state else "user")
         messages = manager.generate_agent_messages()
         for msg in messages:
@@ -145,6 +182,42 @@ def callback_cycle():
             mime="text"
         )
 
+    if manager.prompt_token_costs is not None:
+        costs = manager.prompt_token_costs
+        st.caption(f"Estimated prompt tokens per call: {costs['zero_shot']} (zero shot), {costs['few_shot']} "
+                   f"(few shot, {costs['num_shots']} of {costs['num_shots_available']} examples fit the context)")
+
+    if manager.few_shot_prompt is not None:
+        if manager.compressed_prompt is None:
+            if st.button("Compress few shot prompt"):
+                with st.spinner("Generating outputs with compressed variants of the prompt..."):
+                    manager.compress_few_shot_prompt()
+                st.rerun()
+        else:
+            st.dataframe(manager.compression_table, hide_index=True)
+            st.download_button(
+                label="Download compressed prompt",
+                data=manager.compressed_prompt,
+                file_name='compressed_prompt.txt',
+                mime="text"
+            )
+
+        if manager.model_sweep_table is None:
+            if st.button("Compare target models"):
+                with st.spinner("Generating outputs with all the target models..."):
+                    manager.sweep_target_models(get_sweep_eval_texts())
+                st.rerun()
+        else:
+            st.dataframe(manager.model_sweep_table, hide_index=True)
+
+
+def get_sweep_eval_texts():
+    # for catalog datasets, the models are also compared on texts from the eval split
+    dataset_dirs = st.session_state["dataset_name_to_dir"].get(st.session_state.get("selected_dataset"), {})
+    if "eval" not in dataset_dirs:
+        return []
+    return read_texts(dataset_dirs["eval"], nrows=NUM_SWEEP_EVAL_TEXTS)
+
 
 def submit_button_clicked(target_model):
     def get_secret_key(env_var_name, text_area_key):
@@ -284,6 +357,12 @@ if __name__ == "__main__":
         ]
     )
 
-    set_up_is_done = init_set_up_page()
-    if set_up_is_done:
-        callback_cycle()
+    with stored_session():
+        set_up_is_done = init_set_up_page()
+        if set_up_is_done:
+            if "manager" not in st.session_state:
+                create_manager()
+            # the manager is not offloaded while the cycle runs, also in the run that created it
+            with get_registry().activity(st.session_state.manager), \
+                    st.session_state.manager.profiler.turn("callback_cycle"):
+                callback_cycle()
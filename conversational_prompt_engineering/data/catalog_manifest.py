@@ -0,0 +1,119 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+PUBLIC_DATA_DIR = os.path.join(DATA_DIR, "public")
+MANIFEST_FILE = os.path.join(PUBLIC_DATA_DIR, "manifest.json")
+CHARS_PER_TOKEN = 4  # rough estimate for english text
+PERCENTILES = [50, 90, 95, 99, 100]
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def estimate_num_tokens(num_chars):
+    return np.ceil(np.asarray(num_chars) / CHARS_PER_TOKEN).astype(int)
+
+
+def _file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _percentiles(values):
+    if len(values) == 0:
+        return {}
+    return {f"p{p}": int(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def split_stats(path):
+    df = pd.read_csv(path)
+    stats = {"num_rows": len(df), "columns": df.columns.tolist(), "num_bytes": os.path.getsize(path),
+             "sha256": _file_hash(path)}
+    if "text" in df.columns:
+        text_lengths = df["text"].fillna("").astype(str).str.len().to_numpy()
+        stats["text_length"] = _percentiles(text_lengths)
+        stats["text_tokens"] = _percentiles(estimate_num_tokens(text_lengths))
+    return stats
+
+
+def manifest_key(path):
+    return os.path.relpath(os.path.abspath(path), DATA_DIR).replace(os.sep, "/")
+
+
+def build_manifest(public_data_dir=PUBLIC_DATA_DIR):
+    """
+    scan data/public/*/ and record statistics for every split
+    """
+    manifest = {"chars_per_token": CHARS_PER_TOKEN, "splits": {}}
+    for path in sorted(glob.glob(os.path.join(public_data_dir, "*", "*.csv"))):
+        manifest["splits"][manifest_key(path)] = split_stats(path)
+    return manifest
+
+
+def save_manifest(manifest, manifest_file=MANIFEST_FILE):
+    with open(manifest_file, "w") as f:
+        json.dump(manifest, f, indent=1)
+
+
+def _is_stale(manifest, public_data_dir):
+    paths = glob.glob(os.path.join(public_data_dir, "*", "*.csv"))
+    if len(paths) != len(manifest["splits"]):
+        return True
+    for path in paths:
+        stats = manifest["splits"].get(manifest_key(path))
+        if stats is None or stats["num_bytes"] != os.path.getsize(path):
+            return True
+    return False
+
+
+def load_manifest(manifest_file=MANIFEST_FILE, public_data_dir=PUBLIC_DATA_DIR):
+    """
+    load the manifest once per process. A missing or stale manifest (a split was added or changed size) is rebuilt.
+    """
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            manifest = None
+            if os.path.exists(manifest_file):
+                with open(manifest_file, "r") as f:
+                    manifest = json.load(f)
+            if manifest is None or _is_stale(manifest, public_data_dir):
+                logging.info("dataset manifest is missing or stale, rebuilding it")
+                manifest = build_manifest(public_data_dir)
+                try:
+                    save_manifest(manifest, manifest_file)
+                except OSError as e:
+                    logging.warning(f"could not save the dataset manifest: {e}")
+            _manifest = manifest
+        return _manifest
+
+
+def get_split_stats(path):
+    """
+    statistics of a catalog data file, or None for files that are not in the manifest (e.g. user uploads)
+    """
+    if not isinstance(path, str):
+        return None
+    return load_manifest()["splits"].get(manifest_key(path))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    save_manifest(build_manifest())
+    logging.info(f"manifest saved to {MANIFEST_FILE}")
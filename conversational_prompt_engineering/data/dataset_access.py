@@ -0,0 +1,151 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # without pyarrow we read the csv files directly
+    pa = None
+    pq = None
+
+DATASET_CACHE_DIR = os.environ.get("CPE_DATASET_CACHE_DIR", os.path.join(os.path.dirname(__file__), ".cache"))
+MAX_CACHED_BYTES = int(os.environ.get("CPE_DATASET_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+
+class DataFrameCache:
+    """
+    process-wide LRU cache of parsed data frames, bounded by the memory the frames use
+    """
+
+    def __init__(self, max_bytes=MAX_CACHED_BYTES):
+        self.max_bytes = max_bytes
+        self.frames = OrderedDict()
+        self.num_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.frames:
+                return None
+            self.frames.move_to_end(key)
+            return self.frames[key][0]
+
+    def put(self, key, df):
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.frames:
+                self.num_bytes -= self.frames.pop(key)[1]
+            self.frames[key] = (df, size)
+            self.num_bytes += size
+            while self.num_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.frames.popitem(last=False)
+                self.num_bytes -= evicted_size
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.num_bytes = 0
+
+
+frames_cache = DataFrameCache()
+_conversion_lock = threading.Lock()
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+
+def get_columnar_path(csv_path):
+    """
+    return the path of the parquet copy of a csv file, converting it on first use. The copy is keyed by the csv path,
+    modification time and size, so an updated csv is converted again.
+    """
+    if pq is None:
+        return None
+    abs_path, mtime, size = _file_signature(csv_path)
+    key = hashlib.md5(f"{abs_path}:{mtime}:{size}".encode()).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    parquet_path = os.path.join(DATASET_CACHE_DIR, f"{os.path.basename(os.path.dirname(abs_path))}_{name}_{key}.parquet")
+    if os.path.exists(parquet_path):
+        return parquet_path
+    with _conversion_lock:
+        if not os.path.exists(parquet_path):
+            os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+            df = pd.read_csv(csv_path)
+            tmp_path = f"{parquet_path}.{os.getpid()}.tmp"
+            pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+            os.replace(tmp_path, parquet_path)
+            logging.info(f"converted {csv_path} to {parquet_path}")
+    return parquet_path
+
+
+def _read_parquet(parquet_path, columns, nrows):
+    parquet_file = pq.ParquetFile(parquet_path, memory_map=True)
+    if nrows is None:
+        return parquet_file.read(columns=columns).to_pandas()
+    batches = []
+    num_rows = 0
+    for batch in parquet_file.iter_batches(batch_size=nrows, columns=columns):
+        batches.append(batch)
+        num_rows += batch.num_rows
+        if num_rows >= nrows:
+            break
+    if not batches:
+        return parquet_file.schema_arrow.empty_table().select(columns or parquet_file.schema_arrow.names).to_pandas()
+    return pa.Table.from_batches(batches).slice(0, nrows).to_pandas()
+
+
+def read_dataset(path, columns=None, nrows=None, sample=None, random_state=0):
+    """
+    read a catalog data file, only the given columns and only the first nrows rows (or a random sample of sample rows).
+    The returned frames are shared by all the sessions through the process-wide cache and should not be modified.
+    """
+    columns = list(columns) if columns is not None else None
+    key = (_file_signature(path), tuple(columns) if columns is not None else None, nrows, sample, random_state)
+    df = frames_cache.get(key)
+    if df is not None:
+        return df
+
+    parquet_path = get_columnar_path(path)
+    if parquet_path is not None:
+        df = _read_parquet(parquet_path, columns, nrows)
+    else:
+        df = pd.read_csv(path, usecols=columns, nrows=nrows)
+    if sample is not None and len(df) > sample:
+        df = df.sample(n=sample, random_state=random_state)  # the index keeps the row numbers in the file
+    frames_cache.put(key, df)
+    return df
+
+
+def read_texts(path, nrows=None, sample=None):
+    return read_dataset(path, columns=["text"], nrows=nrows, sample=sample)["text"].tolist()
+
+
+def convert_catalog(dataset_name_to_dir):
+    """
+    convert all the data files of the catalog to the columnar format in advance
+    """
+    for dataset_dirs in dataset_name_to_dir.values():
+        for split, path in dataset_dirs.items():
+            if split != "desc" and os.path.exists(path):
+                get_columnar_path(path)
+
+
+if __name__ == "__main__":
+    from conversational_prompt_engineering.data.main_dataset_name_to_dir import dataset_name_to_dir
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    convert_catalog(dataset_name_to_dir)
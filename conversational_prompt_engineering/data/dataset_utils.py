@@ -4,11 +4,19 @@
 # http://www.apache.org/licenses/LICENSE-2.0
 
 import importlib
+import threading
+
+_dataset_mappings = {}
+_dataset_mappings_lock = threading.Lock()
+
 
 def load_dataset_mapping(config):
-    #setup datasets loading script:
+    #setup datasets loading script (once per process, the mapping is shared by all the sessions):
     script_path_name = config.get("UI", "ds_script")
-    spec = importlib.util.spec_from_file_location('module_name', script_path_name)
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
-    return getattr(module, "dataset_name_to_dir")
+    with _dataset_mappings_lock:
+        if script_path_name not in _dataset_mappings:
+            spec = importlib.util.spec_from_file_location('module_name', script_path_name)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            _dataset_mappings[script_path_name] = getattr(module, "dataset_name_to_dir")
+    return _dataset_mappings[script_path_name]
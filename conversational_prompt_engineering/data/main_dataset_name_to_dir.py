@@ -30,4 +30,14 @@ dataset_name_to_dir = {
                             "eval_llm": "./data/public/wiki_movies/test_full.csv",
                             "desc": "This dataset consists of movies pages extracted from \nWikipedia"},
 
+                       "CFPB complaints": {"train": "./data/public/cfpb/train.csv",
+                            "eval": "./data/public/cfpb/test.csv",
+                            "eval_llm": "./data/public/cfpb/test_full.csv",
+                            "desc": "This dataset consists of consumer complaints submitted to the \nConsumer Financial Protection Bureau (CFPB). The full test split is labelled with the complaint product."},
+
+                       "Reuters news": {"train": "./data/public/reuters/train.csv",
+                            "eval": "./data/public/reuters/test.csv",
+                            "eval_llm": "./data/public/reuters/test_full.csv",
+                            "desc": "This is part of the Reuters-21578 news collection. \nThe full test split is labelled with the article topics."},
+
                        }
\ No newline at end of file
@@ -4,17 +4,24 @@ import logging
 import os
 from enum import Enum
 
-import pandas as pd
 import streamlit as st
 from streamlit.components.v1 import html
 
 from enum import Enum
 from conversational_prompt_engineering.backend.prompt_building_util import TargetModelHandler
 from conversational_prompt_engineering.backend.evaluation_core import Evaluation
+from conversational_prompt_engineering.backend.annotation_log import AnnotationLog
+from conversational_prompt_engineering.backend.evaluation_jobs import get_job_runner, JobStatus
+from conversational_prompt_engineering.backend.classification_evaluation import ClassificationEvaluation, \
+    LABEL_COLUMN, save_classification_results
+from conversational_prompt_engineering.data.catalog_manifest import get_split_stats
+from conversational_prompt_engineering.data.dataset_access import read_dataset
+from conversational_prompt_engineering.util.stored_session import get_registry, stored_session
 from conversational_prompt_engineering.util.upload_csv_or_choose_dataset_component import \
     create_choose_dataset_component_eval
 
 MIN_NUM_EXAMPLES_TO_UPLOAD = 5
+JOB_POLLING_INTERVAL_SECONDS = 2
 
 
 class WorkMode(Enum):
@@ -58,7 +65,9 @@ def build_f_sh_prompt():
     few_shot_examples = st.session_state.manager.approved_outputs[:st.session_state.manager.validated_example_idx]
     return TargetModelHandler().format_prompt(model=st.session_state.manager.target_llm_client.parameters['model_id'],
                                               prompt=st.session_state.manager.approved_prompts[-2 if work_mode == WorkMode.DUMMY_PROMPT else -1]['prompt'],
-                                              texts_and_outputs=few_shot_examples)
+                                              texts_and_outputs=few_shot_examples,
+                                              model_params=st.session_state.manager.target_llm_client.parameters,
+                                              expected_text_tokens=st.session_state.manager.expected_text_tokens)
 
 
 prompt_type_metadata = {"baseline": {"title": "Prompt 1 (Baseline prompt)", "build_func": build_baseline_prompt},
@@ -101,32 +110,151 @@ def calculate_results():
     return prompts, len(ranked_elements)
 
 
-def save_results(output_suffix):
+def get_eval_out_path():
     out_path = os.path.join(st.session_state.manager.out_dir, "eval")
     os.makedirs(out_path, exist_ok=True)
-    #reorder shuffled data:
-    ordered_generate_data = sorted(st.session_state.generated_data, key=lambda x: x["index"])
-
-    df = pd.DataFrame(ordered_generate_data)
-    for dim in dimensions:
-        for rank in annotation_options:
-            df[f"ranked_prompt_{(dim,rank)}"] = df["prompts"].apply(lambda x: x.get((dim, rank)))
-            df[f"sides_{(dim,rank)}"] = df["sides"].apply(lambda x: x.get((dim, rank)))
-    df = df.drop(["sides", "prompts"], axis=1)
-    df.to_csv(os.path.join(out_path, f"eval_results{output_suffix}.csv"))
-    with open(os.path.join(out_path, f"metadata.json"), "w") as f:
+    return out_path
+
+
+def save_metadata():
+    with open(os.path.join(get_eval_out_path(), f"metadata.json"), "w") as f:
         prompts_dict = {}
         res_dict = {"dataset": st.session_state["selected_dataset"], "prompts" : prompts_dict}
         for i in range(len(st.session_state.eval_prompts)):
             prompts_dict[f"prompt_{i}"] = {"prompt_text": st.session_state.eval_prompts[i], "prompt_type": prompt_types[i]}
         json.dump(res_dict, f)
 
+
+def save_results(output_suffix):
+    out_path = get_eval_out_path()
+    df = st.session_state.annotation_log.results_frame(st.session_state.generated_data, dimensions,
+                                                       annotation_options)
+    df.to_csv(os.path.join(out_path, f"eval_results{output_suffix}.csv"))
+    save_metadata()
+
+def calculate_reference_scores():
+    # catalog eval files may come with gold outputs, in which case we score the generated outputs against them
+    from conversational_prompt_engineering.backend.reference_scoring import load_references, score_generated_data, \
+        aggregate_with_bootstrap
+
+    st.session_state.reference_scores = None
+    eval_file = st.session_state.get("csv_file_eval")
+    if not isinstance(eval_file, str):
+        return
+    references = load_references(eval_file)
+    if not references:
+        return
+    scores_df = score_generated_data(st.session_state.generated_data, references, prompt_types)
+    if len(scores_df) == 0:
+        return
+    metrics = ["rouge1_f1", "rouge2_f1", "rougeL_f1", "pred_length", "length_ratio"]
+    aggregated_df = aggregate_with_bootstrap(scores_df, prompt_types, metrics=metrics)
+    out_path = os.path.join(st.session_state.manager.out_dir, "eval")
+    os.makedirs(out_path, exist_ok=True)
+    scores_df.to_csv(os.path.join(out_path, "reference_scores.csv"), index=False)
+    aggregated_df.to_csv(os.path.join(out_path, "reference_scores_aggregated.csv"), index=False)
+    st.session_state.reference_scores = aggregated_df
+
+
+def display_reference_scores():
+    if st.session_state.get("reference_scores") is None:
+        return
+    with st.expander("Reference-based scores (click to expand)"):
+        df = st.session_state.reference_scores.copy()
+        df["prompt_type"] = df["prompt_type"].apply(lambda x: prompt_type_metadata.get(x)["title"])
+        st.dataframe(df, hide_index=True)
+
+
+def get_labelled_split():
+    if "selected_dataset" not in st.session_state:
+        return None
+    dataset_dirs = st.session_state["dataset_name_to_dir"].get(st.session_state["selected_dataset"], {})
+    path = dataset_dirs.get("eval_llm")
+    stats = get_split_stats(path) if path is not None else None
+    if stats is None or LABEL_COLUMN not in stats["columns"]:
+        return None
+    return path
+
+
+def run_classification_evaluation(path):
+    df = read_dataset(path, columns=["text", LABEL_COLUMN]).dropna(subset=["text", LABEL_COLUMN])
+    evaluation = ClassificationEvaluation(st.session_state.manager.target_llm_client,
+                                          timeline=st.session_state.manager.timeline)
+    results, predictions_df = evaluation.evaluate(st.session_state.eval_prompts, prompt_types,
+                                                  df["text"].tolist(), df[LABEL_COLUMN].tolist())
+    save_classification_results(results, predictions_df,
+                                os.path.join(st.session_state.manager.out_dir, "eval", "classification"))
+    st.session_state.classification_results = results
+    st.session_state.manager.save_metrics()
+
+
+def display_classification_results():
+    for prompt_type, res in st.session_state.classification_results.items():
+        st.write(f"{prompt_type_metadata.get(prompt_type)['title']}: accuracy {100 * res['accuracy']:.2f}%, "
+                 f"macro-F1 {100 * res['macro_f1']:.2f}% ({res['num_examples']} examples, "
+                 f"{100 * res['unmapped_rate']:.2f}% outputs could not be mapped to a label)")
+        st.dataframe(res["confusion_matrix"])
+
+
+def get_jobs_dir():
+    output_dir = st.session_state["config"].get("General", "output_dir", fallback="_out/")
+    return os.path.join(output_dir, "jobs")
+
+
+def submit_generation_job(test_texts):
+    job_id = get_job_runner(get_jobs_dir()).submit(st.session_state.evaluation, st.session_state.eval_prompts,
+                                                   prompt_types, test_texts, owner=st.session_state.manager.out_dir)
+    st.session_state.eval_job_id = job_id
+    st.query_params["eval_job"] = job_id
+    st.session_state.generated_data = []
+
+
+def clear_generation_job():
+    st.session_state.eval_job_id = None
+    if "eval_job" in st.query_params:
+        del st.query_params["eval_job"]
+
+
+def load_generated_data(generated_data):
+    st.session_state.generated_data = generated_data
+    for row in st.session_state.generated_data:
+        row['sides'] = {}
+        row['prompts'] = {}
+    st.session_state.count = 0
+    st.session_state.annotation_log = AnnotationLog(os.path.join(get_eval_out_path(), "annotations.jsonl"))
+    save_metadata()
+    calculate_reference_scores()
+
+
+@st.fragment(run_every=JOB_POLLING_INTERVAL_SECONDS)
+def track_generation_job():
+    runner = get_job_runner(get_jobs_dir())
+    job_id = st.session_state.eval_job_id
+    job = runner.get_job(job_id, owner=st.session_state.manager.out_dir)
+    if job is None or job["status"] in [JobStatus.FAILED.value, JobStatus.INTERRUPTED.value]:
+        error = job["error"] if job is not None and job["error"] else "the job is no longer running"
+        st.error(f':heavy_exclamation_mark: Generating outputs failed: {error}. Please try again.')
+        clear_generation_job()
+        st.session_state.manager.save_metrics()
+    elif job["status"] == JobStatus.DONE.value:
+        load_generated_data(runner.get_result(job_id))
+        clear_generation_job()
+        st.session_state.manager.save_metrics()
+        st.rerun(scope="app")
+    else:
+        st.progress(job["num_done"] / max(job["num_total"], 1),
+                    text=f"Generating outputs... ({job['num_done']}/{job['num_total']} texts)")
+
+
 def process_user_selection():
     pass
 
 def reset_evaluation():
     st.session_state.generated_data = []
+    st.session_state.reference_scores = None
+    st.session_state.classification_results = None
     st.session_state.evaluate_clicked = False
+    clear_generation_job()
 
 def validate_annotation():
     is_valid = True
@@ -137,11 +265,15 @@ def validate_annotation():
             # fill in "worst" annotation in case we only annotated "best"
             if len(prompt_types) == 2:
                 worst_index = 1 - best
-                st.session_state.generated_data[i]["sides"][
-                    (dim, "Worst")] = worst_index  # (sides are only 1 and 0)
                 real_prompt_type = \
                 st.session_state.generated_data[i]["mixed_indices_mapping_to_prompt_type"][
                     worst_index]
+                if worst != worst_index:  # the results are saved from the log, so the filled selection is logged
+                    st.session_state.annotation_log.append(text_index=st.session_state.generated_data[i]['index'],
+                                                           dimension=dim, rank="Worst", side=worst_index,
+                                                           prompt_type=real_prompt_type)
+                st.session_state.generated_data[i]["sides"][
+                    (dim, "Worst")] = worst_index  # (sides are only 1 and 0)
                 st.session_state.generated_data[i]['prompts'][(dim, "Worst")] = real_prompt_type
 
             worst = st.session_state.generated_data[i]["sides"][(dim, "Worst")]
@@ -216,11 +348,16 @@ def run():
 
         # get prompts to evaluate
         if 'evaluation' not in st.session_state:
-            st.session_state.evaluation = Evaluation(st.session_state.manager.target_llm_client)
+            st.session_state.evaluation = Evaluation(st.session_state.manager.target_llm_client,
+                                                     timeline=st.session_state.manager.timeline)
 
         assert len(st.session_state.eval_prompts) == len(prompt_types), "number of prompts should be equal to the number of prompt types"
         if 'count' not in st.session_state:
             st.session_state.count = 0
+        if st.session_state.get("generated_data") and 'annotation_log' not in st.session_state:
+            # the session was loaded from the session store, continue its log of annotations
+            st.session_state.annotation_log = AnnotationLog(os.path.join(get_eval_out_path(), "annotations.jsonl"),
+                                                            reset=False)
 
         # show prompts
         prompt_cols = st.columns(len(prompt_types))
@@ -233,18 +370,32 @@ def run():
         # show summarize button
         st.session_state.evaluate_clicked = False
         if test_texts is not None:
-            st.session_state.evaluate_clicked = st.button("Generate outputs")
+            st.session_state.evaluate_clicked = st.button("Generate outputs",
+                                                          disabled=st.session_state.get("eval_job_id") is not None)
+
+        labelled_split = get_labelled_split()
+        if labelled_split is not None:
+            with st.expander("Label accuracy (click to expand)"):
+                st.write("The selected dataset has a labelled evaluation split. Each prompt can be run over the full split "
+                         "and its outputs are mapped to the label set.")
+                if st.button("Evaluate label accuracy"):
+                    with st.spinner('Classifying texts...'):
+                        run_classification_evaluation(labelled_split)
+                if st.session_state.get("classification_results") is not None:
+                    display_classification_results()
 
         # summarize texts using prompts
         if st.session_state.evaluate_clicked:
-            with st.spinner('Generating outputs...'):
-                generated_data = \
-                    st.session_state.evaluation.generate_evaluation_examples(st.session_state.eval_prompts, prompt_types,
-                                                          test_texts)
-                st.session_state.generated_data = generated_data
-                for row in st.session_state.generated_data:
-                    row['sides'] = {}
-                    row['prompts'] = {}
+            submit_generation_job(test_texts)
+        if "eval_job_id" not in st.session_state and "eval_job" in st.query_params:
+            # attach to a job that this session submitted before it reconnected
+            job_id = st.query_params["eval_job"]
+            if get_job_runner(get_jobs_dir()).get_job(job_id, owner=st.session_state.manager.out_dir) is not None:
+                st.session_state.eval_job_id = job_id
+            else:
+                clear_generation_job()
+        if st.session_state.get("eval_job_id") is not None:
+            track_generation_job()
 
         def add_next_buttons(s):
             col1, col2, col3, col4, col5 = st.columns([1]*5)
@@ -258,6 +409,7 @@ def run():
 
         # showing texts and summaries to evaluate
         if 'generated_data' in st.session_state and len(st.session_state.generated_data) > 0:
+            display_reference_scores()
             st.header(f"Text {st.session_state.count+1}/{len(st.session_state.generated_data)}", divider="gray")
             add_next_buttons("above_summaries")
             display_text()
@@ -299,24 +451,27 @@ def run():
                                 index=default_value
                                 )
                         if selected_value:
-                            logging.info(f"selected {selected_value} for ({dim},{op}) for item {st.session_state.count}. ")
                             side_index = radio_button_labels.index(selected_value)
-                            mixed_to_real = st.session_state.generated_data[st.session_state.count][
-                                "mixed_indices_mapping_to_prompt_type"][side_index]
-                            output = st.session_state.generated_data[st.session_state.count][f"{mixed_to_real}_output"]
-                            logging.info(f"\toutput = {output[:200]}")
-                            logging.info(f"\tselected value = {selected_value} (side index = {side_index})")
-                            real_prompt_type = st.session_state.generated_data[st.session_state.count]["mixed_indices_mapping_to_prompt_type"][side_index]
-                            logging.info(f"\treal prompt type = {real_prompt_type}")
-                            logging.info(f"\treal example index = {st.session_state.generated_data[st.session_state.count]['index']}")
-                            st.session_state.generated_data[st.session_state.count]['sides'][(dim,op)] = side_index
-                            st.session_state.generated_data[st.session_state.count]['prompts'][(dim,op)] = real_prompt_type
-                            save_results("_partial")
+                            current_row = st.session_state.generated_data[st.session_state.count]
+                            real_prompt_type = current_row["mixed_indices_mapping_to_prompt_type"][side_index]
+                            if current_row['sides'].get((dim, op)) != side_index:
+                                logging.info(f"selected {selected_value} for ({dim},{op}) for item {st.session_state.count}. ")
+                                logging.info(f"\toutput = {current_row[f'{real_prompt_type}_output'][:200]}")
+                                logging.info(f"\tselected value = {selected_value} (side index = {side_index})")
+                                logging.info(f"\treal prompt type = {real_prompt_type}")
+                                logging.info(f"\treal example index = {current_row['index']}")
+                                st.session_state.annotation_log.append(text_index=current_row['index'], dimension=dim,
+                                                                       rank=op, side=side_index,
+                                                                       prompt_type=real_prompt_type)
+                            current_row['sides'][(dim,op)] = side_index
+                            current_row['prompts'][(dim,op)] = real_prompt_type
                 st.divider()
 
             num_of_fully_annotated_items = len([x["prompts"] for x in st.session_state.generated_data if len(x["prompts"]) == len(dimensions)*len(options)])
             st.write(f"Annotation for {num_of_fully_annotated_items} out of {len(st.session_state.generated_data)} examples is completed")
             min_examples_to_evaluate = st.session_state["config"].getint("Evaluation", "min_examples_to_evaluate", fallback=0)
+            if st.button("Save partial results"):
+                save_results("_partial")
             finish_clicked = st.button(f"Submit", disabled = num_of_fully_annotated_items < max(1, min(min_examples_to_evaluate, len(st.session_state.generated_data))) # we must annotate at least one example
                                                              )
             if finish_clicked:
@@ -337,4 +492,9 @@ def run():
                     st.write("Your annotation is saved. Thank you for contributing to the CPE project!")
 
 if __name__ == "__main__":
-    run()
+    with stored_session():
+        if 'manager' in st.session_state:
+            with get_registry().activity(st.session_state.manager):
+                run()
+        else:
+            run()
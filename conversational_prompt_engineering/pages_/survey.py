@@ -1,6 +1,5 @@
 import streamlit as st
 import os
-import pandas as pd
 
 
 def get_chosen_prompt():
@@ -25,6 +24,8 @@ questions = [f"1\. I’m satisfied with the baseline prompt **{get_baseline_prom
 answers = [None]* len(questions)
 
 def save_survey(free_text):
+    import pandas as pd
+
     out_path = os.path.join(st.session_state.manager.out_dir, "survey")
     os.makedirs(out_path, exist_ok=True)
     df = pd.DataFrame({f"q_{i}" : [answers[i] ]for i in range(len(questions))})
@@ -0,0 +1,24 @@
+from conversational_prompt_engineering.backend.annotation_log import AnnotationLog
+
+
+def test_last_selection_wins_and_survives_reopening(tmp_path):
+    path = str(tmp_path / "eval" / "annotations.jsonl")
+    log = AnnotationLog(path)
+    log.append(text_index=7, dimension="dim", rank="Best", side=0, prompt_type="baseline")
+    log.append(text_index=3, dimension="dim", rank="Best", side=1, prompt_type="few_shot")
+    log.append(text_index=7, dimension="dim", rank="Best", side=1, prompt_type="few_shot")  # re-selection
+    assert log.latest_annotations() == {7: {("dim", "Best"): (1, "few_shot")}, 3: {("dim", "Best"): (1, "few_shot")}}
+
+    # a reopened log continues from the logged selections, unless it is reset
+    reopened = AnnotationLog(path, reset=False)
+    reopened.append(text_index=3, dimension="dim", rank="Worst", side=0, prompt_type="baseline")
+    assert len(reopened.read_events()) == 4
+
+    generated_data = [{"index": i, "text": f"text {i}", "sides": {}, "prompts": {}} for i in [7, 5, 3]]
+    df = reopened.results_frame(generated_data, ["dim"], ["Best", "Worst"])
+    assert list(df["index"]) == [3, 5, 7] and "sides" not in df.columns
+    assert list(df["ranked_prompt_('dim', 'Best')"]) == ["few_shot", None, "few_shot"]
+    assert list(df["ranked_prompt_('dim', 'Worst')"]) == ["baseline", None, None]
+    assert df["sides_('dim', 'Worst')"].iloc[0] == 0 and df["sides_('dim', 'Worst')"].iloc[1:].isna().all()
+
+    assert AnnotationLog(path).read_events() == []
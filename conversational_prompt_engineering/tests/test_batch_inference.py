@@ -0,0 +1,70 @@
+import json
+
+from conversational_prompt_engineering.backend.batch_inference import BatchInferenceRunner, build_session_template, \
+    iter_input_rows, load_session
+from conversational_prompt_engineering.backend.prompt_building_util import PromptTemplate, TargetModelHandler
+
+
+class UpperClient:
+    parameters = {"model_id": "meta-llama/llama-3-70b-instruct", "max_new_tokens": 100, "max_total_tokens": 8000}
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+
+    def send_messages_batch(self, conversations, max_new_tokens=None):
+        if self.fail_on and any(self.fail_on in c for c in conversations):
+            raise Exception("service unavailable")
+        return [c.upper() for c in conversations], {}
+
+
+def _read_outputs(path):
+    records = {}
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            records[record["row"]] = record
+    return records
+
+
+def test_run_and_resume(tmp_path):
+    input_path = tmp_path / "input.csv"
+    input_path.write_text("id,text\n" + "".join(f"{i},text {i}\n" for i in range(50)))
+    output_path = str(tmp_path / "out" / "outputs.jsonl")
+    template = PromptTemplate("<", ">")
+
+    runner = BatchInferenceRunner(UpperClient(fail_on="text 7"), template, batch_size=4, max_workers=2)
+    report = runner.run(iter_input_rows(str(input_path), id_column="id"), output_path)
+    assert report["num_rows"] == 50 and report["num_errors"] == 4 and report["error_rate"] == 4 / 50
+    assert _read_outputs(output_path)[7]["error"] == "service unavailable"
+
+    runner = BatchInferenceRunner(UpperClient(), template, batch_size=4, max_workers=2)
+    report = runner.run(iter_input_rows(str(input_path), id_column="id"), output_path)
+    assert report["num_skipped"] == 46 and report["num_rows"] == 4 and report["num_errors"] == 0
+    records = _read_outputs(output_path)
+    assert len(records) == 50 and records[7] == {"row": 7, "id": "7", "output": "<TEXT 7>"}
+
+
+def test_resume_after_partial_write(tmp_path):
+    input_path = tmp_path / "input.jsonl"
+    input_path.write_text("".join(json.dumps({"text": f"text {i}"}) + "\n" for i in range(5)))
+    output_path = tmp_path / "outputs.jsonl"
+    output_path.write_text('{"row": 0, "output": "done"}\n{"row": 1, "outp')
+    report = BatchInferenceRunner(UpperClient(), PromptTemplate("", ""), batch_size=2).run(
+        iter_input_rows(str(input_path)), str(output_path))
+    assert report["num_skipped"] == 1 and report["num_rows"] == 4
+    assert _read_outputs(output_path)[0]["output"] == "done" and len(_read_outputs(output_path)) == 5
+
+
+def test_session_template_has_the_shots_of_the_session_prompt(tmp_path):
+    params = {"model_id": "meta-llama/llama-3-70b-instruct", "max_new_tokens": 100, "max_total_tokens": 2000}
+    examples = [f"example {i} " + f"word{i} " * 200 for i in range(4)]
+    chat_result = {"examples": examples, "accepted_outputs": [f"output {i}" for i in range(4)],
+                   "prompts": ["Summarize."], "target_model": params["model_id"], "expected_text_tokens": 50}
+    (tmp_path / "chat_result.json").write_text(json.dumps(chat_result))
+
+    shots = [{"text": t, "output": o} for t, o in zip(examples, chat_result["accepted_outputs"])]
+    session_prompt = TargetModelHandler().format_prompt(params["model_id"], "Summarize.", shots, model_params=params,
+                                                        expected_text_tokens=50)
+    default_prompt = TargetModelHandler().format_prompt(params["model_id"], "Summarize.", shots, model_params=params)
+    assert session_prompt != default_prompt  # the default text budget leaves room for fewer shots
+    assert str(build_session_template(load_session(str(tmp_path)), "few_shot", params)) == session_prompt
@@ -0,0 +1,28 @@
+import json
+
+from conversational_prompt_engineering.backend.chat_messages import ChatMessage, json_default
+from conversational_prompt_engineering.backend.util.llm_clients.abst_llm_client import ChatRole
+
+
+def test_message_behaves_like_a_dict():
+    msg = ChatMessage(ChatRole.SYSTEM, "hello", example_num=1, prompt_iteration=None)
+
+    assert msg == {'role': ChatRole.SYSTEM, 'content': 'hello', 'example_num': 1, 'prompt_iteration': None}
+    assert list(msg.keys()) == ['role', 'content', 'example_num', 'prompt_iteration']
+    assert msg.get('missing', 'default') == 'default' and msg['example_num'] == 1
+    msg['example_num'] = None
+    msg['tooltip'] = 'a tooltip'
+    assert dict(msg) == {'role': 'system', 'content': 'hello', 'example_num': None, 'prompt_iteration': None,
+                         'tooltip': 'a tooltip'}
+    assert json.loads(json.dumps({"chat": [msg]}, default=json_default))["chat"][0]["tooltip"] == 'a tooltip'
+    assert ChatMessage.from_dict({'role': 'user', 'content': 'hi', 'example_num': 2})['role'] is ChatRole.USER
+
+
+def test_content_parts_refer_to_the_text():
+    example = "a long example text " * 100
+    msg = ChatMessage(ChatRole.SYSTEM, ("Example 1: ", example), example_num=1)
+
+    assert msg['content'] == "Example 1: " + example
+    assert msg._content[1] is example
+    # messages with the same small tags share them
+    assert ChatMessage(ChatRole.USER, "other", example_num=1)._tags is msg._tags
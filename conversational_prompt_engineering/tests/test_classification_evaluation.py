@@ -0,0 +1,40 @@
+import numpy as np
+
+from conversational_prompt_engineering.backend.classification_evaluation import map_output_to_label, \
+    parse_gold_labels, compute_classification_metrics, ClassificationEvaluation, UNMAPPED_LABEL
+
+label_set = ["acquisition", "crude", "earnings"]
+
+
+class EchoClient:
+    parameters = {"model_id": "echo", "max_new_tokens": 100, "max_total_tokens": 4096}
+
+    def send_messages_batch(self, conversations, max_new_tokens=None):
+        return [c.split("|")[1] for c in conversations], {}
+
+
+def test_map_output_to_label():
+    assert map_output_to_label("Crude.", label_set) == "crude"
+    assert map_output_to_label("The topic is earnings, not crude", label_set) == "earnings"
+    assert map_output_to_label("no idea", label_set) == UNMAPPED_LABEL
+    assert parse_gold_labels("['crude', 'acquisition']") == ["crude", "acquisition"]
+
+
+def test_metrics_and_confusion_matrix():
+    gold = [["acquisition"], ["crude", "acquisition"], ["earnings"], ["crude"]]
+    pred = ["acquisition", "acquisition", "crude", UNMAPPED_LABEL]
+    res = compute_classification_metrics(gold, pred, label_set)
+    assert np.isclose(res["accuracy"], 0.5)
+    assert res["confusion_matrix"].loc["earnings", "crude"] == 1
+    assert res["confusion_matrix"].loc["crude", UNMAPPED_LABEL] == 1
+    # f1: acquisition 1.0, crude 0.0, earnings 0.0
+    assert np.isclose(res["macro_f1"], 1 / 3)
+
+
+def test_evaluate_batches_all_prompt_types():
+    texts = [f"text {i}" for i in range(10)]
+    labels = ["['crude']"] * 10
+    evaluation = ClassificationEvaluation(EchoClient(), batch_size=3, max_workers=2)
+    results, predictions_df = evaluation.evaluate(["{text}|crude", "{text}|earnings"], ["good", "bad"], texts, labels)
+    assert len(predictions_df) == 20
+    assert results["good"]["accuracy"] == 1.0 and results["bad"]["accuracy"] == 0.0
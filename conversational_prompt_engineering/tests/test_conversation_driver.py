@@ -0,0 +1,48 @@
+import pandas as pd
+
+from conversational_prompt_engineering.backend.callback_chat_manager import CallbackChatManager
+from conversational_prompt_engineering.backend.conversation_driver import ConversationDriver, LLMPersonaUser, \
+    ScriptedUser
+from conversational_prompt_engineering.benchmarks.fake_llm_client import ScriptedAssistantLLMClient
+from conversational_prompt_engineering.benchmarks.load_test import DEFAULT_ANSWERS
+
+TEXTS = [f"text number {i} about a different subject {i * 7}" for i in range(10)]
+
+
+class PersonaClient:
+    parameters = {"model_id": "meta-llama/llama-3-70b-instruct", "max_new_tokens": 100, "max_total_tokens": 8000}
+
+    def __init__(self):
+        self.conversations = []
+
+    def send_messages(self, conversation, max_new_tokens=None):
+        self.conversations.append(conversation)
+        return ["Yes, that works for me."], {}
+
+
+def create_manager(tmp_path):
+    ScriptedAssistantLLMClient.set_latency("none")
+    return CallbackChatManager(model="llama-3", target_model="llama-3", llm_client=ScriptedAssistantLLMClient,
+                               output_dir=str(tmp_path), config_name="test")
+
+
+def test_scripted_user_reaches_the_end(tmp_path):
+    summary = ConversationDriver(create_manager(tmp_path), ScriptedUser(DEFAULT_ANSWERS)).run(
+        pd.DataFrame({"text": TEXTS}), "test", example_indices=[0, 1, 2])
+
+    assert summary["completed"]
+    assert summary["num_turns"] == len(DEFAULT_ANSWERS) + 1
+    assert summary["few_shot_prompt"] is not None and len(summary["prompts"]) == 1
+    assert summary["llm_calls"] == sum(summary["llm_calls_by_type"].values()) > 0
+    assert summary["prompt_tokens"] > 0 and summary["user_llm_calls"] == 0
+
+
+def test_persona_user_sees_the_assistant_messages(tmp_path):
+    client = PersonaClient()
+    user = LLMPersonaUser(client, "one sentence summaries in a formal tone")
+    summary = ConversationDriver(create_manager(tmp_path), user, max_turns=4).run(
+        pd.DataFrame({"text": TEXTS}), "test", example_indices=[0, 1, 2])
+
+    assert summary["num_turns"] == 4
+    assert summary["user_llm_calls"] == 3 and summary["user_output_tokens"] > 0
+    assert "formal tone" in client.conversations[0] and "a prompt to begin from" in client.conversations[0]
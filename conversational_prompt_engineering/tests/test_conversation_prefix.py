@@ -0,0 +1,46 @@
+import pytest
+
+from conversational_prompt_engineering.backend.callback_chat_manager import CallbackChatManager, ModelPrompts
+from conversational_prompt_engineering.backend.chat_manager_util import format_chat
+from conversational_prompt_engineering.backend.chat_messages import ChatMessage
+from conversational_prompt_engineering.backend.conversation_prefix import get_conversation_prefix
+from conversational_prompt_engineering.backend.util.llm_clients.abst_llm_client import ChatRole
+from conversational_prompt_engineering.benchmarks.fake_llm_client import ScriptedAssistantLLMClient
+
+EXAMPLES = ["the first example text", "the second example text", "the third example text"]
+MODEL_PARAMS = {"llama": {"model_id": "meta-llama/llama-3-70b-instruct", "max_new_tokens": 2048,
+                          "max_total_tokens": 8196, "chars_per_token": 4.2},
+                "mixtral": {"model_id": "mistralai/mixtral-8x7b-instruct-v01", "max_new_tokens": 4096,
+                            "max_total_tokens": 32768, "chars_per_token": 3.5}}
+
+
+@pytest.mark.parametrize("model", ["llama", "mixtral"])
+def test_prefix_format_matches_format_chat(model):
+    prefix = get_conversation_prefix(MODEL_PARAMS[model], ModelPrompts(), "test", EXAMPLES)
+    chat = list(prefix.messages) + [ChatMessage(ChatRole.ASSISTANT, 'self.switch_to_example(2)'),
+                                    ChatMessage(ChatRole.SYSTEM, 'discuss example 2', example_num=2),
+                                    ChatMessage(ChatRole.USER, 'looks good', prompt_iteration=1)]
+    filtered = [m for m in chat if m.get('example_num') in (None, 2)]
+    model_id = MODEL_PARAMS[model]["model_id"]
+
+    assert prefix.format_chat(chat, (2, None)) == format_chat(chat, model_id)
+    assert prefix.format_chat(filtered, (2, None)) == format_chat(filtered, model_id)
+    assert prefix.variant(2)[1] in prefix.format_chat(filtered, (2, None))
+    # a chat that does not begin with the prefix is formatted in full
+    assert prefix.format_chat(chat[1:], (None,)) == format_chat(chat[1:], model_id)
+
+
+def test_sessions_share_the_prefix(tmp_path):
+    ScriptedAssistantLLMClient.set_latency("none")
+    managers = [CallbackChatManager(model="llama-3", target_model="llama-3", llm_client=ScriptedAssistantLLMClient,
+                                    output_dir=str(tmp_path / str(i)), config_name="test") for i in range(2)]
+    for manager in managers:
+        manager.dataset_name = "test"
+        manager.init_chat(list(EXAMPLES))
+
+    num_shared = len(managers[0].chat_prefix.messages)
+    assert managers[0].chat_prefix is managers[1].chat_prefix
+    assert all(a is b for a, b in zip(managers[0].model_chat[:num_shared], managers[1].model_chat[:num_shared]))
+    assert managers[0].model_chat[num_shared] is not managers[1].model_chat[num_shared]
+    with pytest.raises(TypeError):
+        managers[0].model_chat[0]['example_num'] = 1
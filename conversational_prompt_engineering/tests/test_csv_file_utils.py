@@ -0,0 +1,115 @@
+import io
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from conversational_prompt_engineering.backend.callback_chat_manager import CallbackChatManager
+from conversational_prompt_engineering.benchmarks.fake_llm_client import ScriptedAssistantLLMClient
+from conversational_prompt_engineering.util import csv_file_utils
+from conversational_prompt_engineering.util.csv_file_utils import _collect_rows, read_user_csv_file
+
+
+class UploadedFile(io.BytesIO):
+    """
+    the file object that streamlit gives for an upload
+    """
+
+    def __init__(self, data, type):
+        super().__init__(data)
+        self.type = type
+
+
+def chunks_of(df, chunk_rows):
+    for i in range(0, len(df), chunk_rows):
+        yield df.iloc[i:i + chunk_rows]
+
+
+def xlsx_bytes(rows):
+    # a minimal workbook with inline strings, so that no excel writer is needed
+    sheet_rows = "".join(
+        f'<row r="{r + 1}">' + "".join(f'<c r="{chr(65 + c)}{r + 1}" t="inlineStr"><is><t>{value}</t></is></c>'
+                                       for c, value in enumerate(row)) + "</row>" for r, row in enumerate(rows))
+    files = {
+        "[Content_Types].xml":
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/></Types>',
+        "_rels/.rels":
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="xl/workbook.xml" Type="http://schemas.openxmlformats.org/'
+            'officeDocument/2006/relationships/officeDocument"/></Relationships>',
+        "xl/workbook.xml":
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets></workbook>',
+        "xl/_rels/workbook.xml.rels":
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="worksheets/sheet1.xml" Type="http://schemas.openxmlformats.org/'
+            'officeDocument/2006/relationships/worksheet"/></Relationships>',
+        "xl/worksheets/sheet1.xml":
+            '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            f'<sheetData>{sheet_rows}</sheetData></worksheet>',
+    }
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as f:
+        for name, content in files.items():
+            f.writestr(name, content)
+    return buffer.getvalue()
+
+
+def test_reservoir_sample_is_deterministic_ordered_and_uniform():
+    df = pd.DataFrame({"text": [f"text {i}" for i in range(60)], "n": np.arange(60)})
+    sample = _collect_rows(chunks_of(df, 7), 12, True, random_state=3)
+    assert len(sample) == 12 and list(sample.columns) == ["text", "n"]
+    assert sample["n"].is_monotonic_increasing and list(sample.index) == list(sample["n"])
+    assert all(sample["text"] == [f"text {n}" for n in sample["n"]])
+    assert sample.equals(_collect_rows(chunks_of(df, 7), 12, True, random_state=3))
+    assert not sample.equals(_collect_rows(chunks_of(df, 7), 12, True, random_state=4))
+
+    # every row is in the sample with probability 12 / 60, wherever it is in the file
+    counts = np.zeros(len(df))
+    num_samples = 500
+    for seed in range(num_samples):
+        counts[_collect_rows(chunks_of(df, 7), 12, True, random_state=seed)["n"]] += 1
+    assert np.all(np.abs(counts / num_samples - 0.2) < 0.08)
+
+
+def test_first_rows_stop_the_reading():
+    df = pd.DataFrame({"text": [f"text {i}" for i in range(100)]})
+    chunks = chunks_of(df, 10)
+    first = _collect_rows(chunks, 25, False, random_state=0)
+    assert list(first["text"]) == [f"text {i}" for i in range(25)]
+    assert len(next(chunks)) == 10 and next(chunks).iloc[0]["text"] == "text 40"  # three chunks were read
+
+
+def test_non_utf8_and_excel_uploads():
+    texts = ["café au lait", "naïve façade", "plain text"]
+    csv = pd.DataFrame({"text": texts, "label": [1, 2, 3]}).to_csv(index=False).encode("cp1252")
+    df = read_user_csv_file(UploadedFile(csv, "text/csv"), columns=["text"])
+    assert list(df.columns) == ["text"] and list(df["text"]) == texts
+
+    xlsx = xlsx_bytes([["text", "label"]] + [[t, "x"] for t in texts])
+    excel_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    df = read_user_csv_file(UploadedFile(xlsx, excel_type), columns=["text"])
+    assert list(df.columns) == ["text"] and list(df["text"]) == texts
+
+
+def test_sampled_upload_keeps_the_rows_of_the_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(csv_file_utils, "CHUNK_ROWS", 8)
+    texts = [f"text number {i} about subject {i % 7} and topic {i % 5}" for i in range(50)]
+    csv = pd.DataFrame({"text": texts}).to_csv(index=False).encode("utf-8")
+    df = read_user_csv_file(UploadedFile(csv, "text/csv"), max_rows=10, sample=True)
+    assert len(df) == 10 and df.index.is_monotonic_increasing and list(df["text"]) == [texts[i] for i in df.index]
+
+    # the examples of the chat are saved as rows of the uploaded file, not of the sample
+    ScriptedAssistantLLMClient.set_latency("none")
+    manager = CallbackChatManager(model="llama-3", target_model="llama-3", llm_client=ScriptedAssistantLLMClient,
+                                  output_dir=str(tmp_path), config_name="test")
+    manager.process_examples(df, "user")
+    assert set(manager.example_indices) <= set(df.index)
+    assert manager.examples == [texts[i] for i in manager.example_indices]
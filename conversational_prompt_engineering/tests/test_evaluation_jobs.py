@@ -0,0 +1,60 @@
+import json
+import os
+import time
+
+import pytest
+
+from conversational_prompt_engineering.backend.evaluation_core import Evaluation
+from conversational_prompt_engineering.backend.evaluation_jobs import EvaluationJobRunner, JobStatus
+
+
+class UpperClient:
+    parameters = {"model_id": "upper", "max_new_tokens": 100, "max_total_tokens": 4096}
+
+    def send_messages(self, conversation, max_new_tokens=None):
+        return [conversation.upper()], {}
+
+
+def _wait(runner, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while runner.get_job(job_id, "session")["status"] not in [JobStatus.DONE.value, JobStatus.FAILED.value]:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    return runner.get_job(job_id, "session")
+
+
+def test_job_result_survives_new_runner(tmp_path):
+    runner = EvaluationJobRunner(str(tmp_path))
+    texts = [f"text {i}" for i in range(5)]
+    job_id = runner.submit(Evaluation(UpperClient()), ["a {text}", "b {text}"], ["baseline", "few_shot"], texts,
+                           owner="session")
+    job = _wait(runner, job_id)
+    assert job["num_done"] == 5
+
+    # a rerun in another runner instance attaches to the job through the job table on disk
+    generated_data = EvaluationJobRunner(str(tmp_path)).get_result(job_id)
+    row = sorted(generated_data, key=lambda x: x["index"])[0]
+    assert row["few_shot_output"] == "B TEXT 0"
+    assert set(row["mixed_indices_mapping_to_prompt_type"].keys()) == {0, 1}
+
+
+def test_jobs_are_only_found_by_their_owner(tmp_path):
+    runner = EvaluationJobRunner(str(tmp_path / "jobs"))
+    job_id = runner.submit(Evaluation(UpperClient()), ["a {text}"], ["baseline"], ["text"], owner="session")
+    _wait(runner, job_id)
+    assert runner.get_job(job_id, "another session") is None
+    assert EvaluationJobRunner(str(tmp_path / "jobs")).get_job(job_id, "another session") is None
+
+    # ids from the url that submit could not have created are not looked up
+    (tmp_path / "secret.json").write_text('{"owner": "session", "status": "done"}')
+    assert runner.get_job("../secret", "session") is None
+    with pytest.raises(ValueError):
+        runner.get_result("../secret")
+
+
+def test_job_of_a_restarted_process_with_the_same_pid_is_interrupted(tmp_path):
+    job_id = "0" * 32
+    job = {"job_id": job_id, "owner": "session", "status": JobStatus.RUNNING.value, "pid": os.getpid(),
+           "boot_id": "earlier process", "num_done": 1, "num_total": 5, "error": None}
+    (tmp_path / f"{job_id}.json").write_text(json.dumps(job))
+    assert EvaluationJobRunner(str(tmp_path)).get_job(job_id, "session")["status"] == JobStatus.INTERRUPTED.value
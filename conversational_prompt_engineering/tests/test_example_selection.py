@@ -0,0 +1,17 @@
+from conversational_prompt_engineering.backend.example_selection import select_diverse_examples
+
+topics = ["the mortgage payment was reported late to the credit bureau although it was paid on time",
+          "the football team won the championship after a dramatic penalty shootout in the final",
+          "the new telescope captured detailed images of a distant galaxy and its spiral arms"]
+
+
+def test_selection_covers_all_clusters():
+    texts = [f"{topics[i % 3]} (report number {i})" for i in range(300)]
+    selected = select_diverse_examples(texts, 3)
+    assert len(set(selected)) == 3
+    assert {i % 3 for i in selected} == {0, 1, 2}
+    assert select_diverse_examples(texts, 3) == selected  # deterministic, so a saved chat can be reloaded
+
+
+def test_short_inputs():
+    assert select_diverse_examples(["a", "b"], 3) == [0, 1]
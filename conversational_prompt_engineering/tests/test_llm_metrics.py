@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from conversational_prompt_engineering.backend.chat_manager_util import ChatManagerBase
+from conversational_prompt_engineering.backend.profiling import ProfilingMode, TurnProfiler
+from conversational_prompt_engineering.backend.llm_metrics import CallType, LLMMetrics, SessionTimeline, \
+    StreamingHistogram, get_llm_metrics
+
+
+def test_streaming_histogram():
+    histogram = StreamingHistogram([1, 2, 4])
+    for value in [0.5, 1.5, 1.5, 3, 10]:
+        histogram.observe(value)
+    assert histogram.counts == [1, 2, 1, 1] and histogram.count == 5 and histogram.sum == 16.5
+    assert histogram.quantile(0.5) == 2 and histogram.quantile(1.0) == float("inf")
+
+
+def test_prometheus_text():
+    metrics = LLMMetrics()
+    metrics.observe_call(CallType.ASSISTANT_TURN, "llama", 0.3, 100, 20)
+    metrics.observe_call(CallType.ASSISTANT_TURN, "llama", 3.0, 200, 20, error=True)
+    text = metrics.to_prometheus_text()
+    assert 'cpe_llm_call_latency_seconds_bucket{call_type="assistant_turn",model="llama",le="0.5"} 1' in text
+    assert 'cpe_llm_call_latency_seconds_bucket{call_type="assistant_turn",model="llama",le="+Inf"} 2' in text
+    assert 'cpe_llm_call_prompt_tokens_sum{call_type="assistant_turn",model="llama"} 300' in text
+    assert 'cpe_llm_call_errors_total{call_type="assistant_turn",model="llama"} 1' in text
+
+
+class FailingClient:
+    parameters = {"model_id": "some-model"}
+
+    def send_messages(self, conversation, max_new_tokens=None):
+        raise Exception("service unavailable")
+
+
+class EchoClient:
+    parameters = {"model_id": "some-model"}
+
+    def send_messages(self, conversation, max_new_tokens=None):
+        return [conversation], {}
+
+
+def test_calls_are_tagged(tmp_path):
+    manager = object.__new__(ChatManagerBase)
+    manager.timeline = SessionTimeline()
+    manager.profiler = TurnProfiler(str(tmp_path), ProfilingMode.OFF)
+    manager.out_dir = str(tmp_path / "session")
+    assert manager._generate_output("a" * 40, EchoClient()) == "a" * 40
+    with pytest.raises(Exception):
+        manager._generate_output_and_log_stats("a prompt", FailingClient(), call_type=CallType.PARSE_REPAIR)
+    manager.save_metrics()
+
+    with open(tmp_path / "session" / "chat" / "timeline.json") as f:
+        timeline = json.load(f)
+    assert [e["call_type"] for e in timeline] == ["target_output", "parse_repair"]
+    assert timeline[0]["prompt_tokens"] == 10 and timeline[0]["output_tokens"] == 10 and "error" not in timeline[0]
+    assert timeline[1]["error"] == "service unavailable"
+    assert (tmp_path / "metrics.prom").read_text() == get_llm_metrics().to_prometheus_text()
+
+
+def test_batch_calls_are_tagged_also_when_they_fail(tmp_path):
+    from conversational_prompt_engineering.backend.batch_inference import BatchInferenceRunner
+    from conversational_prompt_engineering.backend.prompt_building_util import PromptTemplate
+    from conversational_prompt_engineering.tests.test_batch_inference import UpperClient
+
+    timeline = SessionTimeline()
+    errors_before = get_llm_metrics().errors.get(("target_output", UpperClient.parameters["model_id"]), 0)
+    runner = BatchInferenceRunner(UpperClient(fail_on="text 1"), PromptTemplate("<", ">"), batch_size=2,
+                                  max_workers=1, timeline=timeline)
+    runner.run([(i, None, f"text {i}") for i in range(4)], str(tmp_path / "outputs.jsonl"))
+
+    events = sorted(timeline.events, key=lambda e: "error" in e)
+    assert [e["call_type"] for e in events] == ["target_output", "target_output"]
+    assert events[0]["output_tokens"] > 0 and events[1]["error"] == "service unavailable"
+    assert get_llm_metrics().errors[("target_output", UpperClient.parameters["model_id"])] == errors_before + 1
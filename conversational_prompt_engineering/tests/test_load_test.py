@@ -0,0 +1,13 @@
+from conversational_prompt_engineering.benchmarks.load_test import DEFAULT_ANSWERS, run_load_test
+
+
+def test_concurrent_users_complete_the_conversation(tmp_path):
+    report = run_load_test(num_users=3, dataset_names=["Space Newsgroup"], out_dir=str(tmp_path))
+
+    assert report["failed_sessions"] == 0, report["errors"]
+    assert report["completed_sessions"] == 3
+    # the first turn selects the examples, and every answer of the script is a turn
+    assert report["num_turns"] == 3 * (len(DEFAULT_ANSWERS) + 1)
+    assert 0 < report["turn_latency_p50"] <= report["turn_latency_p95"] <= report["turn_latency_p99"]
+    assert report["disk_bytes_written"] > 0
+    assert report["peak_threads"] > 1
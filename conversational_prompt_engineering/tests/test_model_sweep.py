@@ -0,0 +1,39 @@
+import re
+
+from conversational_prompt_engineering.backend.model_sweep import ModelSweep
+
+LLAMA = "meta-llama/llama-3-70b-instruct"
+MIXTRAL = "mistralai/mixtral-8x7b-instruct-v01"
+GRANITE = "ibm/granite-13b-chat-v2"
+
+
+class FakeClient:
+    def __init__(self, model_id, answer, cost_per_1k_tokens=1.0, fail=False):
+        self.parameters = {"model_id": model_id, "max_new_tokens": 100, "max_total_tokens": 8000,
+                           "cost_per_1k_tokens": cost_per_1k_tokens}
+        self.answer = answer
+        self.fail = fail
+
+    def send_messages_batch(self, conversations, max_new_tokens=None):
+        if self.fail:
+            raise Exception("model is not available")
+        return [self.answer(c) for c in conversations], {}
+
+
+def test_cheapest_passing_model():
+    def good(prompt):
+        return "a short summary of " + re.search(r"the text (\w+)", prompt).group(1)
+
+    clients = {LLAMA: FakeClient(LLAMA, good, cost_per_1k_tokens=2.0),
+               MIXTRAL: FakeClient(MIXTRAL, lambda p: "something unrelated", cost_per_1k_tokens=0.1),
+               GRANITE: FakeClient(GRANITE, good, cost_per_1k_tokens=0.5)}
+    examples = ["the text one", "the text two"]
+    accepted = ["a short summary of one", "a short summary of two"]
+    table, best = ModelSweep(clients, LLAMA).sweep("Summarize.", examples, accepted, ["the text three"])
+    assert best["model"] == GRANITE
+    assert list(table["model"]) == [MIXTRAL, GRANITE, LLAMA]
+    assert table.set_index("model").loc[LLAMA, "eval_agreement"] == 1.0
+
+    clients[GRANITE] = FakeClient(GRANITE, good, fail=True)
+    table, best = ModelSweep(clients, LLAMA).sweep("Summarize.", examples, accepted)
+    assert best["model"] == LLAMA and not table.set_index("model").loc[GRANITE, "passed"]
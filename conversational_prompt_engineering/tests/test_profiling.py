@@ -0,0 +1,40 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from conversational_prompt_engineering.backend.profiling import ProfilingMode, SpanCategory, TurnProfiler
+
+
+def _read_turns(out_dir):
+    with open(os.path.join(out_dir, "profiling", "turns.jsonl")) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_turn_breakdown(tmp_path):
+    profiler = TurnProfiler(str(tmp_path), ProfilingMode.CPROFILE)
+
+    def llm_call():
+        with profiler.span("assistant_turn", SpanCategory.LLM):
+            time.sleep(0.05)
+
+    with profiler.turn("callback_cycle"):
+        with profiler.turn("generate_agent_messages"):
+            with ThreadPoolExecutor(max_workers=2) as executor:  # concurrent calls count once
+                list(executor.map(lambda _: llm_call(), range(2)))
+            with profiler.span("save_chat_state", SpanCategory.DISK):
+                time.sleep(0.02)
+
+    [turn] = _read_turns(str(tmp_path))
+    assert turn["name"] == "callback_cycle" and turn["spans"]["assistant_turn"]["count"] == 2
+    assert 0.05 <= turn["llm"] < 0.09 and 0.02 <= turn["disk"] < 0.04
+    assert abs(turn["wall"] - turn["llm"] - turn["disk"] - turn["cpu"]) < 1e-6
+    assert "generate_agent_messages" in turn["spans"]
+    assert os.path.exists(tmp_path / "profiling" / "turn_0001_callback_cycle.prof")
+
+
+def test_off_mode_writes_nothing(tmp_path):
+    profiler = TurnProfiler(str(tmp_path), "off")
+    with profiler.turn("callback_cycle"), profiler.span("save_chat_state", SpanCategory.DISK):
+        pass
+    assert not os.path.exists(tmp_path / "profiling")
@@ -0,0 +1,41 @@
+from conversational_prompt_engineering.backend.prompt_compression import PromptCompression, build_variants, \
+    deduplicate_instruction
+
+model_params = {"model_id": "meta-llama/llama-3-70b-instruct", "max_new_tokens": 100, "max_total_tokens": 8000}
+
+
+class CopyShotClient:
+    """
+    answers with the output of the first few-shot example that is in the prompt, like a model that copies
+    """
+    parameters = model_params
+
+    def send_messages_batch(self, conversations, max_new_tokens=None):
+        outputs = []
+        for c in conversations:
+            outputs.append(next((o for o in ["first output", "second output", "third output"] if o in c), "nothing"))
+        return outputs, {}
+
+
+def test_deduplicate_instruction():
+    assert deduplicate_instruction("Summarize the text. Be brief.\nSummarize the text!") == \
+           "Summarize the text. Be brief."
+    # a sentence that contains an earlier one is not a duplicate of it
+    assert deduplicate_instruction("Be short. Do not use bullet points. Use bullet points.") == \
+           "Be short. Do not use bullet points. Use bullet points."
+    # the line breaks and paragraphs of the instruction are kept
+    assert deduplicate_instruction("Summarize.\n\nKeep the names.\nSummarize!\n\n- Be short.") == \
+           "Summarize.\n\nKeep the names.\n\n- Be short."
+
+
+def test_variants_and_cheapest_passing():
+    examples = ["first text " * 20, "second text " * 20, "third text " * 20]
+    outputs = ["first output", "second output", "third output"]
+    shots = [{'text': t, 'output': o} for t, o in zip(examples, outputs)]
+    names = [v[0] for v in build_variants("Summarize.", shots, model_params)]
+    assert names[0] == "few_shot" and "zero_shot" in names and "dedup_instruction" not in names
+
+    table, best = PromptCompression(CopyShotClient()).compress("Summarize.", examples, outputs)
+    assert list(table["prompt_tokens"]) == sorted(table["prompt_tokens"])
+    assert not table[table["variant"] == "zero_shot"]["passed"].iloc[0]
+    assert best["passed"] and best["prompt_tokens"] < table[table["variant"] == "few_shot"]["prompt_tokens"].iloc[0]
@@ -0,0 +1,47 @@
+from conversational_prompt_engineering.backend.prompt_building_util import TargetModelHandler, get_prompt_template
+
+shots = [{'text': 'first text', 'output': 'first output'}, {'text': 'second text', 'output': 'second output'}]
+
+
+def test_render_many_matches_format_prompt():
+    handler = TargetModelHandler()
+    for model in handler.data:
+        for few_shots in [[], shots[:1], shots]:
+            formatted = handler.format_prompt(model, "summarize the text", few_shots)
+            rendered = handler.render_many(model, "summarize the text", few_shots, ["a text", "another text"])
+            assert rendered == [formatted.format(text="a text"), formatted.format(text="another text")]
+            assert get_prompt_template(formatted).render("a text") == rendered[0]
+
+
+def test_braces_are_kept():
+    handler = TargetModelHandler()
+    model = "meta-llama/llama-3-70b-instruct"
+    rendered = handler.render_many(model, "output json like {\"key\": value}", [{'text': 'a {b}', 'output': '{}'}],
+                                   ["text with {braces}"])[0]
+    assert "{\"key\": value}" in rendered and "a {b}" in rendered and rendered.count("text with {braces}") == 1
+
+
+def test_select_shots_fits_budget():
+    handler = TargetModelHandler()
+    model_params = {"model_id": "meta-llama/llama-3-70b-instruct", "max_new_tokens": 100, "max_total_tokens": 1000}
+    long_shots = [{'text': f'text number {i} ' + 'word ' * 150, 'output': f'output {i}'} for i in range(5)]
+    assert handler.select_shots(model_params['model_id'], "summarize", shots, model_params, 100) == shots
+
+    selected = handler.select_shots(model_params['model_id'], "summarize", long_shots, model_params, 100)
+    assert 0 < len(selected) < len(long_shots)
+    assert selected == [s for s in long_shots if s in selected]  # original order is kept
+    costs = handler.get_prompt_token_costs(model_params, "summarize", long_shots, 100)
+    assert costs["few_shot"] <= model_params["max_total_tokens"] - model_params["max_new_tokens"]
+    assert costs["zero_shot"] < costs["few_shot"] and costs["num_shots"] == len(selected)
+
+
+def test_select_shots_starts_from_the_most_central_example():
+    handler = TargetModelHandler()
+    model_params = {"model_id": "meta-llama/llama-3-70b-instruct", "max_new_tokens": 100, "max_total_tokens": 640}
+    central = [{'text': f'the report on the budget of the city council {i} ' + 'budget council city report ' * 40,
+                'output': f'summary {i}'} for i in range(3)]
+    outlier = {'text': 'a recipe for lemon cake with lemons', 'output': 'cake'}
+    # the budget fits one of the central examples, but not with the cheaper outlier
+    selected = handler.select_shots(model_params['model_id'], "summarize", central[:1] + [outlier] + central[1:],
+                                    model_params, 100)
+    assert len(selected) == 1 and selected[0] in central
@@ -0,0 +1,53 @@
+from collections import Counter
+
+import numpy as np
+
+from conversational_prompt_engineering.backend.reference_scoring import score_pairs, tokenize, \
+    score_generated_data, aggregate_with_bootstrap
+
+
+def _naive_rouge_n(pred, ref, n):
+    p, r = tokenize(pred), tokenize(ref)
+    p_ngrams = Counter(tuple(p[i:i + n]) for i in range(len(p) - n + 1))
+    r_ngrams = Counter(tuple(r[i:i + n]) for i in range(len(r) - n + 1))
+    overlap = sum((p_ngrams & r_ngrams).values())
+    return overlap, sum(p_ngrams.values()), sum(r_ngrams.values())
+
+
+def _naive_lcs(pred, ref):
+    p, r = tokenize(pred), tokenize(ref)
+    table = [[0] * (len(r) + 1) for _ in range(len(p) + 1)]
+    for i in range(len(p)):
+        for j in range(len(r)):
+            table[i + 1][j + 1] = table[i][j] + 1 if p[i] == r[j] else max(table[i][j + 1], table[i + 1][j])
+    return table[-1][-1]
+
+
+predictions = ["the cat sat on the mat", "a quick brown fox", "", "the the the", "hello world again and again"]
+references = ["the cat is on the mat", "the quick brown dog jumps", "empty prediction", "the", "again hello world"]
+
+
+def test_rouge_matches_naive_implementation():
+    scores = score_pairs(predictions, references)
+    for i, (pred, ref) in enumerate(zip(predictions, references)):
+        for n in [1, 2]:
+            overlap, num_pred, num_ref = _naive_rouge_n(pred, ref, n)
+            expected_recall = overlap / num_ref if num_ref else 0.0
+            expected_precision = overlap / num_pred if num_pred else 0.0
+            assert np.isclose(scores.loc[i, f"rouge{n}_recall"], expected_recall)
+            assert np.isclose(scores.loc[i, f"rouge{n}_precision"], expected_precision)
+        lcs = _naive_lcs(pred, ref)
+        expected_recall = lcs / len(tokenize(ref)) if tokenize(ref) else 0.0
+        assert np.isclose(scores.loc[i, "rougeL_recall"], expected_recall)
+    assert scores["pred_length"].tolist() == [len(tokenize(p)) for p in predictions]
+
+
+def test_bootstrap_per_prompt_type():
+    generated_data = [{"text": r, "index": i, "baseline_output": p, "few_shot_output": r}
+                      for i, (p, r) in enumerate(zip(predictions, references))]
+    scores = score_generated_data(generated_data, dict(zip(references, references)), ["baseline", "few_shot"])
+    aggregated = aggregate_with_bootstrap(scores, num_samples=200)
+    few_shot_f1 = aggregated[(aggregated.prompt_type == "few_shot") & (aggregated.metric == "rouge1_f1")].iloc[0]
+    assert np.isclose(few_shot_f1["mean"], 1.0) and np.isclose(few_shot_f1["ci_low"], 1.0)
+    baseline_f1 = aggregated[(aggregated.prompt_type == "baseline") & (aggregated.metric == "rougeL_f1")].iloc[0]
+    assert baseline_f1["ci_low"] <= baseline_f1["mean"] <= baseline_f1["ci_high"]
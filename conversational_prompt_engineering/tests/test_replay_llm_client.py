@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+from conversational_prompt_engineering.backend.chat_manager_util import create_model_client
+from conversational_prompt_engineering.backend.util.llm_clients.llm_clients_loader import get_client_classes
+from conversational_prompt_engineering.backend.util.llm_clients.recording_llm_client import RecordingLLMClient
+from conversational_prompt_engineering.backend.util.llm_clients.replay_llm_client import ReplayLLMClient
+
+model_params = {"model_id": "meta-llama/llama-3-70b-instruct", "max_new_tokens": 100, "max_total_tokens": 8000}
+
+
+class SlowCounterClient:
+    def __init__(self):
+        self.num_calls = 0
+
+    def prompt_llm(self, conversation, max_new_tokens=None):
+        time.sleep(0.05)
+        self.num_calls += 1
+        return [f"{conversation} #{self.num_calls}"]
+
+    def prompt_llm_batch(self, conversations, max_new_tokens=None):
+        return [self.prompt_llm(c, max_new_tokens)[0] for c in conversations]
+
+
+def test_record_and_replay(tmp_path):
+    path = str(tmp_path / "recordings.jsonl")
+    recording = RecordingLLMClient("", model_params, recorded_client=SlowCounterClient(), recordings_path=path)
+    assert recording.send_messages("hello")[0] == ["hello #1"]
+    assert recording.send_messages("hello")[0] == ["hello #2"]
+    assert recording.send_messages_batch(["a", "b"], max_new_tokens=5)[0] == ["a #3", "b #4"]
+
+    replay = ReplayLLMClient("", model_params, recordings_path=path, latency="none")
+    start_time = time.time()
+    assert replay.send_messages("hello")[0] == ["hello #1"]
+    assert replay.send_messages("hello")[0] == ["hello #2"]
+    assert replay.send_messages_batch(["b", "a"], max_new_tokens=5)[0] == ["b #4", "a #3"]
+    assert time.time() - start_time < 0.05
+    with pytest.raises(KeyError):
+        replay.prompt_llm("a")  # recorded with another max_new_tokens
+
+    recorded_latency = ReplayLLMClient("", model_params, recordings_path=path)
+    start_time = time.time()
+    recorded_latency.send_messages("hello")
+    assert time.time() - start_time >= 0.05
+
+
+def test_clients_are_registered(tmp_path, monkeypatch):
+    monkeypatch.setenv("CPE_RECORDINGS_PATH", str(tmp_path / "recordings.jsonl"))
+    (tmp_path / "recordings.jsonl").write_text("")
+    replay_class = get_client_classes(["ReplayLLMClient"])[0]
+    assert replay_class is ReplayLLMClient and replay_class.credentials_params() == {}
+    assert create_model_client("llama-3", replay_class).parameters["model_id"] == model_params["model_id"]
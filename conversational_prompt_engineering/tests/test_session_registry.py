@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+
+import pandas as pd
+
+from conversational_prompt_engineering.backend.callback_chat_manager import CallbackChatManager, SNAPSHOT_FILE_NAME
+from conversational_prompt_engineering.backend.conversation_driver import ConversationDriver, ScriptedUser
+from conversational_prompt_engineering.backend.session_registry import SessionRegistry
+from conversational_prompt_engineering.benchmarks.fake_llm_client import ScriptedAssistantLLMClient
+from conversational_prompt_engineering.benchmarks.load_test import DEFAULT_ANSWERS
+
+TEXTS = [f"text number {i} about a different subject {i * 7}" for i in range(10)]
+
+
+def start_session(out_dir, num_answers=2):
+    ScriptedAssistantLLMClient.set_latency("none")
+    manager = CallbackChatManager(model="llama-3", target_model="llama-3", llm_client=ScriptedAssistantLLMClient,
+                                  output_dir=str(out_dir), config_name="test")
+    ConversationDriver(manager, ScriptedUser(DEFAULT_ANSWERS[:num_answers])).run(
+        pd.DataFrame({"text": TEXTS}), "test", example_indices=[0, 1, 2])
+    return manager
+
+
+def test_offloaded_session_is_rehydrated_on_access(tmp_path):
+    manager = start_session(tmp_path)
+    model_chat = [dict(m) for m in manager.model_chat]
+    sent_words = manager.llm_client.sent_words_count
+
+    manager.offload()
+    assert manager.is_offloaded and "model_chat" not in vars(manager) and "llm_client" not in vars(manager)
+    assert os.path.exists(os.path.join(tmp_path, SNAPSHOT_FILE_NAME))
+
+    assert [dict(m) for m in manager.model_chat] == model_chat
+    assert not manager.is_offloaded and not os.path.exists(os.path.join(tmp_path, SNAPSHOT_FILE_NAME))
+    assert manager.model_chat[0] is manager.chat_prefix.messages[0]
+    assert manager.llm_client.sent_words_count == sent_words
+
+    # the conversation goes on after the rehydration
+    for answer in DEFAULT_ANSWERS[2:]:
+        manager.add_user_message(answer)
+        manager.generate_agent_messages()
+    assert manager.prompt_conv_end
+
+
+def test_reading_during_the_offload_waits_and_rehydrates(tmp_path):
+    manager = start_session(tmp_path)
+    model_chat = [dict(m) for m in manager.model_chat]
+    results = []
+
+    def read_model_chat():
+        try:
+            results.append([dict(m) for m in manager.model_chat])
+        except AttributeError as e:
+            results.append(e)
+
+    class ReadingInTheMiddle(CallbackChatManager):
+        # another thread reads the state after the first offloaded attribute is deleted
+        def __delattr__(self, name):
+            super().__delattr__(name)
+            if name == "model_chat":
+                reader = threading.Thread(target=read_model_chat)
+                reader.start()
+                reader.join(timeout=0.2)
+                self.reader = reader
+
+    manager.__class__ = ReadingInTheMiddle
+    manager.offload()
+    manager.reader.join()
+    assert results == [model_chat] and not manager.is_offloaded
+
+
+def test_setting_offloaded_state_rehydrates_first(tmp_path):
+    manager = start_session(tmp_path)
+    manager.offload()
+    manager.prompts = ["a new prompt"]
+    assert not manager.is_offloaded and manager.prompts == ["a new prompt"] and len(manager.user_chat) > 0
+
+
+def test_sweep_offloads_idle_and_least_recent_sessions(tmp_path):
+    registry = SessionRegistry(idle_seconds=60, max_memory_mb=1024)
+    idle, recent, active = [start_session(tmp_path / name) for name in ["idle", "recent", "active"]]
+    for manager in [idle, recent, active]:
+        with registry.activity(manager):
+            pass
+    registry._get_entry(idle).last_activity = time.time() - 120
+
+    assert registry.sweep() == 1
+    assert idle.is_offloaded and not recent.is_offloaded
+
+    # over the memory limit, the least recently active sessions are offloaded, but not an active one
+    registry.max_memory_bytes = 0
+    with registry.activity(active):
+        assert registry.sweep() == 1
+        assert recent.is_offloaded and not active.is_offloaded
@@ -0,0 +1,55 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from conversational_prompt_engineering.backend.session_store import SessionConflictError, SQLiteSessionStore, \
+    load_session, save_session
+from conversational_prompt_engineering.benchmarks.load_test import DEFAULT_ANSWERS
+from conversational_prompt_engineering.tests.test_session_registry import start_session
+
+
+def advance_session(db_path, session_id, answer):
+    store = SQLiteSessionStore(db_path)
+    manager, ui_state = load_session(store, session_id)
+    manager.add_user_message(answer)
+    manager.generate_agent_messages()
+    save_session(store, session_id, manager, {"num_turns": ui_state["num_turns"] + 1})
+    return os.getpid()
+
+
+def test_workers_take_turns_in_advancing_a_session(tmp_path):
+    db_path = str(tmp_path / "sessions.db")
+    manager = start_session(tmp_path / "session")
+    save_session(SQLiteSessionStore(db_path), "s1", manager, {"num_turns": 0})
+
+    answers = DEFAULT_ANSWERS[2:]
+    # the workers are started as separate processes, as streamlit processes are, and not forked with an open store
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(1, mp_context=context) as worker1, ProcessPoolExecutor(1, mp_context=context) as worker2:
+        pids = {[worker1, worker2][i % 2].submit(advance_session, db_path, "s1", answer).result()
+                for i, answer in enumerate(answers)}
+    assert len(pids) == 2 and os.getpid() not in pids
+
+    loaded, ui_state = load_session(SQLiteSessionStore(db_path), "s1")
+    assert ui_state["num_turns"] == len(answers) and loaded.store_version == 1 + len(answers)
+    assert loaded.prompt_conv_end and len(loaded.user_chat) > len(manager.user_chat)
+    assert loaded.model_chat[0] is loaded.chat_prefix.messages[0]
+
+
+def test_stale_save_is_rejected(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    save_session(store, "s1", start_session(tmp_path / "session"))
+    (first, _), (second, _) = load_session(store, "s1"), load_session(store, "s1")
+
+    # an unchanged session is not saved again
+    assert save_session(store, "s1", first) == 1
+    first.add_user_message(DEFAULT_ANSWERS[2])
+    assert save_session(store, "s1", first) == 2
+    second.add_user_message(DEFAULT_ANSWERS[3])
+    with pytest.raises(SessionConflictError):
+        save_session(store, "s1", second)
+    # a new session may not take the id of a stored one
+    with pytest.raises(SessionConflictError):
+        save_session(store, "s1", start_session(tmp_path / "other"))
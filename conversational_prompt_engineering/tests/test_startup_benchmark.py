@@ -0,0 +1,26 @@
+import subprocess
+import sys
+
+from conversational_prompt_engineering.benchmarks.startup_benchmark import check_budgets, get_module_imports
+
+
+def test_check_budgets():
+    budgets = {"cpe_ui.py": {"import_seconds": 1.0, "rss_mb": 100}}
+    assert check_budgets({"cpe_ui.py": {"import_seconds": 1.1, "rss_mb": 90}}, budgets, tolerance=0.2) == []
+    regressions = check_budgets({"cpe_ui.py": {"import_seconds": 1.3, "rss_mb": 90}}, budgets, tolerance=0.2)
+    assert len(regressions) == 1 and "import_seconds" in regressions[0]
+
+
+def test_function_level_imports_are_not_measured(tmp_path):
+    path = tmp_path / "entry.py"
+    path.write_text("import os\nfrom json import (dumps,\n    loads)\n\ndef f():\n    import pandas\n")
+    assert get_module_imports(str(path)) == "import os\nfrom json import (dumps,\n    loads)"
+
+
+def test_llm_sdks_are_loaded_lazily():
+    code = "import sys\n" \
+           "from conversational_prompt_engineering.backend.util.llm_clients.llm_clients_loader import get_client_classes\n" \
+           "from conversational_prompt_engineering.backend.callback_chat_manager import CallbackChatManager\n" \
+           "print([m for m in ['ibm_watsonx_ai', 'genai', 'scipy'] if m in sys.modules])"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
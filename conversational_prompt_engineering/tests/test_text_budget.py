@@ -0,0 +1,17 @@
+from conversational_prompt_engineering.backend.text_budget import fit_text_to_model, estimate_num_tokens, \
+    get_text_token_budget
+
+model_params = {"max_new_tokens": 1024, "max_total_tokens": 8192, "chars_per_token": 4}
+
+
+def test_long_text_is_truncated_with_marker():
+    text = " ".join(f"word{i}" for i in range(10000))
+    budget = get_text_token_budget(model_params)
+    truncated = fit_text_to_model(text, model_params)
+    assert estimate_num_tokens(truncated, model_params) <= budget
+    assert truncated.startswith("word0 word1") and "TEXT TRUNCATED" in truncated
+    assert fit_text_to_model(text, model_params, num_texts=3) != truncated
+
+
+def test_short_text_is_unchanged():
+    assert fit_text_to_model("a short text", model_params) == "a short text"
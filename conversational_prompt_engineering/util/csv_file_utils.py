@@ -3,20 +3,120 @@
 # LICENSE: Apache License 2.0 (Apache-2.0)
 # http://www.apache.org/licenses/LICENSE-2.0
 
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
-from io import BytesIO
 import chardet
 
+from conversational_prompt_engineering.data.dataset_access import read_dataset
+
+ENCODING_SAMPLE_BYTES = 64 * 1024  # the encoding is detected from a prefix of the file
+CHUNK_ROWS = 5000
+MAX_INGESTION_WORKERS = 4
+
+ingestion_executor = ThreadPoolExecutor(max_workers=MAX_INGESTION_WORKERS, thread_name_prefix="cpe-ingestion")
+
+
+def detect_encoding(uploaded_file):
+    sample = uploaded_file.read(ENCODING_SAMPLE_BYTES)
+    uploaded_file.seek(0)
+    encoding = chardet.detect(sample)['encoding']
+    if encoding is None or encoding.lower() == 'ascii':
+        return 'utf-8'  # an ascii prefix says nothing about the rest of the file
+    return encoding
+
+
+def _usecols(columns):
+    return None if columns is None else (lambda c: c in columns)
+
+
+def _iter_csv_chunks(uploaded_file, columns):
+    encoding = detect_encoding(uploaded_file)
+    # the prefix may not be representative, so undecodable bytes are replaced rather than failing the upload
+    yield from pd.read_csv(uploaded_file, encoding=encoding, encoding_errors='replace', chunksize=CHUNK_ROWS,
+                           usecols=_usecols(columns))
+
+
+def _iter_excel_chunks(uploaded_file, columns):
+    from python_calamine import CalamineWorkbook
+
+    rows = CalamineWorkbook.from_filelike(uploaded_file).get_sheet_by_index(0).iter_rows()
+    header = [str(h) for h in next(rows, [])]
+    keep = [i for i, h in enumerate(header) if columns is None or h in columns]
+    batch = []
+    for row in rows:
+        batch.append([row[i] if i < len(row) else None for i in keep])
+        if len(batch) == CHUNK_ROWS:
+            yield pd.DataFrame(batch, columns=[header[i] for i in keep])
+            batch = []
+    if batch or not keep:
+        yield pd.DataFrame(batch, columns=[header[i] for i in keep])
+
+
+def _collect_rows(chunks, max_rows, sample, random_state):
+    """
+    keep the first max_rows rows and stop reading, or, with sample=True, keep a uniform reservoir sample of max_rows
+    rows of the whole file. Only one chunk and the collected rows are in memory at any time. The index of the
+    returned rows is their row number in the file.
+    """
+    if max_rows is None:
+        return pd.concat(list(chunks), ignore_index=True)
+    if not sample:
+        collected, num_rows = [], 0
+        for chunk in chunks:
+            collected.append(chunk.iloc[:max_rows - num_rows])
+            num_rows += len(collected[-1])
+            if num_rows >= max_rows:
+                break
+        return pd.concat(collected, ignore_index=True)
+
+    rng = np.random.default_rng(random_state)
+    reservoir = None
+    positions = np.zeros(0, dtype=np.int64)  # original row numbers of the reservoir rows
+    num_seen = 0
+    for chunk in chunks:
+        chunk = chunk.reset_index(drop=True)
+        if reservoir is None:
+            reservoir = chunk.iloc[:0]
+        num_free = max(max_rows - len(reservoir), 0)
+        if num_free > 0:
+            reservoir = pd.concat([reservoir, chunk.iloc[:num_free]], ignore_index=True)
+            positions = np.concatenate([positions, num_seen + np.arange(min(num_free, len(chunk)))])
+        # algorithm R for the rest of the chunk: row number i replaces a random slot with probability max_rows / (i + 1)
+        rest = np.arange(num_free, len(chunk))
+        slots = rng.integers(0, num_seen + rest + 1) if len(rest) else rest
+        accepted = slots < max_rows
+        # a slot that is replaced more than once in the chunk ends with its last row, so the replacements of the
+        # chunk are applied at once
+        slots, first = np.unique(slots[accepted][::-1], return_index=True)
+        rows = rest[accepted][::-1][first]
+        if len(slots):
+            take = np.arange(len(reservoir))
+            take[slots] = len(reservoir) + np.arange(len(slots))
+            reservoir = pd.concat([reservoir, chunk.iloc[rows]], ignore_index=True).iloc[take].reset_index(drop=True)
+            positions[slots] = num_seen + rows
+        num_seen += len(chunk)
+    if reservoir is None:
+        return pd.DataFrame()
+    order = np.argsort(positions, kind='stable')
+    return reservoir.iloc[order].set_axis(positions[order])
+
 
-def read_user_csv_file(uploaded_file):
+def read_user_csv_file(uploaded_file, max_rows=None, sample=False, columns=None, random_state=0):
     if isinstance(uploaded_file, str):  # our data is correctly formatted
-        return pd.read_csv(uploaded_file)
+        return read_dataset(uploaded_file, columns=columns, nrows=None if sample else max_rows,
+                            sample=max_rows if sample else None, random_state=random_state)
     if uploaded_file and 'csv' in uploaded_file.type:
-        bytes_data = uploaded_file.read()
-        assert(len(bytes_data) == uploaded_file.size)
-        encoding = chardet.detect(bytes_data)['encoding']
-        return pd.read_csv(BytesIO(bytes_data), encoding=encoding)
+        uploaded_file.seek(0)
+        return _collect_rows(_iter_csv_chunks(uploaded_file, columns), max_rows, sample, random_state)
     elif uploaded_file and 'sheet' in uploaded_file.type:
-        return pd.read_excel(uploaded_file, engine="calamine") #load xsls
+        uploaded_file.seek(0)
+        return _collect_rows(_iter_excel_chunks(uploaded_file, columns), max_rows, sample, random_state) #load xsls
 
 
+def submit_read_user_csv_file(uploaded_file, **kwargs):
+    """
+    read the file in a worker thread so that large uploads do not block the script run. Returns a future.
+    """
+    return ingestion_executor.submit(read_user_csv_file, uploaded_file, **kwargs)
@@ -0,0 +1,86 @@
+# (c) Copyright contributors to the conversational-prompt-engineering project
+
+# LICENSE: Apache License 2.0 (Apache-2.0)
+# http://www.apache.org/licenses/LICENSE-2.0
+
+import os
+from contextlib import contextmanager
+
+import streamlit as st
+
+from conversational_prompt_engineering.backend.session_registry import DEFAULT_IDLE_MINUTES, DEFAULT_MAX_MEMORY_MB, \
+    get_session_registry
+from conversational_prompt_engineering.backend.session_store import SessionConflictError, get_session_store, \
+    load_session, save_session
+
+# the state of the UI that is saved with the manager, for the other workers to continue from
+PERSISTED_UI_KEYS = ["selected_dataset", "csv_file_train", "csv_file_eval", "existing_chat_loaded", "generated_data",
+                     "count", "eval_job_id", "reference_scores", "classification_results"]
+
+
+def get_registry():
+    # idle sessions are offloaded to disk, and rehydrated when the user returns
+    config = st.session_state["config"]
+    return get_session_registry(
+        idle_minutes=config.getfloat("General", "session_idle_minutes", fallback=DEFAULT_IDLE_MINUTES),
+        max_memory_mb=config.getfloat("General", "max_sessions_memory_mb", fallback=DEFAULT_MAX_MEMORY_MB))
+
+
+def get_store():
+    # with a session store, a session survives a restart, and can be served by any of the workers of the host
+    config = st.session_state.get("config")
+    if config is None or not config.has_option("General", "session_store"):
+        return None
+    output_dir = config.get("General", "output_dir", fallback="_out/")
+    return get_session_store(config.get("General", "session_store"),
+                             config.get("General", "session_store_path",
+                                        fallback=os.path.join(output_dir, "sessions.db")))
+
+
+def load_stored_session(store):
+    """
+    loads the session of the url from the store, if this process has not served it yet, or if another worker saved
+    a newer version of it
+    """
+    session_id = st.session_state.get("session_id") or st.query_params.get("session")
+    if session_id is None:
+        return
+    if "manager" in st.session_state and store.get_version(session_id) <= st.session_state.manager.store_version:
+        return
+    loaded = load_session(store, session_id)
+    if loaded is None:
+        return
+    manager, ui_state = loaded
+    st.session_state.update(ui_state)
+    st.session_state.update(manager=manager, session_id=session_id, model=manager.model,
+                            target_model=manager.target_model, llm_client_class=manager.llm_client_class)
+    get_registry().register(manager)
+
+
+def save_stored_session(store):
+    if "session_id" not in st.session_state or "manager" not in st.session_state:
+        return
+    # uploaded files are not kept, the examples that were read from them are in the manager
+    ui_state = {key: st.session_state[key] for key in PERSISTED_UI_KEYS
+                if key in st.session_state and not hasattr(st.session_state[key], "read")}
+    try:
+        save_session(store, st.session_state.session_id, st.session_state.manager, ui_state)
+    except SessionConflictError:
+        st.warning("This session was continued in another window, its latest state is loaded.")
+        load_stored_session(store)
+
+
+@contextmanager
+def stored_session():
+    """
+    runs a page with the latest state of the session in the store, and saves the session back when the run ends
+    (also when it ends with st.rerun). Without a store in the config, the session is only kept in this process.
+    """
+    store = get_store()
+    if store is not None:
+        load_stored_session(store)
+    try:
+        yield
+    finally:
+        if store is not None:
+            save_stored_session(store)
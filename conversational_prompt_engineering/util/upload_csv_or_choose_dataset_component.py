@@ -5,8 +5,12 @@
 
 from enum import Enum
 
+from conversational_prompt_engineering.data.catalog_manifest import get_split_stats
+from conversational_prompt_engineering.data.dataset_access import read_texts
 from conversational_prompt_engineering.util.csv_file_utils import read_user_csv_file
 
+NUM_OF_EXAMPLES_TO_EVALUATE = 10
+
 
 def add_download_button(st, split_name):
     # this button should be present during all the session.
@@ -15,6 +19,19 @@ def add_download_button(st, split_name):
         st.download_button(f'Download data', f, file_name=f"{selected_file_dir}_{split_name}.csv", )
 
 
+def show_split_stats(st, selected_file_dir):
+    stats = get_split_stats(selected_file_dir)
+    if stats is None or "text_tokens" not in stats:
+        return
+    st.caption(f"{stats['num_rows']} examples ({stats['num_bytes'] / 1024:.0f} KB), "
+               f"median text length ~{stats['text_tokens']['p50']} tokens, longest ~{stats['text_tokens']['p100']} tokens")
+    if "manager" in st.session_state:
+        max_total_tokens = st.session_state.manager.target_llm_client.parameters.get('max_total_tokens')
+        if max_total_tokens and stats['text_tokens']['p100'] > max_total_tokens:
+            st.warning(f"Some of the texts in this dataset are longer than the {max_total_tokens} tokens that the "
+                       f"target model accepts, and will be truncated.")
+
+
 def rander_component(st, default_value_for_droplist, split_name):
     upload_your_csv = "upload your csv"
     dataset_name_to_dir = st.session_state["dataset_name_to_dir"]
@@ -50,6 +67,7 @@ def rander_component(st, default_value_for_droplist, split_name):
                 st.session_state["existing_chat_path"] = ""
     if "selected_dataset" in st.session_state and st.session_state["selected_dataset"] != upload_your_csv:
         st.code(dataset_name_to_dir.get(selected_dataset)['desc'], language="markdown")
+        show_split_stats(st, dataset_name_to_dir.get(selected_dataset)[split_name])
 
 
 class StartType(Enum):
@@ -82,5 +100,8 @@ def create_choose_dataset_component_eval(st):
     if "selected_dataset" in st.session_state:
         add_download_button(st, 'eval')
     if "csv_file_eval" in st.session_state:
-        return read_user_csv_file(st.session_state["csv_file_eval"]).text.tolist()[:10]
+        if isinstance(st.session_state["csv_file_eval"], str):  # catalog file, read only the needed rows
+            return read_texts(st.session_state["csv_file_eval"], nrows=NUM_OF_EXAMPLES_TO_EVALUATE)
+        return read_user_csv_file(st.session_state["csv_file_eval"], max_rows=NUM_OF_EXAMPLES_TO_EVALUATE,
+                                  columns=["text"]).text.tolist()
 